@@ -5,11 +5,13 @@ import email
 import logging
 import os
 import re
+import functools
 import requests
 from kcidb.misc import LIGHT_ASSERTS
 # Silence flake8 "imported but unused" warning
 from kcidb import io, db, mq, orm, oo, monitor, tests, unittest, misc # noqa
 from kcidb import cache # noqa
+from kcidb import loader # noqa
 
 
 # Module's logger
@@ -35,21 +37,40 @@ class Client:
         r'(/.*)?$',
     )
 
-    def __init__(self, database=None, project_id=None, topic_name=None):
+    # It's OK, pylint: disable=too-many-arguments
+    # Or if you prefer, pylint: disable=too-many-positional-arguments
+    def __init__(self, database=None, project_id=None, topic_name=None,
+                 coalesce_obj=0, coalesce_size=0, coalesce_linger=0,
+                 compression=None):
         """
         Initialize a reporting client
 
         Args:
-            database:       The database specification string to use for
-                            accessing the report database.
-                            Can be None to have querying disabled.
-            project_id:     ID of the Google Cloud project hosting the message
-                            queue accepting submissions.
-                            Can be None to have submitting disabled.
-            topic_name:     Name of the message queue topic to publish
-                            submissions to. The message queue should be
-                            located within the specified Google Cloud project.
-                            Can be None, to have submitting disabled.
+            database:           The database specification string to use for
+                                accessing the report database.
+                                Can be None to have querying disabled.
+            project_id:         ID of the Google Cloud project hosting the
+                                message queue accepting submissions.
+                                Can be None to have submitting disabled.
+            topic_name:         Name of the message queue topic to publish
+                                submissions to. The message queue should be
+                                located within the specified Google Cloud
+                                project. Can be None, to have submitting
+                                disabled.
+            coalesce_obj:       Maximum number of objects to coalesce
+                                submitted reports into a single message, or
+                                zero for no limit.
+            coalesce_size:      Maximum size of a coalesced message, bytes,
+                                or zero for the message queue's limit.
+            coalesce_linger:    Maximum number of seconds to hold back
+                                submitted reports for coalescing, or zero to
+                                hold them until a limit is reached, or
+                                submit_iter() finishes. Reports are only
+                                coalesced if any of the coalesce_* arguments
+                                are non-zero.
+            compression:        The name of the format to compress submitted
+                                messages with (one of misc.COMPRESSIONS), or
+                                None to not compress.
 
         Raises:
             `kcidb.DatabaseNotInitialized` if the database is not
@@ -85,7 +106,11 @@ class Client:
             if not self.db_client.is_initialized():
                 raise DatabaseNotInitialized()
         self.mq_publisher = \
-            mq.IOPublisher(project_id, topic_name) \
+            mq.IOPublisher(project_id, topic_name,
+                           coalesce_obj=coalesce_obj,
+                           coalesce_size=coalesce_size,
+                           coalesce_linger=coalesce_linger,
+                           compression=compression) \
             if project_id and topic_name else None
 
     def validate_rest_uri(self, uri):
@@ -353,15 +378,27 @@ def submit_main():
         help='Name of the message queue topic to publish to',
         required=True
     )
+    mq.argparse_coalesce_add_args(parser)
+    parser.add_argument(
+        '--compress',
+        choices=misc.COMPRESSIONS,
+        help='Compress submitted message data with the specified format.',
+        default=None,
+        required=False
+    )
     args = parser.parse_args()
-    client = Client(project_id=args.project, topic_name=args.topic)
+    client = Client(project_id=args.project, topic_name=args.topic,
+                    coalesce_obj=args.coalesce_obj,
+                    coalesce_size=args.coalesce_size,
+                    coalesce_linger=args.coalesce_linger,
+                    compression=args.compress)
 
     def print_submission_id(submission_id):
         print(submission_id, file=sys.stdout)
         sys.stdout.flush()
 
     client.submit_iter(
-        (io.SCHEMA.validate(data)
+        (io.validate(io.SCHEMA, data)
          for data in
          misc.json_load_stream_fd(sys.stdin.fileno(), seq=args.seq_in)),
         done_cb=print_submission_id
@@ -387,9 +424,10 @@ def query_main():
         objects_per_report=args.objects_per_report,
         with_metadata=args.with_metadata
     )
-    misc.json_dump_stream(
-        query_iter, sys.stdout, indent=args.indent, seq=args.seq_out
-    )
+    with misc.json_output_open(args.compress) as output:
+        misc.json_dump_stream(
+            query_iter, output, indent=args.indent, seq=args.seq_out
+        )
 
 
 def schema_main():
@@ -399,8 +437,9 @@ def schema_main():
     parser = misc.OutputArgumentParser(description=description)
     misc.argparse_schema_add_args(parser, "output")
     args = parser.parse_args()
-    misc.json_dump(args.schema_version.json, sys.stdout, indent=args.indent,
-                   seq=args.seq_out)
+    with misc.json_output_open(args.compress) as output:
+        misc.json_dump(args.schema_version.json, output, indent=args.indent,
+                       seq=args.seq_out)
 
 
 def validate_main():
@@ -409,15 +448,33 @@ def validate_main():
     description = 'kcidb-validate - Validate I/O JSON data'
     parser = misc.InputOutputArgumentParser(description=description)
     misc.argparse_schema_add_args(parser, "validate against")
+    misc.argparse_jobs_add_args(parser)
     args = parser.parse_args()
-    misc.json_dump_stream(
-        (
-            args.schema_version.validate(data)
-            for data in misc.json_load_stream_fd(sys.stdin.fileno(),
-                                                 seq=args.seq_in)
-        ),
-        sys.stdout, indent=args.indent, seq=args.seq_out
-    )
+    with misc.json_output_open(args.compress) as output:
+        misc.json_dump_stream(
+            misc.parallel_map(
+                functools.partial(io.validate, args.schema_version),
+                misc.json_load_stream_fd(sys.stdin.fileno(),
+                                         seq=args.seq_in,
+                                         reject_nul=True),
+                jobs=args.jobs
+            ),
+            output, indent=args.indent, seq=args.seq_out
+        )
+
+
+def _upgrade(version, data):
+    """
+    Validate I/O data and upgrade it to a schema version.
+
+    Args:
+        version:    The I/O schema version to upgrade the data to.
+        data:       The I/O data to validate and upgrade.
+
+    Returns:
+        The upgraded data.
+    """
+    return version.upgrade(io.validate(io.SCHEMA, data), copy=False)
 
 
 def upgrade_main():
@@ -426,14 +483,73 @@ def upgrade_main():
     description = 'kcidb-upgrade - Upgrade I/O JSON data to current schema'
     parser = misc.InputOutputArgumentParser(description=description)
     misc.argparse_schema_add_args(parser, "upgrade")
+    misc.argparse_jobs_add_args(parser)
     args = parser.parse_args()
-    misc.json_dump_stream(
-        (
-            args.schema_version.upgrade(io.SCHEMA.validate(data), copy=False)
-            for data in
-            misc.json_load_stream_fd(sys.stdin.fileno(), seq=args.seq_in)
-        ),
-        sys.stdout, indent=args.indent, seq=args.seq_out
+    with misc.json_output_open(args.compress) as output:
+        misc.json_dump_stream(
+            misc.parallel_map(
+                functools.partial(_upgrade, args.schema_version),
+                misc.json_load_stream_fd(sys.stdin.fileno(),
+                                         seq=args.seq_in),
+                jobs=args.jobs
+            ),
+            output, indent=args.indent, seq=args.seq_out
+        )
+
+
+def _count(data, validate=True, lists=False):
+    """
+    Count the objects in I/O data, optionally validating it first.
+
+    Args:
+        data:       The I/O data to count objects in.
+        validate:   True if the data should be validated before counting.
+                    False if it should only be checked to have a supported
+                    version, without validating or copying it.
+        lists:      True if the objects should be counted per object list,
+                    false if only the total number should be returned.
+
+    Returns:
+        The number of objects in the data, if "lists" is false, or a
+        dictionary of object list names and numbers of objects in them, if
+        true. The dictionary has all object lists of the data's schema
+        version.
+
+    Raises:
+        `jsonschema.exceptions.ValidationError` if validation was requested
+        and the data is invalid, and Exception if the data's version is not
+        supported.
+    """
+    if validate:
+        io.validate(io.SCHEMA, data)
+    version = io.SCHEMA.get_exactly_compatible(data) \
+        if isinstance(data, dict) else None
+    if version is None:
+        raise Exception("Unsupported I/O data version")
+    counts = {
+        obj_list_name: len(data.get(obj_list_name, []))
+        for obj_list_name in version.graph if obj_list_name
+    }
+    return counts if lists else sum(counts.values())
+
+
+def _count_format(counts):
+    """
+    Format object counts for output.
+
+    Args:
+        counts: The number of objects, or a dictionary of object list names
+                and numbers of objects in them.
+
+    Returns:
+        The formatted string: the number of objects, followed by the
+        space-separated "<list>=<number>" counts, if given per-list.
+    """
+    if isinstance(counts, int):
+        return str(counts)
+    return " ".join(
+        [str(sum(counts.values()))] +
+        [f"{name}={count}" for name, count in counts.items()]
     )
 
 
@@ -442,22 +558,83 @@ def count_main():
     sys.excepthook = misc.log_and_print_excepthook
     description = 'kcidb-count - Count number of objects in I/O JSON data'
     parser = misc.InputArgumentParser(description=description)
+    misc.argparse_jobs_add_args(parser)
+    parser.add_argument(
+        '--no-validate',
+        help='Do not validate the data, only check its version is '
+             'supported, and count objects without copying the data.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--lists',
+        help='Output per-object-list counts after each total, '
+             'as space-separated "<list>=<number>" pairs.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--total',
+        help='Only output the counts summed across all the input data, '
+             'once the input ends.',
+        action='store_true'
+    )
     args = parser.parse_args()
 
-    for data in misc.json_load_stream_fd(sys.stdin.fileno(), seq=args.seq_in):
-        print(io.SCHEMA.count(io.SCHEMA.validate(data)), file=sys.stdout)
-        sys.stdout.flush()
+    totals = {} if args.lists else 0
+    for counts in misc.parallel_map(
+        functools.partial(_count, validate=not args.no_validate,
+                          lists=args.lists),
+        misc.json_load_stream_fd(sys.stdin.fileno(), seq=args.seq_in),
+        jobs=args.jobs
+    ):
+        if not args.total:
+            print(_count_format(counts), file=sys.stdout)
+            sys.stdout.flush()
+        elif args.lists:
+            for name, count in counts.items():
+                totals[name] = totals.get(name, 0) + count
+        else:
+            totals += counts
+    if args.total:
+        print(_count_format(totals), file=sys.stdout)
 
 
 def merge_main():
     """Execute the kcidb-merge command-line tool"""
     sys.excepthook = misc.log_and_print_excepthook
     description = 'kcidb-merge - Upgrade and merge I/O data sets'
-    parser = misc.InputOutputArgumentParser(description=description)
+    parser = misc.SplitOutputArgumentParser(description=description)
+    misc.argparse_input_add_args(parser)
+    parser.add_argument(
+        '--stream',
+        help='Merge the data sets one by one, deduplicating objects by ID '
+             'in a temporary on-disk database, and output the result in the '
+             'current schema version. Keeps memory use bounded with '
+             '--objects-per-report. Conflicting field values are taken '
+             'from the latest data set.',
+        action='store_true'
+    )
     args = parser.parse_args()
+    if args.objects_per_report and not args.stream:
+        parser.error("--objects-per-report requires --stream")
+
+    if args.stream:
+        with misc.json_output_open(args.compress) as output:
+            misc.json_dump_stream(
+                db.merge_iter(
+                    (
+                        io.validate(io.SCHEMA, data)
+                        for data in
+                        misc.json_load_stream_fd(sys.stdin.fileno(),
+                                                 seq=args.seq_in)
+                    ),
+                    objects_per_report=args.objects_per_report
+                ),
+                output, indent=args.indent, seq=args.seq_out
+            )
+        return
 
     sources = [
-        io.SCHEMA.validate(data)
+        io.validate(io.SCHEMA, data)
         for data in
         misc.json_load_stream_fd(sys.stdin.fileno(), seq=args.seq_in)
     ]
@@ -467,8 +644,9 @@ def merge_main():
     )
     merged_data = target_schema.merge(target_schema.new(), sources,
                                       copy_target=False, copy_sources=False)
-    misc.json_dump(merged_data, sys.stdout, indent=args.indent,
-                   seq=args.seq_out)
+    with misc.json_output_open(args.compress) as output:
+        misc.json_dump(merged_data, output, indent=args.indent,
+                       seq=args.seq_out)
 
 
 def notify_main():
@@ -508,16 +686,14 @@ def ingest_main():
     # For each JSON object in stdin
     for data in misc.json_load_stream_fd(sys.stdin.fileno(), seq=args.seq_in):
         # Validate and upgrade the data to the database's I/O schema
-        data = io_schema.upgrade(io_schema.validate(data), copy=False)
+        data = io_schema.upgrade(io.validate(io_schema, data), copy=False)
         # Load into the database
         db_client.load(data)
         # Possibly upgrade the data further, to be compatible with ORM
         data = io.SCHEMA.upgrade(data, copy=False)
         # Record patterns matching the loaded objects and all their parents
-        pattern_set = set()
-        for pattern in orm.query.Pattern.from_io(data):
-            # TODO Avoid formatting and parsing
-            pattern_set |= orm.query.Pattern.parse(repr(pattern) + "<*#")
+        pattern_set = orm.query.Pattern.from_io(data)
+        pattern_set |= orm.query.Pattern.expand(pattern_set, False)[1]
         LOGGER.debug("Notification patterns: %r", pattern_set)
         # Reset the OO cache
         oo_client.reset_cache()
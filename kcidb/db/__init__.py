@@ -1,15 +1,18 @@
 """Kernel CI report database"""
 
+import os
 import sys
 import logging
+import tempfile
 import argparse
 import datetime
+import functools
 import kcidb.io as io
 import kcidb.orm
 import kcidb.misc
 from kcidb.misc import LIGHT_ASSERTS
 from kcidb.db import abstract, schematic, mux, \
-    bigquery, postgresql, sqlite, json, null, misc  # noqa: F401
+    bigquery, postgresql, sqlite, json, null, misc, export  # noqa: F401
 
 # It's OK for now, pylint: disable=too-many-lines
 
@@ -56,6 +59,7 @@ DRIVER_TYPES = dict(
 
 class Client(kcidb.orm.Source):
     """Kernel CI report database client"""
+    # It's OK, pylint: disable=too-many-public-methods
 
     def __init__(self, database):
         """
@@ -78,6 +82,8 @@ class Client(kcidb.orm.Source):
         assert isinstance(database, str)
         self.database = database
         self.driver = None
+        # The planner canonicalizing OO query pattern sets
+        self.planner = kcidb.orm.query.Planner()
         self.reset()
 
     def is_initialized(self):
@@ -277,7 +283,7 @@ class Client(kcidb.orm.Source):
         assert (version, io_version) in self.get_schemas().items()
         return version, io_version
 
-    def upgrade(self, target_version=None):
+    def upgrade(self, target_version=None, online=False):
         """
         Upgrade the database to the latest (or specified) schema.
         The database must be initialized.
@@ -289,7 +295,11 @@ class Client(kcidb.orm.Source):
                             the current one), an I/O version object to pick
                             the earliest schema supporting it, or None to
                             upgrade to the latest schema.
+            online:         True if the upgrade should be done without
+                            keeping the database locked for long, where
+                            supported. False otherwise.
         """
+        assert isinstance(online, bool)
         assert self.is_initialized()
         schemas = self.get_schemas()
         if target_version is None:
@@ -308,7 +318,7 @@ class Client(kcidb.orm.Source):
         current_version = self.get_schema()[0]
         assert target_version >= current_version, \
             "Target schema is older than the current schema"
-        self.driver.upgrade(target_version)
+        self.driver.upgrade(target_version, online=online)
 
     def dump_iter(self, objects_per_report=0, with_metadata=True,
                   after=None, until=None):
@@ -354,10 +364,32 @@ class Client(kcidb.orm.Source):
                               and the database doesn't have row timestamps.
         """
         assert self.is_initialized()
-        id_fields = self.get_schema()[1].id_fields
         assert isinstance(objects_per_report, int)
         assert objects_per_report >= 0
         assert isinstance(with_metadata, bool)
+        after, until = self._expand_time_limits(after, until)
+        yield from self.driver.dump_iter(
+            objects_per_report=objects_per_report,
+            with_metadata=with_metadata,
+            after=after, until=until
+        )
+
+    def _expand_time_limits(self, after, until):
+        """
+        Expand "after" and "until" dump time limits into dictionaries of
+        names of I/O object types and timezone-aware datetime objects.
+
+        Args:
+            after:  A dictionary of names of I/O object types (list names)
+                    and timezone-aware datetime objects, a single datetime
+                    object, one for all object types, or None for no limit
+                    (equivalent to empty dictionary).
+            until:  Same as "after".
+
+        Returns:
+            The expanded "after" and "until" dictionaries.
+        """
+        id_fields = self.get_schema()[1].id_fields
         assert after is None or \
             isinstance(after, datetime.datetime) and after.tzinfo or \
             isinstance(after, dict) and all(
@@ -380,8 +412,62 @@ class Client(kcidb.orm.Source):
             until = {}
         elif not isinstance(until, dict):
             until = {n: until for n in id_fields}
-        yield from self.driver.dump_iter(
-            objects_per_report=objects_per_report,
+        return after, until
+
+    def dump_tables_iter(self, rows_per_batch=10000, with_metadata=True,
+                         after=None, until=None):
+        """
+        Dump all data from the database as batches of table rows, if the
+        database supports that.
+
+        Args:
+            rows_per_batch:     A positive integer maximum number of rows in
+                                each returned batch.
+            with_metadata:      True, if metadata columns should be dumped as
+                                well. False, if not.
+            after:              A dictionary of names of I/O object types
+                                (list names) and timezone-aware datetime
+                                objects specifying the latest time the
+                                corresponding objects should've arrived to be
+                                *excluded* from the dump. Any objects which
+                                arrived later will be *eligible* for dumping.
+                                Object types missing from this dictionary will
+                                not be limited. Can be a single datetime
+                                object, one for all object types, or None to
+                                not limit the dump by this parameter
+                                (equivalent to empty dictionary).
+            until:              A dictionary of names of I/O object types
+                                (list names) and timezone-aware datetime
+                                objects specifying the latest time the
+                                corresponding objects should've arrived to be
+                                *included* into the dump. Any objects which
+                                arrived later will be *ineligible* for
+                                dumping.
+                                Object types missing from this dictionary will
+                                not be limited. Can be a single datetime
+                                object, one for all object types, or None to
+                                not limit the dump by this parameter
+                                (equivalent to empty dictionary).
+
+        Returns:
+            An iterator returning tuples, each containing a table (I/O object
+            list) name, a dictionary of the table's column names and their
+            export types (see kcidb.db.sql.schema.Column.EXPORT_TYPE), and a
+            list of row tuples, containing JSON representations of the
+            column values in the same order, with None for NULL.
+
+        Raises:
+            NoTableDump     - The database doesn't support dumping tables.
+            NoTimestamps    - Either "after" or "until" are not None/empty,
+                              and the database doesn't have row timestamps.
+        """
+        assert self.is_initialized()
+        assert isinstance(rows_per_batch, int)
+        assert rows_per_batch > 0
+        assert isinstance(with_metadata, bool)
+        after, until = self._expand_time_limits(after, until)
+        yield from self.driver.dump_tables_iter(
+            rows_per_batch=rows_per_batch,
             with_metadata=with_metadata,
             after=after, until=until
         )
@@ -620,7 +706,11 @@ class Client(kcidb.orm.Source):
         assert all(isinstance(r, kcidb.orm.query.Pattern)
                    for r in pattern_set)
         LOGGER.debug("OO Query: %r", pattern_set)
-        return self.driver.oo_query(pattern_set)
+        planned_set = self.planner.plan(pattern_set)
+        if planned_set != pattern_set:
+            LOGGER.debug("Planned OO Query: %r", planned_set)
+        LOGGER.debug("OO Query planner stats: %r", self.planner.get_stats())
+        return self.driver.oo_query(planned_set)
 
     def load(self, data, with_metadata=False, copy=True):
         """
@@ -647,6 +737,42 @@ class Client(kcidb.orm.Source):
         self.driver.load(data, with_metadata=with_metadata, copy=copy)
 
 
+def merge_iter(sources, objects_per_report=0):
+    """
+    Merge I/O datasets, deduplicating objects with the same IDs, using a
+    temporary on-disk SQLite database to hold the merged objects, so only
+    one source dataset and one output report need to be kept in memory at
+    a time. If the datasets have different values for the same field of
+    the same object, the value from the latest dataset is taken.
+
+    Args:
+        sources:            An iterable returning valid I/O datasets to
+                            merge.
+        objects_per_report: An integer number of objects per each returned
+                            report data, or zero for no limit.
+
+    Returns:
+        An iterator returning the merged report data, adhering to the
+        current I/O schema version, each containing at most the specified
+        number of objects.
+    """
+    assert isinstance(objects_per_report, int)
+    assert objects_per_report >= 0
+    with tempfile.TemporaryDirectory(prefix="kcidb-merge-") as dir_path:
+        # Always prioritize the loaded data, so the latest value wins
+        client = Client("sqlite:^" +
+                        os.path.join(dir_path, "merge.sqlite3"))
+        client.init()
+        io_schema = client.get_schema()[1]
+        for source in sources:
+            assert LIGHT_ASSERTS or io.SCHEMA.is_valid(source)
+            client.load(io_schema.upgrade(source, copy=False),
+                        with_metadata=True, copy=False)
+        yield from client.dump_iter(objects_per_report=objects_per_report,
+                                    with_metadata=True)
+        client.cleanup()
+
+
 class DBHelpAction(argparse.Action):
     """Argparse action outputting database string help and exiting."""
     def __init__(self,
@@ -930,12 +1056,75 @@ def dump_main():
     client = Client(args.database)
     if not client.is_initialized():
         raise Exception(f"Database {args.database!r} is not initialized")
-    kcidb.misc.json_dump_stream(
-        client.dump_iter(objects_per_report=args.objects_per_report,
-                         with_metadata=not args.without_metadata,
-                         after=args.after, until=args.until),
-        sys.stdout, indent=args.indent, seq=args.seq_out
+    with kcidb.misc.json_output_open(args.compress) as output:
+        kcidb.misc.json_dump_stream(
+            client.dump_iter(objects_per_report=args.objects_per_report,
+                             with_metadata=not args.without_metadata,
+                             after=args.after, until=args.until),
+            output, indent=args.indent, seq=args.seq_out
+        )
+
+
+def export_main():
+    """Execute the kcidb-db-export command-line tool"""
+    sys.excepthook = kcidb.misc.log_and_print_excepthook
+    description = \
+        'kcidb-db-export - Export Kernel CI report database tables ' \
+        'into columnar files'
+    parser = ArgumentParser(description=description)
+    parser.add_argument(
+        'directory',
+        metavar='DIRECTORY',
+        help='The directory to write the table files into. '
+        'Will be created, if it doesn\'t exist.'
+    )
+    parser.add_argument(
+        '-f', '--format',
+        choices=export.FORMATS,
+        help='The format to export the tables in. Default is "parquet".',
+        default="parquet"
     )
+    parser.add_argument(
+        '-r', '--rows-per-batch',
+        metavar="NUMBER",
+        type=kcidb.misc.non_negative_int,
+        help='Write rows in batches (Parquet row groups, or Arrow record '
+        'batches) of maximum NUMBER rows. Default is 100000.',
+        default=100000
+    )
+    parser.add_argument(
+        '--without-metadata',
+        help='Do not export metadata columns',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--after',
+        metavar='AFTER',
+        type=kcidb.misc.iso_timestamp,
+        help="An ISO-8601 timestamp specifying the latest time the data to "
+        "be *excluded* from the export should've arrived."
+    )
+    parser.add_argument(
+        '--until',
+        metavar='UNTIL',
+        type=kcidb.misc.iso_timestamp,
+        help="An ISO-8601 timestamp specifying the latest time the data to "
+        "be *included* into the export should've arrived."
+    )
+    args = parser.parse_args()
+    if args.rows_per_batch == 0:
+        parser.error("--rows-per-batch must be positive")
+    client = Client(args.database)
+    if not client.is_initialized():
+        raise Exception(f"Database {args.database!r} is not initialized")
+    os.makedirs(args.directory, exist_ok=True)
+    for path in export.write_tables(
+        client.dump_tables_iter(rows_per_batch=args.rows_per_batch,
+                                with_metadata=not args.without_metadata,
+                                after=args.after, until=args.until),
+        args.directory, args.format
+    ):
+        print(path, file=sys.stdout)
 
 
 def query_main():
@@ -959,9 +1148,25 @@ def query_main():
         objects_per_report=args.objects_per_report,
         with_metadata=args.with_metadata
     )
-    kcidb.misc.json_dump_stream(
-        query_iter, sys.stdout, indent=args.indent, seq=args.seq_out
-    )
+    with kcidb.misc.json_output_open(args.compress) as output:
+        kcidb.misc.json_dump_stream(
+            query_iter, output, indent=args.indent, seq=args.seq_out
+        )
+
+
+def _upgrade(version, data):
+    """
+    Validate I/O data against a schema version and upgrade it to that version.
+
+    Args:
+        version:    The I/O schema version to validate and upgrade the data
+                    to.
+        data:       The I/O data to validate and upgrade.
+
+    Returns:
+        The upgraded data.
+    """
+    return version.upgrade(io.validate(version, data), copy=False)
 
 
 def load_main():
@@ -975,14 +1180,20 @@ def load_main():
         help='Load metadata fields as well',
         action='store_true'
     )
+    kcidb.misc.argparse_jobs_add_args(parser)
     args = parser.parse_args()
     client = Client(args.database)
     if not client.is_initialized():
         raise Exception(f"Database {args.database!r} is not initialized")
     io_schema = client.get_schema()[1]
-    for data in kcidb.misc.json_load_stream_fd(sys.stdin.fileno(),
-                                               seq=args.seq_in):
-        data = io_schema.upgrade(io_schema.validate(data), copy=False)
+    # Validate and upgrade in parallel, but load serially
+    for data in kcidb.misc.parallel_map(
+        functools.partial(_upgrade, io_schema),
+        kcidb.misc.json_load_stream_fd(sys.stdin.fileno(),
+                                       seq=args.seq_in,
+                                       reject_nul=True),
+        jobs=args.jobs
+    ):
         client.load(data, with_metadata=args.with_metadata, copy=False)
 
 
@@ -1057,6 +1268,14 @@ def upgrade_main():
              "backwards-compatible.",
         type=kcidb.misc.version
     )
+    parser.add_argument(
+        '--online',
+        help="Upgrade without keeping the database locked for long, "
+             "where supported: add columns as nullable, backfill them in "
+             "committed batches, build indexes concurrently, and only "
+             "switch the version in a short final transaction.",
+        action='store_true'
+    )
     args = parser.parse_args()
     client = Client(args.database)
     if not client.is_initialized():
@@ -1074,7 +1293,7 @@ def upgrade_main():
                 f"is older than version {curr_schema[0]}.{curr_schema[1]} "
                 f"currently used by database {args.database!r}"
             )
-    client.upgrade(args.schema)
+    client.upgrade(args.schema, online=args.online)
 
 
 def cleanup_main():
@@ -4,6 +4,7 @@ from abc import ABC, abstractmethod
 import datetime
 import kcidb.orm as orm
 from kcidb.misc import LIGHT_ASSERTS
+from kcidb.db.misc import NoTableDump
 
 
 class Driver(ABC):
@@ -170,7 +171,7 @@ class Driver(ABC):
         assert self.is_initialized()
 
     @abstractmethod
-    def upgrade(self, target_version):
+    def upgrade(self, target_version, online=False):
         """
         Upgrade the database to the specified schema.
         The database must be initialized.
@@ -180,7 +181,11 @@ class Driver(ABC):
                             the schema to upgrade to (must be one of the
                             database's available schema versions, newer than
                             the current one).
+            online:         True if the upgrade should be done without
+                            keeping the database locked for long, where
+                            supported. False otherwise.
         """
+        assert isinstance(online, bool)
         assert self.is_initialized()
         assert target_version in self.get_schemas(), \
             "Target schema version is not available for the driver"
@@ -241,6 +246,63 @@ class Driver(ABC):
             for obj_list_name, ts in until.items()
         )
 
+    def dump_tables_iter(self, rows_per_batch, with_metadata, after, until):
+        """
+        Dump all data from the database as batches of table rows, if the
+        database supports that. The database must be initialized.
+
+        Args:
+            rows_per_batch:     A positive integer maximum number of rows in
+                                each returned batch.
+            with_metadata:      True, if metadata columns should be dumped as
+                                well. False, if not.
+            after:              A dictionary of names of I/O object types
+                                (list names) and timezone-aware datetime
+                                objects specifying the latest time the
+                                corresponding objects should've arrived to be
+                                *excluded* from the dump. Any objects which
+                                arrived later will be *eligible* for dumping.
+                                Object types missing from this dictionary will
+                                not be limited.
+            until:              A dictionary of names of I/O object types
+                                (list names) and timezone-aware datetime
+                                objects specifying the latest time the
+                                corresponding objects should've arrived to be
+                                *included* into the dump. Any objects which
+                                arrived later will be *ineligible* for
+                                dumping. Object types missing from this
+                                dictionary will not be limited.
+
+        Returns:
+            An iterator returning tuples, each containing a table (I/O object
+            list) name, a dictionary of the table's column names and their
+            export types (see kcidb.db.sql.schema.Column.EXPORT_TYPE), and a
+            list of row tuples, containing JSON representations of the
+            column values in the same order, with None for NULL.
+            Each table's column dictionary is the same in all its batches.
+
+        Raises:
+            NoTableDump     - The database doesn't support dumping tables.
+            NoTimestamps    - Either "after" or "until" are not empty, and
+                              the database doesn't have row timestamps.
+        """
+        assert self.is_initialized()
+        io_schema = self.get_schema()[1]
+        assert isinstance(rows_per_batch, int)
+        assert rows_per_batch > 0
+        assert isinstance(with_metadata, bool)
+        assert isinstance(after, dict) and all(
+            obj_list_name in io_schema.id_fields and
+            isinstance(ts, datetime.datetime) and ts.tzinfo
+            for obj_list_name, ts in after.items()
+        )
+        assert isinstance(until, dict) and all(
+            obj_list_name in io_schema.id_fields and
+            isinstance(ts, datetime.datetime) and ts.tzinfo
+            for obj_list_name, ts in until.items()
+        )
+        raise NoTableDump("The database doesn't support dumping tables")
+
     # No, it's not, pylint: disable=too-many-return-statements
     def query_ids_are_valid(self, ids):
         """
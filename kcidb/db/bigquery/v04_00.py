@@ -5,6 +5,8 @@ import json
 import logging
 import textwrap
 import datetime
+import tempfile
+import traceback
 from collections import namedtuple
 from functools import reduce
 from google.cloud import bigquery
@@ -17,14 +19,20 @@ from kcidb.misc import LIGHT_ASSERTS
 from kcidb.db.schematic import \
     Schema as AbstractSchema, \
     Connection as AbstractConnection
-from kcidb.db.misc import NotFound, NoTimestamps
-from kcidb.db.bigquery.schema import validate_json_obj_list
+from kcidb.db.misc import NotFound, NoTimestamps, OverBudget
+from kcidb.db.bigquery.schema import validate_json_obj
 
 # We'll manage for now, pylint: disable=too-many-lines
 
 # Module's logger
 LOGGER = logging.getLogger(__name__)
 
+# Statistics of a completed query job, passed to query hooks
+QueryStats = namedtuple(
+    "QueryStats",
+    "caller query_string bytes_processed slot_millis cache_hit"
+)
+
 
 class Connection(AbstractConnection):
     """
@@ -33,8 +41,8 @@ class Connection(AbstractConnection):
 
     # Documentation of the connection parameters
     _PARAMS_DOC = textwrap.dedent("""\
-        Parameters: <PROJECT_ID>.<DATASET>
-                or: <DATASET>
+        Parameters: <PROJECT_ID>.<DATASET>[:<MAX_BYTES>[:<ACTION>]]
+                or: <DATASET>[:<MAX_BYTES>[:<ACTION>]]
 
         <PROJECT_ID>    ID of the Google Cloud project hosting the dataset.
                         If not specified, the project from the credentials
@@ -44,6 +52,14 @@ class Connection(AbstractConnection):
         <DATASET>       The name of the dataset containing the report data,
                         located within the specified (or inferred) Google Cloud
                         project.
+
+        <MAX_BYTES>     Maximum number of bytes a single query is allowed to
+                        process. If specified, every query is dry-run first
+                        to estimate the bytes it would process.
+
+        <ACTION>        What to do with queries estimated to exceed
+                        <MAX_BYTES>: "refuse" to run them (the default), or
+                        "warn" and run them anyway.
     """)
 
     def __init__(self, params):
@@ -63,6 +79,26 @@ class Connection(AbstractConnection):
             raise Exception("Database parameters must be specified\n\n" +
                             self._PARAMS_DOC)
         super().__init__(params)
+        params, *budget = params.split(":")
+        # Maximum number of bytes a query can process, or None if unlimited
+        self.max_bytes = None
+        # True if over-budget queries should be refused, false if warned about
+        self.refuse_over_budget = True
+        try:
+            if budget:
+                self.max_bytes = int(budget.pop(0))
+                if self.max_bytes < 0:
+                    raise ValueError
+            if budget:
+                action = budget.pop(0)
+                if action not in ("refuse", "warn") or budget:
+                    raise ValueError
+                self.refuse_over_budget = action == "refuse"
+        except ValueError:
+            raise Exception("Invalid query budget specified\n\n" +
+                            self._PARAMS_DOC) from None
+        # A list of functions to call with QueryStats of each completed query
+        self.query_hooks = []
         try:
             dot_pos = params.index(".")
             project_id = params[:dot_pos]
@@ -85,6 +121,11 @@ class Connection(AbstractConnection):
         Creates a Query job configured for a given query string and
         optional parameters. BigQuery can run the job to query the database.
 
+        If the connection has a maximum-bytes budget, the query is dry-run
+        first, and is refused (or warned about) if it would exceed it. If
+        the connection has query hooks, they are called with the statistics
+        of the job, once it completes.
+
         Args:
             query_string:       The SQL query string.
             query_parameters:   A list containing the optional query parameters
@@ -95,6 +136,10 @@ class Connection(AbstractConnection):
 
         Returns:
             The Query job (google.cloud.bigquery.job.QueryJob)
+
+        Raises:
+            OverBudget  - the query would exceed the connection's budget,
+                          and over-budget queries are refused.
         """
         if query_parameters is None:
             query_parameters = []
@@ -102,11 +147,77 @@ class Connection(AbstractConnection):
         LOGGER.debug("Query params: %s", query_parameters)
         if not use_query_cache:
             LOGGER.debug("Query cache: DISABLED")
+        if self.max_bytes is not None:
+            self._query_check_budget(query_string, query_parameters,
+                                     use_query_cache)
         job_config = bigquery.job.QueryJobConfig(
                 use_query_cache=use_query_cache,
                 query_parameters=query_parameters,
                 default_dataset=self.dataset_ref)
-        return self.client.query(query_string, job_config=job_config)
+        job = self.client.query(query_string, job_config=job_config)
+        if self.query_hooks:
+            # Attribute the query to the function calling us
+            caller = traceback.extract_stack(limit=2)[0]
+            caller = f"{caller.filename}:{caller.lineno}:{caller.name}"
+            job.add_done_callback(
+                lambda job: self._query_report_stats(caller, query_string,
+                                                     job)
+            )
+        return job
+
+    def _query_check_budget(self, query_string, query_parameters,
+                            use_query_cache):
+        """
+        Dry-run a query to estimate the number of bytes it would process,
+        and check it against the connection's budget.
+
+        Args:
+            query_string:       The SQL query string.
+            query_parameters:   A list containing the query parameters
+                                (google.cloud.bigquery.ArrayQueryParameter).
+            use_query_cache:    True if BigQuery query cache should be used,
+                                False otherwise.
+
+        Raises:
+            OverBudget  - the query would exceed the connection's budget,
+                          and over-budget queries are refused.
+        """
+        assert self.max_bytes is not None
+        job_config = bigquery.job.QueryJobConfig(
+                dry_run=True,
+                use_query_cache=use_query_cache,
+                query_parameters=query_parameters,
+                default_dataset=self.dataset_ref)
+        bytes_processed = self.client.query(
+            query_string, job_config=job_config
+        ).total_bytes_processed or 0
+        LOGGER.debug("Query bytes estimate: %s", bytes_processed)
+        if bytes_processed > self.max_bytes:
+            if self.refuse_over_budget:
+                raise OverBudget(bytes_processed, self.max_bytes)
+            LOGGER.warning("%s", OverBudget(bytes_processed, self.max_bytes))
+
+    def _query_report_stats(self, caller, query_string, job):
+        """
+        Report statistics of a completed query job to the query hooks.
+
+        Args:
+            caller:         A string describing the code location which
+                            created the job.
+            query_string:   The SQL query string of the job.
+            job:            The completed query job
+                            (google.cloud.bigquery.job.QueryJob).
+        """
+        stats = QueryStats(
+            caller=caller,
+            query_string=query_string,
+            bytes_processed=job.total_bytes_processed,
+            slot_millis=job.slot_millis,
+            cache_hit=job.cache_hit,
+        )
+        LOGGER.debug("Query stats: %r", stats)
+        for hook in self.query_hooks:
+            hook(stats)
 
     def set_schema_version(self, version):
         """
@@ -617,17 +728,22 @@ class Schema(AbstractSchema):
     )
 
     @classmethod
-    def _format_view_query(cls, conn, name):
+    def _format_view_query(cls, conn, name, condition=None):
         """
         Format the view query for a table.
 
         Args:
-            conn:   The connection to the dataset to format the query for.
-            name:   Name of the table to format the view query for.
+            conn:       The connection to the dataset to format the query
+                        for.
+            name:       Name of the table to format the view query for.
+            condition:  An SQL boolean expression the raw table rows should
+                        satisfy to be deduplicated, or None to take all the
+                        rows.
         """
         assert isinstance(conn, cls.Connection)
         assert isinstance(name, str)
         assert name in cls.TABLE_MAP
+        assert condition is None or isinstance(condition, str)
         schema = cls.TABLE_MAP[name]
         keys = cls.KEYS_MAP[name]
         aggs = cls.AGGS_MAP.get(name, {})
@@ -639,10 +755,28 @@ class Schema(AbstractSchema):
                 else f"{aggs.get(n, 'ANY_VALUE')}(`{n}`) AS `{n}`"
                 for n in (f.name for f in schema)
             ) +
-            f" FROM `{table_ref}` GROUP BY " +
-            ", ".join(keys)
+            f" FROM `{table_ref}`" +
+            ("" if condition is None else f" WHERE {condition}") +
+            " GROUP BY " + ", ".join(keys)
         )
 
+    @classmethod
+    def _new_table(cls, table_ref, name):
+        """
+        Create a (not yet existing) raw table object for a table.
+
+        Args:
+            table_ref:  The reference to the raw table to create the object
+                        for.
+            name:       Name of the table to take the schema from.
+
+        Returns:
+            The created table object (google.cloud.bigquery.table.Table).
+        """
+        assert isinstance(name, str)
+        assert name in cls.TABLE_MAP
+        return bigquery.table.Table(table_ref, schema=cls.TABLE_MAP[name])
+
     @classmethod
     def _create_table(cls, conn, name):
         """
@@ -657,8 +791,7 @@ class Schema(AbstractSchema):
         assert name in cls.TABLE_MAP
         # Create raw table with duplicate records
         table_ref = conn.dataset_ref.table("_" + name)
-        table = bigquery.table.Table(table_ref, schema=cls.TABLE_MAP[name])
-        conn.client.create_table(table)
+        conn.client.create_table(cls._new_table(table_ref, name))
         # Create a view deduplicating the table records
         view_ref = conn.dataset_ref.table(name)
         view = bigquery.table.Table(view_ref)
@@ -735,6 +868,56 @@ class Schema(AbstractSchema):
                     node[key] = cls._unpack_node(value)
         return node
 
+    def _format_dump_query(self, obj_list_name, with_metadata,
+                           after, until):
+        """
+        Format the query dumping objects of a type, along with its
+        parameters.
+
+        Args:
+            obj_list_name:  The name of the object list to dump.
+            with_metadata:  True, if metadata fields should be dumped as
+                            well. False, if not.
+            after:          A timezone-aware datetime object specifying the
+                            latest time the objects should've arrived to be
+                            *excluded* from the dump, or None for no limit.
+            until:          A timezone-aware datetime object specifying the
+                            latest time the objects should've arrived to be
+                            *included* into the dump, or None for no limit.
+
+        Returns:
+            The query string, and the list of its parameters.
+        """
+        assert obj_list_name in self.TABLE_MAP
+        assert isinstance(with_metadata, bool)
+        table_schema = self.TABLE_MAP[obj_list_name]
+        ts_field = next(
+            (f for f in table_schema if f.name == "_timestamp"),
+            None
+        )
+        assert ts_field or not (after or until)
+        query_string = (
+            "SELECT " +
+            ", ".join(
+                f"`{f.name}`" for f in table_schema
+                if with_metadata or f.name[0] != '_'
+            ) +
+            f" FROM `{obj_list_name}`" +
+            ((
+                " WHERE " + " AND ".join(
+                    f"{ts_field.name} {op} ?"
+                    for op, v in (
+                        (">", after), ("<=", until)
+                    ) if v
+                )
+            ) if (after or until) else "")
+        )
+        query_parameters = [
+            bigquery.ScalarQueryParameter(None, ts_field.field_type, v)
+            for v in (after, until) if v
+        ]
+        return query_string, query_parameters
+
     def dump_iter(self, objects_per_report, with_metadata, after, until):
         """
         Dump all data from the database in object number-limited chunks.
@@ -789,26 +972,9 @@ class Schema(AbstractSchema):
                     f"Table {obj_list_name!r} has no {ts_field.name!r} column"
                 )
 
-            query_string = (
-                "SELECT " +
-                ", ".join(
-                    f"`{f.name}`" for f in table_schema
-                    if with_metadata or f.name[0] != '_'
-                ) +
-                f" FROM `{obj_list_name}`" +
-                ((
-                    " WHERE " + " AND ".join(
-                        f"{ts_field.name} {op} ?"
-                        for op, v in (
-                            (">", table_after), ("<=", table_until)
-                        ) if v
-                    )
-                ) if (table_after or table_until) else "")
+            query_string, query_parameters = self._format_dump_query(
+                obj_list_name, with_metadata, table_after, table_until
             )
-            query_parameters = [
-                bigquery.ScalarQueryParameter(None, ts_field.field_type, v)
-                for v in (table_after, table_until) if v
-            ]
             query_job = self.conn.query_create(query_string, query_parameters,
                                                use_query_cache=False)
             obj_list = None
@@ -1180,10 +1346,39 @@ class Schema(AbstractSchema):
                     node[key] = cls._pack_node(value, with_metadata, copy)
         return node
 
+    def _write_table_file(self, table_file, obj_list_name, obj_list,
+                          with_metadata, copy):
+        """
+        Pack objects of a table and write them into a file as
+        newline-delimited JSON, one object at a time.
+
+        Args:
+            table_file:     The binary file to write the packed objects to.
+            obj_list_name:  The name of the object list (table) the objects
+                            belong to.
+            obj_list:       The list of objects to pack and write.
+                            Will be modified, if "copy" is False.
+            with_metadata:  True, if meta fields (with leading underscore "_")
+                            should be preserved. False, if omitted.
+            copy:           True, if each object should be copied before
+                            packing. False, if it should be packed in-place.
+        """
+        table_schema = self.TABLE_MAP[obj_list_name]
+        for obj in obj_list:
+            obj = self._pack_node(obj, with_metadata, copy)
+            if not LIGHT_ASSERTS:
+                validate_json_obj(table_schema, obj)
+            table_file.write(json.dumps(obj).encode())
+            table_file.write(b"\n")
+
     def load(self, data, with_metadata, copy):
         """
         Load data into the database.
 
+        The packed rows of each table are streamed into a temporary file as
+        newline-delimited JSON, and load jobs for all the tables are submitted
+        before waiting for any of them to complete.
+
         Args:
             data:           The JSON data to load into the database. Must
                             adhere to the I/O version of the database schema.
@@ -1201,28 +1396,43 @@ class Schema(AbstractSchema):
         assert isinstance(with_metadata, bool)
         assert isinstance(copy, bool)
 
-        # Load the data
+        # Submit a load job for every table we have data for
+        jobs = []
         for obj_list_name, table_schema in self.TABLE_MAP.items():
-            if obj_list_name in data:
-                obj_list = self._pack_node(data[obj_list_name],
-                                           with_metadata, copy)
-                if not LIGHT_ASSERTS:
-                    validate_json_obj_list(table_schema, obj_list)
-                job_config = bigquery.job.LoadJobConfig(
-                    autodetect=False,
-                    schema=[f for f in table_schema
-                            if with_metadata or not f.name.startswith("_")]
-                )
-                job = self.conn.client.load_table_from_json(
-                    obj_list,
+            if not data.get(obj_list_name):
+                continue
+            job_config = bigquery.job.LoadJobConfig(
+                autodetect=False,
+                source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+                schema=[f for f in table_schema
+                        if with_metadata or not f.name.startswith("_")]
+            )
+            with tempfile.TemporaryFile(prefix="kcidb_bigquery_",
+                                        suffix=".ndjson") as table_file:
+                self._write_table_file(table_file, obj_list_name,
+                                       data[obj_list_name],
+                                       with_metadata, copy)
+                table_file.seek(0)
+                jobs.append(self.conn.client.load_table_from_file(
+                    table_file,
                     self.conn.dataset_ref.table("_" + obj_list_name),
-                    job_config=job_config)
-                try:
-                    job.result()
-                except GoogleBadRequest as exc:
-                    raise Exception("".join([
-                        f"ERROR: {error['message']}\n" for error in job.errors
-                    ])) from exc
+                    rewind=True,
+                    job_config=job_config
+                ))
+
+        # Wait for all the jobs to complete
+        errors = []
+        first_exc = None
+        for job in jobs:
+            try:
+                job.result()
+            except GoogleBadRequest as exc:
+                first_exc = first_exc or exc
+                errors += job.errors or []
+        if first_exc:
+            raise Exception("".join([
+                f"ERROR: {error['message']}\n" for error in errors
+            ])) from first_exc
 
     def get_first_modified(self):
         """
@@ -0,0 +1,168 @@
+"""Kernel CI report database - BigQuery schema v5.4"""
+
+import logging
+import textwrap
+from google.cloud import bigquery
+from google.api_core.exceptions import NotFound as GoogleNotFound
+import kcidb.io as io
+from .v05_03 import Schema as PreviousSchema
+
+# Module's logger
+LOGGER = logging.getLogger(__name__)
+
+
+# Don't be so narrow-minded, pylint: disable=too-many-ancestors
+class Schema(PreviousSchema):
+    """BigQuery database schema v5.4"""
+
+    # The schema's version.
+    version = (5, 4)
+    # The I/O schema the database schema supports
+    io = io.schema.V5_3
+
+    # A map of table names to the names of the fields to cluster their raw
+    # tables by, in order of importance (at most four). Parent IDs come
+    # first, as those are used to look up children in object-oriented
+    # queries, ahead of the object IDs.
+    CLUSTERING_MAP = dict(
+        checkouts=["id"],
+        builds=["checkout_id", "id"],
+        tests=["build_id", "id"],
+        issues=["id", "version"],
+        incidents=["issue_id", "build_id", "test_id", "id"],
+    )
+
+    @classmethod
+    def _new_table(cls, table_ref, name):
+        """
+        Create a (not yet existing) raw table object for a table,
+        partitioned by day of the "_timestamp" field, and clustered by
+        the table's fields listed in CLUSTERING_MAP.
+
+        Args:
+            table_ref:  The reference to the raw table to create the object
+                        for.
+            name:       Name of the table to take the schema from.
+
+        Returns:
+            The created table object (google.cloud.bigquery.table.Table).
+        """
+        table = super()._new_table(table_ref, name)
+        table.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY,
+            field="_timestamp",
+        )
+        table.clustering_fields = cls.CLUSTERING_MAP[name]
+        return table
+
+    def _format_dump_query(self, obj_list_name, with_metadata,
+                           after, until):
+        """
+        Format the query dumping objects of a type, along with its
+        parameters. Time-limited queries only deduplicate the objects
+        having raw rows within the limits, so the raw table partitions
+        outside them are skipped when looking those up, but still dump all
+        the data of each object.
+
+        Args:
+            obj_list_name:  The name of the object list to dump.
+            with_metadata:  True, if metadata fields should be dumped as
+                            well. False, if not.
+            after:          A timezone-aware datetime object specifying the
+                            latest time the objects should've arrived to be
+                            *excluded* from the dump, or None for no limit.
+            until:          A timezone-aware datetime object specifying the
+                            latest time the objects should've arrived to be
+                            *included* into the dump, or None for no limit.
+
+        Returns:
+            The query string, and the list of its parameters.
+        """
+        query_string, query_parameters = super()._format_dump_query(
+            obj_list_name, with_metadata, after, until
+        )
+        if not (after or until):
+            return query_string, query_parameters
+        limits = " AND ".join(
+            f"`_timestamp` {op} ?"
+            for op, v in ((">", after), ("<=", until)) if v
+        )
+        keys = "(" + ", ".join(
+            f"`{key}`" for key in self.KEYS_MAP[obj_list_name]
+        ) + ")"
+        table_ref = self.conn.dataset_ref.table("_" + obj_list_name)
+        view_query = self._format_view_query(
+            self.conn, obj_list_name,
+            f"{keys} IN (SELECT {keys} FROM `{table_ref}` WHERE {limits})"
+        )
+        query_string = (
+            "SELECT " +
+            ", ".join(
+                f"`{f.name}`" for f in self.TABLE_MAP[obj_list_name]
+                if with_metadata or f.name[0] != '_'
+            ) +
+            " FROM (\n" + textwrap.indent(view_query, " " * 4) + "\n)" +
+            f" WHERE {limits}"
+        )
+        # The limits are used both by the raw row lookup, and the
+        # deduplicated object filter
+        return query_string, query_parameters * 2
+
+    @classmethod
+    def _inherit(cls, conn):
+        """
+        Inerit the database data from the previous schema version (if any).
+        Recreates every raw table, copying its data over. All writers to
+        the database must be stopped for the duration, as the data loaded
+        during the copy would be lost. If interrupted, the inheritance can
+        be restarted, and will continue from the table it stopped at.
+
+        Args:
+            conn:   Connection to the database to inherit. The database must
+                    comply with the previous version of the schema.
+
+        Raises:
+            Exception   - The data was written to a raw table while it was
+                          being copied.
+        """
+        assert isinstance(conn, cls.Connection)
+        # Partitioning cannot be added to an existing table,
+        # so recreate every raw table, copying the data over
+        for table_name, table_schema in cls.TABLE_MAP.items():
+            table_ref = conn.dataset_ref.table(f"_{table_name}")
+            new_table_ref = conn.dataset_ref.table(f"_{table_name}_new")
+            try:
+                table = conn.client.get_table(table_ref)
+            except GoogleNotFound:
+                # Interrupted after removing the old table, finish
+                table = None
+            if table is not None:
+                if table.time_partitioning is not None:
+                    LOGGER.info("Table %r is already partitioned",
+                                table_name)
+                    continue
+                LOGGER.info("Partitioning and clustering table %r",
+                            table_name)
+                columns = ", ".join(f"`{f.name}`" for f in table_schema)
+                # Drop the partial copy left by an interrupted attempt
+                conn.client.delete_table(new_table_ref, not_found_ok=True)
+                conn.client.create_table(
+                    cls._new_table(new_table_ref, table_name)
+                )
+                conn.query_create(f"""
+                    INSERT INTO `_{table_name}_new` ({columns})
+                    SELECT {columns} FROM `_{table_name}`
+                """).result()
+                # Make sure nothing was written while we were copying
+                if conn.client.get_table(table_ref).num_rows != \
+                        conn.client.get_table(new_table_ref).num_rows:
+                    raise Exception(
+                        f"Table {table_name!r} was written to while being "
+                        f"copied, stop all writers and retry"
+                    )
+                conn.client.delete_table(table_ref)
+            # The views refer to raw tables by name, and so will pick up
+            # the new tables once they're renamed
+            conn.query_create(f"""
+                ALTER TABLE `_{table_name}_new` RENAME TO `_{table_name}`
+            """).result()
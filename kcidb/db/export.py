@@ -0,0 +1,88 @@
+"""Kernel CI report database - columnar table export"""
+
+import os
+import json
+import dateutil.parser
+
+# A tuple of names of supported columnar export formats
+FORMATS = ("parquet", "arrow")
+
+
+def write_tables(batch_iter, directory, export_format="parquet"):
+    """
+    Write batches of table rows into columnar files, one per table, named
+    after the table, with the format-specific extension. Each batch is
+    written as a separate Parquet row group, or Arrow record batch.
+    Requires the "pyarrow" package.
+
+    Args:
+        batch_iter:     An iterator returning table row batches, as returned
+                        by Client.dump_tables_iter().
+        directory:      The path to the directory to write the files into.
+        export_format:  The name of the format to write (one of FORMATS).
+
+    Returns:
+        A list of paths to the written files.
+    """
+    # An optional dependency, pylint: disable=import-outside-toplevel
+    import pyarrow
+    import pyarrow.parquet
+    import pyarrow.ipc
+    assert isinstance(directory, str)
+    assert export_format in FORMATS
+
+    # A map of export types and functions converting them to Arrow arrays
+    converters = dict(
+        bool=lambda v: pyarrow.array(v, pyarrow.bool_()),
+        int=lambda v: pyarrow.array(v, pyarrow.int64()),
+        float=lambda v: pyarrow.array(v, pyarrow.float64()),
+        string=lambda v: pyarrow.array(v, pyarrow.string()),
+        string_list=lambda v: pyarrow.array(
+            v, pyarrow.list_(pyarrow.string())
+        ),
+        timestamp=lambda v: pyarrow.array(
+            [x and dateutil.parser.isoparse(x) for x in v],
+            pyarrow.timestamp("us", tz="UTC")
+        ),
+        json=lambda v: pyarrow.array(
+            [None if x is None else json.dumps(x) for x in v],
+            pyarrow.string()
+        ),
+    )
+
+    paths = []
+    writer = None
+    table_name = None
+    try:
+        for name, columns, rows in batch_iter:
+            if name != table_name:
+                if writer:
+                    writer.close()
+                table_name = name
+                path = os.path.join(directory, f"{name}.{export_format}")
+                paths.append(path)
+                schema = pyarrow.schema([
+                    (column_name, converters[export_type]([]).type)
+                    for column_name, export_type in columns.items()
+                ])
+                if export_format == "parquet":
+                    writer = pyarrow.parquet.ParquetWriter(path, schema)
+                else:
+                    writer = pyarrow.ipc.new_file(path, schema)
+            values = list(zip(*rows)) or [()] * len(columns)
+            batch = pyarrow.record_batch(
+                [
+                    converters[export_type](list(column_values))
+                    for export_type, column_values
+                    in zip(columns.values(), values)
+                ],
+                schema=schema
+            )
+            if export_format == "parquet":
+                writer.write_batch(batch)
+            else:
+                writer.write(batch)
+    finally:
+        if writer:
+            writer.close()
+    return paths
@@ -2,6 +2,7 @@
 
 import sys
 import textwrap
+import kcidb.io
 import kcidb.misc
 from kcidb.db.sqlite import Driver as SQLiteDriver
 
@@ -44,5 +45,6 @@ class Driver(SQLiteDriver):
             self.init(list(self.get_schemas())[-1])
             io_schema = self.get_schema()[1]
             for data in kcidb.misc.json_load_stream_fd(json_file.fileno()):
-                data = io_schema.upgrade(io_schema.validate(data), copy=False)
+                data = io_schema.upgrade(kcidb.io.validate(io_schema, data),
+                                         copy=False)
                 self.load(data, with_metadata=True, copy=False)
@@ -37,6 +37,31 @@ class NoTimestamps(Error):
     """Row timestamps required for the operation don't exist"""
 
 
+class NoTableDump(Error):
+    """The database doesn't support dumping table rows"""
+
+
+class OverBudget(Error):
+    """A query would process more data than the database allows"""
+
+    def __init__(self, bytes_processed, max_bytes):
+        """
+        Initialize the exception.
+
+        Args:
+            bytes_processed:    The (estimated) number of bytes the query
+                                would process.
+            max_bytes:          The maximum number of bytes a query is
+                                allowed to process.
+        """
+        assert isinstance(bytes_processed, int)
+        assert isinstance(max_bytes, int)
+        super().__init__(
+            f"Query would process {bytes_processed} bytes, "
+            f"exceeding the budget of {max_bytes} bytes"
+        )
+
+
 def format_spec_list(specs):
     """
     Format a database specification list string out of a list of specification
@@ -370,7 +370,7 @@ class Driver(AbstractDriver):
         """
         return self.version, self.schemas[self.version][0]
 
-    def upgrade(self, target_version):
+    def upgrade(self, target_version, online=False):
         """
         Upgrade the database to the specified schema.
         The database must be initialized.
@@ -380,7 +380,11 @@ class Driver(AbstractDriver):
                             the schema to upgrade to (must be one of the
                             database's available schema versions, newer than
                             the current one).
+            online:         True if the upgrade should be done without
+                            keeping the database locked for long, where
+                            supported. False otherwise.
         """
+        assert isinstance(online, bool)
         assert self.is_initialized()
         assert target_version in self.schemas, \
             "Target schema version is not available"
@@ -391,7 +395,7 @@ class Driver(AbstractDriver):
                 if version > target_version:
                     break
                 for driver, driver_version in driver_versions.items():
-                    driver.upgrade(driver_version)
+                    driver.upgrade(driver_version, online=online)
                 self.version = version
 
     def dump_iter(self, objects_per_report, with_metadata, after, until):
@@ -432,6 +436,50 @@ class Driver(AbstractDriver):
         yield from self.drivers[0].dump_iter(objects_per_report,
                                              with_metadata, after, until)
 
+    def dump_tables_iter(self, rows_per_batch, with_metadata, after, until):
+        """
+        Dump all data from the first database as batches of table rows, if
+        the database supports that.
+
+        Args:
+            rows_per_batch:     A positive integer maximum number of rows in
+                                each returned batch.
+            with_metadata:      True, if metadata columns should be dumped as
+                                well. False, if not.
+            after:              A dictionary of names of I/O object types
+                                (list names) and timezone-aware datetime
+                                objects specifying the latest time the
+                                corresponding objects should've arrived to be
+                                *excluded* from the dump. Any objects which
+                                arrived later will be *eligible* for dumping.
+                                Object types missing from this dictionary will
+                                not be limited.
+            until:              A dictionary of names of I/O object types
+                                (list names) and timezone-aware datetime
+                                objects specifying the latest time the
+                                corresponding objects should've arrived to be
+                                *included* into the dump. Any objects which
+                                arrived later will be *ineligible* for
+                                dumping. Object types missing from this
+                                dictionary will not be limited.
+
+        Returns:
+            An iterator returning tuples, each containing a table (I/O object
+            list) name, a dictionary of the table's column names and their
+            export types (see kcidb.db.sql.schema.Column.EXPORT_TYPE), and a
+            list of row tuples, containing JSON representations of the
+            column values in the same order, with None for NULL.
+            Each table's column dictionary is the same in all its batches.
+
+        Raises:
+            NoTableDump     - The database doesn't support dumping tables.
+            NoTimestamps    - Either "after" or "until" are not empty, and
+                              the database doesn't have row timestamps.
+        """
+        yield from self.drivers[0].dump_tables_iter(rows_per_batch,
+                                                    with_metadata,
+                                                    after, until)
+
     # We can live with this for now, pylint: disable=too-many-arguments
     # Or if you prefer, pylint: disable=too-many-positional-arguments
     def query_iter(self, ids, children, parents, objects_per_report,
@@ -69,7 +69,7 @@ class Driver(AbstractDriver):
         """
         return dict((self.get_schema(),))
 
-    def upgrade(self, target_version):
+    def upgrade(self, target_version, online=False):
         """
         Upgrade the database to the specified schema.
         The database must be initialized.
@@ -79,7 +79,11 @@ class Driver(AbstractDriver):
                             the schema to upgrade to (must be one of the
                             database's available schema versions, newer than
                             the current one).
+            online:         True if the upgrade should be done without
+                            keeping the database locked for long, where
+                            supported. False otherwise.
         """
+        assert isinstance(online, bool)
         assert target_version == self.get_schema()[0]
 
     def init(self, version):
@@ -9,6 +9,9 @@ from kcidb.db.sql.schema import Constraint, Column, \
 class BoolColumn(Column):
     """A boolean column schema"""
 
+    # The type of the column's values in columnar exports
+    EXPORT_TYPE = "bool"
+
     def __init__(self, constraint=None,
                  conflict_func=None, metadata_expr=None):
         """
@@ -35,6 +38,9 @@ class BoolColumn(Column):
 class VarcharColumn(Column):
     """A character varying column schema"""
 
+    # The type of the column's values in columnar exports
+    EXPORT_TYPE = "string"
+
     def __init__(self, length, constraint=None,
                  conflict_func=None, metadata_expr=None):
         """
@@ -66,6 +72,9 @@ class VarcharColumn(Column):
 class TextColumn(Column):
     """A text column schema"""
 
+    # The type of the column's values in columnar exports
+    EXPORT_TYPE = "string"
+
     def __init__(self, constraint=None,
                  conflict_func=None, metadata_expr=None):
         """
@@ -89,9 +98,45 @@ class TextColumn(Column):
                          metadata_expr=metadata_expr)
 
 
+class EnumColumn(Column):
+    """An enumerated type column schema"""
+
+    # The type of the column's values in columnar exports
+    EXPORT_TYPE = "string"
+
+    def __init__(self, type, constraint=None,
+                 conflict_func=None, metadata_expr=None):
+        """
+        Initialize the column schema.
+
+        Args:
+            type:           The name of the enumerated database type to use
+                            for this column.
+            constraint:     The column's constraint.
+                            A member of the Constraint enum, or None,
+                            meaning no constraint.
+            conflict_func:  The (non-empty) string containing the name of the
+                            SQL function to use to resolve insertion conflicts
+                            for this column. None to resolve
+                            non-deterministically.
+            metadata_expr:  A (non-empty) SQL expression string to use as the
+                            value for this (metadata) column, if not supplied
+                            explicitly. None to consider this a normal column.
+        """
+        # It's OK, pylint: disable=redefined-builtin
+        assert isinstance(type, str)
+        assert constraint is None or isinstance(constraint, Constraint)
+        super().__init__(type, constraint=constraint,
+                         conflict_func=conflict_func,
+                         metadata_expr=metadata_expr)
+
+
 class TextArrayColumn(Column):
     """A text array column schema"""
 
+    # The type of the column's values in columnar exports
+    EXPORT_TYPE = "string_list"
+
     def __init__(self, constraint=None,
                  conflict_func=None, metadata_expr=None):
         """
@@ -118,6 +163,9 @@ class TextArrayColumn(Column):
 class JSONColumn(Column):
     """A JSON column schema"""
 
+    # The type of the column's values in columnar exports
+    EXPORT_TYPE = "json"
+
     @staticmethod
     def pack(value):
         """
@@ -152,6 +200,9 @@ class JSONColumn(Column):
 class TimestampColumn(Column):
     """A timestamp column schema"""
 
+    # The type of the column's values in columnar exports
+    EXPORT_TYPE = "timestamp"
+
     @staticmethod
     def unpack(value):
         """
@@ -186,6 +237,9 @@ class TimestampColumn(Column):
 class IntegerColumn(Column):
     """An integer number column schema"""
 
+    # The type of the column's values in columnar exports
+    EXPORT_TYPE = "int"
+
     def __init__(self, constraint=None,
                  conflict_func=None, metadata_expr=None):
         """
@@ -212,6 +266,9 @@ class IntegerColumn(Column):
 class FloatColumn(Column):
     """A floating-point number column schema"""
 
+    # The type of the column's values in columnar exports
+    EXPORT_TYPE = "float"
+
     def __init__(self, constraint=None,
                  conflict_func=None, metadata_expr=None):
         """
@@ -281,19 +338,24 @@ class Index(_SQLIndex):
         super().__init__(table, columns, key_sep="_", unique=unique)
         self.method = method
 
-    def format_create(self, name):
+    def format_create(self, name, concurrently=False):
         """
         Format the "CREATE INDEX" command for the table.
 
         Args:
-            name:       The name of the target index of the command.
+            name:           The name of the target index of the command.
+            concurrently:   True if the index should be built without
+                            locking out writes to the table (and outside
+                            a transaction). False otherwise.
 
         Returns:
             The formatted "CREATE INDEX" command.
         """
+        assert isinstance(concurrently, bool)
         method = "" if self.method is None else f" USING {self.method}"
         return (
             f"CREATE {['', 'UNIQUE '][self.unique]}INDEX "
+            f"{['', 'CONCURRENTLY '][concurrently]}"
             f"IF NOT EXISTS {name} ON {self.table}{method} (" +
             ", ".join(self.columns.values()) +
             ")"
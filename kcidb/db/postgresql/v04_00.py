@@ -1,5 +1,6 @@
 """Kernel CI report database - PostgreSQL schema v4.0"""
 
+import time
 import random
 import logging
 import textwrap
@@ -187,6 +188,198 @@ class Connection(AbstractConnection):
             return cursor.fetchone()[0]
 
 
+class Upgrader:
+    """
+    A helper executing schema upgrade steps for a PostgreSQL connection.
+
+    Normally executes all the steps in a single transaction. If the
+    connection is marked for online upgrade, executes each step in its own
+    transaction, adds columns as nullable, backfills them in committed and
+    throttled batches, and builds indexes concurrently, so the tables are
+    never locked for long. Each step is idempotent, so an interrupted online
+    upgrade can be resumed by running it again.
+    """
+
+    # Maximum number of rows to update in a single backfill transaction
+    BATCH_SIZE = 10000
+    # Seconds to sleep between backfill transactions
+    BATCH_DELAY = 0.1
+
+    def __init__(self, conn):
+        """
+        Initialize the upgrader.
+
+        Args:
+            conn:   The connection to upgrade the database of.
+        """
+        assert isinstance(conn, Connection)
+        self.conn = conn
+        self.online = conn.online_upgrade
+        # The cursor of the single upgrade transaction, if not online
+        self.cursor = None
+
+    def __enter__(self):
+        """Start the upgrade (transaction, if not online)"""
+        if not self.online:
+            # Oh, but the connection is, pylint: disable=not-context-manager
+            self.conn.__enter__()
+            self.cursor = self.conn.cursor()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Finish the upgrade (transaction, if not online)"""
+        if not self.online:
+            self.cursor.close()
+            self.cursor = None
+            return self.conn.__exit__(exc_type, exc_value, traceback)
+        return None
+
+    def execute(self, statement, parameters=None):
+        """
+        Execute an upgrade statement, in its own transaction, if online.
+
+        Args:
+            statement:  The statement to execute.
+            parameters: The statement parameters, or None if none.
+
+        Returns:
+            The number of rows the statement affected.
+        """
+        if self.cursor is not None:
+            self.cursor.execute(statement, parameters)
+            return self.cursor.rowcount
+        # Oh, but the connection is, pylint: disable=not-context-manager
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute(statement, parameters)
+            return cursor.rowcount
+
+    def has_column(self, table_name, column_name):
+        """
+        Check if a table has a column.
+
+        Args:
+            table_name:     The name of the table to check.
+            column_name:    The name of the column to check for.
+
+        Returns:
+            True if the table has the column, False otherwise.
+        """
+        assert isinstance(table_name, str)
+        assert isinstance(column_name, str)
+        statement = textwrap.dedent("""\
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND
+                  table_name = %s AND column_name = %s
+        """)
+        parameters = (table_name, column_name)
+        if self.cursor is not None:
+            self.cursor.execute(statement, parameters)
+            return self.cursor.fetchone() is not None
+        # Oh, but the connection is, pylint: disable=not-context-manager
+        with self.conn, self.conn.cursor() as cursor:
+            cursor.execute(statement, parameters)
+            return cursor.fetchone() is not None
+
+    def add_column(self, table_name, column):
+        """
+        Add a column to a table, unless it's already there.
+        Add it as nullable, if online.
+
+        Args:
+            table_name: The name of the table to add the column to.
+            column:     The table column (schema) to add.
+        """
+        column_def = column.format_def()
+        if self.online:
+            column_def = column.name + " " + column.schema.type
+        self.execute(
+            f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {column_def}"
+        )
+
+    def drop_column(self, table_name, column):
+        """
+        Remove a column from a table, if it's still there.
+
+        Args:
+            table_name: The name of the table to remove the column from.
+            column:     The table column (schema) to remove.
+        """
+        self.execute(
+            f"ALTER TABLE {table_name} DROP COLUMN IF EXISTS {column.name}"
+        )
+
+    def backfill(self, table_name, assignments, condition):
+        """
+        Assign values to columns of table rows matching a condition.
+        Do that in committed and throttled batches, logging progress,
+        if online.
+
+        Args:
+            table_name:     The name of the table to backfill.
+            assignments:    The "SET" clause expression to assign the values
+                            with. Must make the rows stop matching the
+                            condition.
+            condition:      The "WHERE" clause expression matching the rows
+                            to backfill.
+
+        Returns:
+            The number of rows backfilled.
+        """
+        assert isinstance(table_name, str)
+        assert isinstance(assignments, str)
+        assert isinstance(condition, str)
+        if not self.online:
+            return self.execute(
+                f"UPDATE {table_name} SET {assignments} WHERE {condition}"
+            )
+        total = 0
+        while True:
+            count = self.execute(f"""
+                UPDATE {table_name} SET {assignments}
+                WHERE ctid IN (
+                    SELECT ctid FROM {table_name}
+                    WHERE {condition}
+                    LIMIT {self.BATCH_SIZE}
+                )
+            """)
+            total += count
+            LOGGER.info("Backfilled %s rows in table %r", total, table_name)
+            if count < self.BATCH_SIZE:
+                return total
+            time.sleep(self.BATCH_DELAY)
+
+    def create_index(self, index_name, index_schema):
+        """
+        Create an index. Build it concurrently, if online.
+
+        Args:
+            index_name:     The name of the index to create.
+            index_schema:   The schema of the index to create.
+        """
+        try:
+            if not self.online:
+                self.execute(index_schema.format_create(index_name))
+                return
+            # Concurrent index builds cannot run in a transaction
+            self.conn.conn.autocommit = True
+            try:
+                with self.conn.cursor() as cursor:
+                    try:
+                        cursor.execute(index_schema.format_create(
+                            index_name, concurrently=True
+                        ))
+                    except Exception:
+                        # Don't leave an invalid index behind
+                        cursor.execute(
+                            f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"
+                        )
+                        raise
+            finally:
+                self.conn.conn.autocommit = False
+        except Exception as exc:
+            raise Exception(f"Failed creating index {index_name!r}") from exc
+
+
 class Schema(AbstractSchema):
     """PostgreSQL database schema v4.0"""
 
@@ -616,6 +809,69 @@ class Schema(AbstractSchema):
             assert LIGHT_ASSERTS or self.io.is_valid_exactly(data)
             yield data
 
+    def dump_tables_iter(self, rows_per_batch, with_metadata, after, until):
+        """
+        Dump all data from the database as batches of table rows.
+
+        Args:
+            rows_per_batch:     A positive integer maximum number of rows in
+                                each returned batch.
+            with_metadata:      True, if metadata columns should be dumped as
+                                well. False, if not.
+            after:              A dictionary of names of I/O object types
+                                (list names) and timezone-aware datetime
+                                objects specifying the latest time the
+                                corresponding objects should've arrived to be
+                                *excluded* from the dump. Any objects which
+                                arrived later will be *eligible* for dumping.
+                                Object types missing from this dictionary will
+                                not be limited.
+            until:              A dictionary of names of I/O object types
+                                (list names) and timezone-aware datetime
+                                objects specifying the latest time the
+                                corresponding objects should've arrived to be
+                                *included* into the dump. Any objects which
+                                arrived later will be *ineligible* for
+                                dumping. Object types missing from this
+                                dictionary will not be limited.
+
+        Returns:
+            An iterator returning tuples, each containing a table (I/O object
+            list) name, a dictionary of the table's column names and their
+            export types (see kcidb.db.sql.schema.Column.EXPORT_TYPE), and a
+            list of row tuples, containing JSON representations of the
+            column values in the same order, with None for NULL.
+            Each table's column dictionary is the same in all its batches.
+            Each table has at least one batch, possibly empty.
+
+        Raises:
+            NoTimestamps    - Either "after" or "until" are not empty, and
+                              the database doesn't have row timestamps.
+        """
+        assert isinstance(rows_per_batch, int)
+        assert rows_per_batch > 0
+        assert isinstance(with_metadata, bool)
+
+        with self.conn:
+            for table_name, table_schema in self.TABLES.items():
+                columns = table_schema.get_export_types(with_metadata)
+                # Fetch rows in batches with a server-side cursor
+                with self.conn.cursor(name="dump_tables") as cursor:
+                    cursor.itersize = rows_per_batch
+                    cursor.execute(*table_schema.format_dump(
+                        table_name, with_metadata,
+                        after.get(table_name), until.get(table_name)
+                    ))
+                    rows = cursor.fetchmany(rows_per_batch)
+                    while True:
+                        yield table_name, columns, [
+                            table_schema.unpack_row(row, with_metadata)
+                            for row in rows
+                        ]
+                        rows = cursor.fetchmany(rows_per_batch)
+                        if not rows:
+                            break
+
     # We can live with this for now, pylint: disable=too-many-arguments
     # Or if you prefer, pylint: disable=too-many-positional-arguments
     def query_iter(self, ids, children, parents, objects_per_report,
@@ -6,7 +6,7 @@ from kcidb.misc import merge_dicts
 from kcidb.db.postgresql.schema import \
     Constraint, BoolColumn, IntegerColumn, \
     TextColumn, JSONColumn, Table
-from .v04_00 import Schema as PreviousSchema
+from .v04_00 import Schema as PreviousSchema, Upgrader
 
 # Module's logger
 LOGGER = logging.getLogger(__name__)
@@ -115,11 +115,13 @@ class Schema(PreviousSchema):
                     comply with the previous version of the schema.
         """
         assert isinstance(conn, cls.Connection)
-        with conn, conn.cursor() as cursor:
+        with Upgrader(conn) as upgrader:
             for table_name, table_schema in cls.TABLES.items():
                 if table_name not in PreviousSchema.TABLES:
                     try:
-                        cursor.execute(table_schema.format_create(table_name))
+                        upgrader.execute(
+                            table_schema.format_create(table_name)
+                        )
                     except Exception as exc:
                         raise Exception(
                             f"Failed creating table {table_name!r}"
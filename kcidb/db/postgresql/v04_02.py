@@ -7,6 +7,7 @@ from kcidb.misc import merge_dicts
 from kcidb.db.postgresql.schema import \
     TimestampColumn, Table
 from .v04_01 import Schema as PreviousSchema
+from .v04_00 import Upgrader
 
 # Module's logger
 LOGGER = logging.getLogger(__name__)
@@ -52,24 +53,19 @@ class Schema(PreviousSchema):
                     comply with the previous version of the schema.
         """
         assert isinstance(conn, cls.Connection)
-        with conn, conn.cursor() as cursor:
+        with Upgrader(conn) as upgrader:
             # For all tables
             for name, schema in cls.TABLES.items():
                 # Get the _timestamp table column
                 column = schema.columns["_timestamp"]
                 # Add the _timestamp column
-                cursor.execute(f"""
-                    ALTER TABLE {name} ADD COLUMN {column.format_def()}
-                """)
+                upgrader.add_column(name, column)
                 # Set missing _timestamps to start_time, or current time
                 expr = column.schema.metadata_expr
                 if "start_time" in schema.columns:
                     expr = f"COALESCE(start_time, {expr})"
-                cursor.execute(f"""
-                    UPDATE {name}
-                    SET {column.name} = {expr}
-                    WHERE {column.name} IS NULL
-                """)
+                upgrader.backfill(name, f"{column.name} = {expr}",
+                                  f"{column.name} IS NULL")
 
     def purge(self, before):
         """
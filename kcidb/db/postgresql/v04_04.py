@@ -3,6 +3,7 @@
 from kcidb.misc import merge_dicts
 from kcidb.db.postgresql.schema import Index
 from .v04_03 import Schema as PreviousSchema
+from .v04_00 import Upgrader
 
 
 class Schema(PreviousSchema):
@@ -33,12 +34,7 @@ class Schema(PreviousSchema):
                     comply with the previous version of the schema.
         """
         assert isinstance(conn, cls.Connection)
-        with conn, conn.cursor() as cursor:
+        with Upgrader(conn) as upgrader:
             for index_name, index_schema in cls.INDEXES.items():
                 if index_name not in PreviousSchema.INDEXES:
-                    try:
-                        cursor.execute(index_schema.format_create(index_name))
-                    except Exception as exc:
-                        raise Exception(
-                            f"Failed creating index {index_name!r}"
-                        ) from exc
+                    upgrader.create_index(index_name, index_schema)
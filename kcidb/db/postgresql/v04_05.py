@@ -2,8 +2,9 @@
 
 import textwrap
 from kcidb.misc import merge_dicts
-from kcidb.db.postgresql.schema import Table, Column, Index
+from kcidb.db.postgresql.schema import Table, EnumColumn, Index
 from .v04_04 import Schema as PreviousSchema
+from .v04_00 import Upgrader
 
 
 # Source: https://stackoverflow.com/a/60260190/1161045
@@ -56,7 +57,7 @@ class Schema(PreviousSchema):
             PreviousSchema.TABLES_ARGS["tests"],
             columns=merge_dicts(
                 PreviousSchema.TABLES_ARGS["tests"]["columns"],
-                status=Column("STATUS"),
+                status=EnumColumn("STATUS"),
             ),
         ),
     )
@@ -122,19 +123,14 @@ class Schema(PreviousSchema):
                     comply with the previous version of the schema.
         """
         assert isinstance(conn, cls.Connection)
-        with conn, conn.cursor() as cursor:
-            cursor.execute(CREATE_STATUS_TYPE_STATEMENT)
-            cursor.execute(CREATE_ENCODE_URI_COMPONENT_STATEMENT)
-            cursor.execute(textwrap.dedent("""\
+        with Upgrader(conn) as upgrader:
+            upgrader.execute(CREATE_STATUS_TYPE_STATEMENT)
+            upgrader.execute(CREATE_ENCODE_URI_COMPONENT_STATEMENT)
+            upgrader.execute(textwrap.dedent("""\
                 ALTER TABLE tests
                 ALTER COLUMN status TYPE STATUS
                 USING status::STATUS
             """))
             for index_name, index_schema in cls.INDEXES.items():
                 if index_name not in PreviousSchema.INDEXES:
-                    try:
-                        cursor.execute(index_schema.format_create(index_name))
-                    except Exception as exc:
-                        raise Exception(
-                            f"Failed creating index {index_name!r}"
-                        ) from exc
+                    upgrader.create_index(index_name, index_schema)
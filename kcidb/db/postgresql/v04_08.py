@@ -4,9 +4,10 @@ import textwrap
 from kcidb.misc import merge_dicts
 import kcidb.io as io
 from kcidb.db.postgresql.schema import \
-    Column, FloatColumn, TextColumn, TextArrayColumn, \
+    EnumColumn, FloatColumn, TextColumn, TextArrayColumn, \
     Table, Index
 from .v04_07 import Schema as PreviousSchema
+from .v04_00 import Upgrader
 
 
 CREATE_UNIT_PREFIX_TYPE_STATEMENT = textwrap.dedent("""\
@@ -40,7 +41,7 @@ class Schema(PreviousSchema):
                     "environment.compatible": TextArrayColumn(),
                     "number.value": FloatColumn(),
                     "number.unit": TextColumn(),
-                    "number.prefix": Column("UNIT_PREFIX")
+                    "number.prefix": EnumColumn("UNIT_PREFIX")
                 }
             )
         )
@@ -116,8 +117,8 @@ class Schema(PreviousSchema):
                     comply with the previous version of the schema.
         """
         assert isinstance(conn, cls.Connection)
-        with conn, conn.cursor() as cursor:
-            cursor.execute(CREATE_UNIT_PREFIX_TYPE_STATEMENT)
+        with Upgrader(conn) as upgrader:
+            upgrader.execute(CREATE_UNIT_PREFIX_TYPE_STATEMENT)
             # For all tables
             for name, schema in cls.TABLES.items():
                 if name not in PreviousSchema.TABLES:
@@ -127,19 +128,10 @@ class Schema(PreviousSchema):
                     set(PreviousSchema.TABLES_ARGS[name]["columns"])
                 if not new_column_names:
                     continue
-                cursor.execute(
-                    f"ALTER TABLE {name}" + ",".join(
-                        " ADD COLUMN " + schema.columns[n].format_def()
-                        for n in new_column_names
-                    )
-                )
+                for column_name in sorted(new_column_names):
+                    upgrader.add_column(name, schema.columns[column_name])
 
             # For all indexes
             for index_name, index_schema in cls.INDEXES.items():
                 if index_name not in PreviousSchema.INDEXES:
-                    try:
-                        cursor.execute(index_schema.format_create(index_name))
-                    except Exception as exc:
-                        raise Exception(
-                            f"Failed creating index {index_name!r}"
-                        ) from exc
+                    upgrader.create_index(index_name, index_schema)
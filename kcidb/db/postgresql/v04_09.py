@@ -6,6 +6,7 @@ from kcidb.db.postgresql.schema import \
     TextColumn, TextArrayColumn, \
     BoolColumn, Table, Index
 from .v04_08 import Schema as PreviousSchema
+from .v04_00 import Upgrader
 
 
 # It's OK, pylint: disable=too-many-ancestors
@@ -86,7 +87,7 @@ class Schema(PreviousSchema):
                     comply with the previous version of the schema.
         """
         assert isinstance(conn, cls.Connection)
-        with conn, conn.cursor() as cursor:
+        with Upgrader(conn) as upgrader:
             # For all tables
             for name, schema in cls.TABLES.items():
                 if name not in PreviousSchema.TABLES:
@@ -96,19 +97,10 @@ class Schema(PreviousSchema):
                     set(PreviousSchema.TABLES_ARGS[name]["columns"])
                 if not new_column_names:
                     continue
-                cursor.execute(
-                    f"ALTER TABLE {name}" + ",".join(
-                        " ADD COLUMN " + schema.columns[n].format_def()
-                        for n in new_column_names
-                    )
-                )
+                for column_name in sorted(new_column_names):
+                    upgrader.add_column(name, schema.columns[column_name])
 
             # For all indexes
             for index_name, index_schema in cls.INDEXES.items():
                 if index_name not in PreviousSchema.INDEXES:
-                    try:
-                        cursor.execute(index_schema.format_create(index_name))
-                    except Exception as exc:
-                        raise Exception(
-                            f"Failed creating index {index_name!r}"
-                        ) from exc
+                    upgrader.create_index(index_name, index_schema)
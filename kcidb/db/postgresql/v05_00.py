@@ -3,8 +3,9 @@
 from kcidb.misc import merge_dicts
 import kcidb.io as io
 from kcidb.db.postgresql.schema import \
-    Table, Index, Column
+    Table, Index, EnumColumn
 from .v04_09 import Schema as PreviousSchema
+from .v04_00 import Upgrader
 
 
 # It's OK, pylint: disable=too-many-ancestors
@@ -39,7 +40,7 @@ class Schema(PreviousSchema):
                     PreviousSchema.TABLES_ARGS["builds"]["columns"].items()
                 )),
                 # Add "status" column
-                status=Column("STATUS"),
+                status=EnumColumn("STATUS"),
             )
         ),
         # Tests
@@ -159,7 +160,7 @@ class Schema(PreviousSchema):
                     comply with the previous version of the schema.
         """
         assert isinstance(conn, cls.Connection)
-        with conn, conn.cursor() as cursor:
+        with Upgrader(conn) as upgrader:
             # Add new columns
             # For all tables
             for name, schema in cls.TABLES.items():
@@ -170,65 +171,72 @@ class Schema(PreviousSchema):
                     set(cls.TABLES_ARGS[name]["columns"]) -
                     set(PreviousSchema.TABLES_ARGS[name]["columns"])
                 ):
-                    cursor.execute(f"""
-                        ALTER TABLE {name} ADD COLUMN
-                        {schema.columns[column_name].format_def()}
-                    """)
+                    upgrader.add_column(name, schema.columns[column_name])
 
-            # Migrate data to the new columns
-            cursor.execute("""
-                UPDATE builds SET
-                    status = CASE valid
-                        WHEN TRUE THEN 'PASS'::STATUS
-                        WHEN FALSE THEN 'FAIL'::STATUS
-                        ELSE NULL
-                    END
-            """)
+            # Migrate data from the old columns, unless already removed
+            # by an interrupted upgrade
+            if upgrader.has_column("builds", "valid"):
+                upgrader.backfill(
+                    "builds",
+                    """
+                        status = CASE valid
+                            WHEN TRUE THEN 'PASS'::STATUS
+                            WHEN FALSE THEN 'FAIL'::STATUS
+                            ELSE NULL
+                        END
+                    """,
+                    "status IS NULL AND valid IS NOT NULL"
+                )
 
             # Migrate data to new rows
             waived_issue_origin = '_'
             waived_issue_id = f'{waived_issue_origin}:waived'
             waived_issue_version = '1'
-            timestamp_expr = cls.TABLES['incidents']. \
+            if upgrader.has_column("tests", "waived"):
+                timestamp_expr = cls.TABLES['incidents']. \
+                    columns['_timestamp'].schema.metadata_expr
+                upgrader.execute(f"""
+                    INSERT INTO incidents (
+                        _timestamp,
+                        id,
+                        origin,
+                        issue_id,
+                        issue_version,
+                        test_id,
+                        present
+                    )
+                    SELECT
+                        {timestamp_expr},
+                        '{waived_issue_id}:{waived_issue_version}:' || id
+                            AS id,
+                        '{waived_issue_origin}' AS origin,
+                        '{waived_issue_id}' AS issue_id,
+                        {waived_issue_version} AS issue_version,
+                        id AS test_id,
+                        TRUE AS present
+                    FROM tests
+                    WHERE waived
+                    ON CONFLICT DO NOTHING
+                """)
+            # Add the waived issue, if there are any waived incidents
+            timestamp_expr = cls.TABLES['issues']. \
                 columns['_timestamp'].schema.metadata_expr
-            cursor.execute(f"""
-                INSERT INTO incidents (
-                    _timestamp,
-                    id,
-                    origin,
-                    issue_id,
-                    issue_version,
-                    test_id,
-                    present
+            upgrader.execute(f"""
+                INSERT INTO issues (
+                    _timestamp, id, version, origin, comment
                 )
                 SELECT
                     {timestamp_expr},
-                    '{waived_issue_id}:{waived_issue_version}:' || id AS id,
-                    '{waived_issue_origin}' AS origin,
-                    '{waived_issue_id}' AS issue_id,
-                    {waived_issue_version} AS issue_version,
-                    id AS test_id,
-                    TRUE AS present
-                FROM tests
-                WHERE waived
+                    '{waived_issue_id}',
+                    {waived_issue_version},
+                    '{waived_issue_origin}',
+                    'Test waived as unreliable'
+                WHERE EXISTS (
+                    SELECT 1 FROM incidents
+                    WHERE issue_id = '{waived_issue_id}'
+                )
+                ON CONFLICT DO NOTHING
             """)
-            # If we inserted any waived incidents
-            if cursor.rowcount != 0:
-                # Add the waived issue
-                timestamp_expr = cls.TABLES['issues']. \
-                    columns['_timestamp'].schema.metadata_expr
-                cursor.execute(f"""
-                    INSERT INTO issues (
-                        _timestamp, id, version, origin, comment
-                    )
-                    VALUES (
-                        {timestamp_expr},
-                        '{waived_issue_id}',
-                        {waived_issue_version},
-                        '{waived_issue_origin}',
-                        'Test waived as unreliable'
-                    )
-                """)
 
             # Remove old columns
             # For all tables
@@ -240,17 +248,9 @@ class Schema(PreviousSchema):
                     set(PreviousSchema.TABLES_ARGS[name]["columns"]) -
                     set(cls.TABLES_ARGS[name]["columns"])
                 ):
-                    cursor.execute(f"""
-                        ALTER TABLE {name} DROP COLUMN
-                        {schema.columns[column_name].name}
-                    """)
+                    upgrader.drop_column(name, schema.columns[column_name])
 
             # Create new indexes
             for index_name, index_schema in cls.INDEXES.items():
                 if index_name not in PreviousSchema.INDEXES:
-                    try:
-                        cursor.execute(index_schema.format_create(index_name))
-                    except Exception as exc:
-                        raise Exception(
-                            f"Failed creating index {index_name!r}"
-                        ) from exc
+                    upgrader.create_index(index_name, index_schema)
@@ -5,6 +5,7 @@ import kcidb.io as io
 from kcidb.db.postgresql.schema import \
     Table, Index, TextArrayColumn
 from .v05_01 import Schema as PreviousSchema
+from .v04_00 import Upgrader
 
 
 # It's OK, pylint: disable=too-many-ancestors
@@ -48,7 +49,7 @@ class Schema(PreviousSchema):
                     comply with the previous version of the schema.
         """
         assert isinstance(conn, cls.Connection)
-        with conn, conn.cursor() as cursor:
+        with Upgrader(conn) as upgrader:
             # Add new columns
             # For all tables
             for name, schema in cls.TABLES.items():
@@ -59,17 +60,9 @@ class Schema(PreviousSchema):
                     set(cls.TABLES_ARGS[name]["columns"]) -
                     set(PreviousSchema.TABLES_ARGS[name]["columns"])
                 ):
-                    cursor.execute(f"""
-                        ALTER TABLE {name} ADD COLUMN
-                        {schema.columns[column_name].format_def()}
-                    """)
+                    upgrader.add_column(name, schema.columns[column_name])
 
             # Create new indexes
             for index_name, index_schema in cls.INDEXES.items():
                 if index_name not in PreviousSchema.INDEXES:
-                    try:
-                        cursor.execute(index_schema.format_create(index_name))
-                    except Exception as exc:
-                        raise Exception(
-                            f"Failed creating index {index_name!r}"
-                        ) from exc
+                    upgrader.create_index(index_name, index_schema)
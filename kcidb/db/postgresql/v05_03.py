@@ -5,6 +5,7 @@ import kcidb.io as io
 from kcidb.db.postgresql.schema import \
     Table, JSONColumn
 from .v05_02 import Schema as PreviousSchema
+from .v04_00 import Upgrader
 
 
 # It's OK, pylint: disable=too-many-ancestors
@@ -42,7 +43,7 @@ class Schema(PreviousSchema):
                     comply with the previous version of the schema.
         """
         assert isinstance(conn, cls.Connection)
-        with conn, conn.cursor() as cursor:
+        with Upgrader(conn) as upgrader:
             # Add new columns
             # For all tables
             for name, schema in cls.TABLES.items():
@@ -53,7 +54,4 @@ class Schema(PreviousSchema):
                     set(cls.TABLES_ARGS[name]["columns"]) -
                     set(PreviousSchema.TABLES_ARGS[name]["columns"])
                 ):
-                    cursor.execute(f"""
-                        ALTER TABLE {name} ADD COLUMN
-                        {schema.columns[column_name].format_def()}
-                    """)
+                    upgrader.add_column(name, schema.columns[column_name])
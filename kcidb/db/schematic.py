@@ -5,7 +5,7 @@ from abc import ABCMeta, ABC, abstractmethod
 import datetime
 import kcidb.io as io
 import kcidb.orm as orm
-from kcidb.db.misc import UnsupportedSchema
+from kcidb.db.misc import UnsupportedSchema, NoTableDump
 from kcidb.misc import LIGHT_ASSERTS
 from kcidb.db.abstract import Driver as AbstractDriver
 
@@ -37,6 +37,11 @@ class Connection(ABC, metaclass=MetaConnection):
     # Documentation of the connection parameters
     _PARAMS_DOC = None
 
+    # True if schema upgrades should be done online, without keeping the
+    # database locked for long, where supported. Set by the driver for the
+    # duration of an upgrade.
+    online_upgrade = False
+
     @abstractmethod
     def __init__(self, params):
         """
@@ -298,6 +303,53 @@ class Schema(ABC, metaclass=MetaSchema):
                               the database doesn't have row timestamps.
         """
 
+    def dump_tables_iter(self, rows_per_batch, with_metadata, after, until):
+        """
+        Dump all data from the database as batches of table rows, if the
+        database supports that.
+
+        Args:
+            rows_per_batch:     A positive integer maximum number of rows in
+                                each returned batch.
+            with_metadata:      True, if metadata columns should be dumped as
+                                well. False, if not.
+            after:              A dictionary of names of I/O object types
+                                (list names) and timezone-aware datetime
+                                objects specifying the latest time the
+                                corresponding objects should've arrived to be
+                                *excluded* from the dump. Any objects which
+                                arrived later will be *eligible* for dumping.
+                                Object types missing from this dictionary will
+                                not be limited.
+            until:              A dictionary of names of I/O object types
+                                (list names) and timezone-aware datetime
+                                objects specifying the latest time the
+                                corresponding objects should've arrived to be
+                                *included* into the dump. Any objects which
+                                arrived later will be *ineligible* for
+                                dumping. Object types missing from this
+                                dictionary will not be limited.
+
+        Returns:
+            An iterator returning tuples, each containing a table (I/O object
+            list) name, a dictionary of the table's column names and their
+            export types (see kcidb.db.sql.schema.Column.EXPORT_TYPE), and a
+            list of row tuples, containing JSON representations of the
+            column values in the same order, with None for NULL.
+            Each table's column dictionary is the same in all its batches.
+
+        Raises:
+            NoTableDump     - The database doesn't support dumping tables.
+            NoTimestamps    - Either "after" or "until" are not empty, and
+                              the database doesn't have row timestamps.
+        """
+        assert isinstance(rows_per_batch, int)
+        assert rows_per_batch > 0
+        assert isinstance(with_metadata, bool)
+        assert isinstance(after, dict)
+        assert isinstance(until, dict)
+        raise NoTableDump("The database doesn't support dumping tables")
+
     # We can live with this for now, pylint: disable=too-many-arguments
     # Or if you prefer, pylint: disable=too-many-positional-arguments
     @abstractmethod
@@ -630,7 +682,7 @@ class Driver(AbstractDriver, metaclass=MetaDriver):
         assert self.is_initialized()
         return self.schema.version, self.schema.io
 
-    def upgrade(self, target_version):
+    def upgrade(self, target_version, online=False):
         """
         Upgrade the database to the specified schema.
         The database must be initialized.
@@ -640,7 +692,11 @@ class Driver(AbstractDriver, metaclass=MetaDriver):
                             the schema to upgrade to (must be one of the
                             database's available schema versions, newer than
                             the current one).
+            online:         True if the upgrade should be done without
+                            keeping the database locked for long, where
+                            supported. False otherwise.
         """
+        assert isinstance(online, bool)
         assert self.is_initialized()
         assert target_version in self.get_schemas(), \
             "Target schema version is not available for the driver"
@@ -659,12 +715,16 @@ class Driver(AbstractDriver, metaclass=MetaDriver):
             raise Exception("Target schema is not a driver's newer schema")
 
         # Inherit data through all newer versions up to the target one
-        for schema in newer_schemas:
-            # The metaclass makes sure each schema has its own _inherit()
-            # It's OK, we're friends, pylint: disable=protected-access
-            schema._inherit(self.conn)
-            self.conn.set_schema_version(schema.version)
-            self.schema = schema(self.conn)
+        self.conn.online_upgrade = online
+        try:
+            for schema in newer_schemas:
+                # The metaclass makes sure each schema has its own _inherit()
+                # It's OK, we're friends, pylint: disable=protected-access
+                schema._inherit(self.conn)
+                self.conn.set_schema_version(schema.version)
+                self.schema = schema(self.conn)
+        finally:
+            self.conn.online_upgrade = False
 
     def dump_iter(self, objects_per_report, with_metadata, after, until):
         """
@@ -720,6 +780,64 @@ class Driver(AbstractDriver, metaclass=MetaDriver):
         return self.schema.dump_iter(objects_per_report, with_metadata,
                                      after, until)
 
+    def dump_tables_iter(self, rows_per_batch, with_metadata, after, until):
+        """
+        Dump all data from the database as batches of table rows, if the
+        database supports that. The database must be initialized.
+
+        Args:
+            rows_per_batch:     A positive integer maximum number of rows in
+                                each returned batch.
+            with_metadata:      True, if metadata columns should be dumped as
+                                well. False, if not.
+            after:              A dictionary of names of I/O object types
+                                (list names) and timezone-aware datetime
+                                objects specifying the latest time the
+                                corresponding objects should've arrived to be
+                                *excluded* from the dump. Any objects which
+                                arrived later will be *eligible* for dumping.
+                                Object types missing from this dictionary will
+                                not be limited.
+            until:              A dictionary of names of I/O object types
+                                (list names) and timezone-aware datetime
+                                objects specifying the latest time the
+                                corresponding objects should've arrived to be
+                                *included* into the dump. Any objects which
+                                arrived later will be *ineligible* for
+                                dumping. Object types missing from this
+                                dictionary will not be limited.
+
+        Returns:
+            An iterator returning tuples, each containing a table (I/O object
+            list) name, a dictionary of the table's column names and their
+            export types (see kcidb.db.sql.schema.Column.EXPORT_TYPE), and a
+            list of row tuples, containing JSON representations of the
+            column values in the same order, with None for NULL.
+            Each table's column dictionary is the same in all its batches.
+
+        Raises:
+            NoTableDump     - The database doesn't support dumping tables.
+            NoTimestamps    - Either "after" or "until" are not empty, and
+                              the database doesn't have row timestamps.
+        """
+        assert self.is_initialized()
+        io_schema = self.get_schema()[1]
+        assert isinstance(rows_per_batch, int)
+        assert rows_per_batch > 0
+        assert isinstance(with_metadata, bool)
+        assert isinstance(after, dict) and all(
+            obj_list_name in io_schema.id_fields and
+            isinstance(ts, datetime.datetime) and ts.tzinfo
+            for obj_list_name, ts in after.items()
+        )
+        assert isinstance(until, dict) and all(
+            obj_list_name in io_schema.id_fields and
+            isinstance(ts, datetime.datetime) and ts.tzinfo
+            for obj_list_name, ts in until.items()
+        )
+        return self.schema.dump_tables_iter(rows_per_batch, with_metadata,
+                                            after, until)
+
     # We can live with this for now, pylint: disable=too-many-arguments
     # Or if you prefer, pylint: disable=too-many-positional-arguments
     def query_iter(self, ids, children, parents, objects_per_report,
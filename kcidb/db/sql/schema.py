@@ -17,6 +17,11 @@ class Constraint(Enum):
 class Column:
     """A column schema"""
 
+    # The type of the column's (JSON representation) values in columnar
+    # exports: "bool", "int", "float", "string", "string_list",
+    # "timestamp" (an ISO-8601 string), or "json" (any JSON value)
+    EXPORT_TYPE = "json"
+
     @staticmethod
     def pack(value):
         """
@@ -343,6 +348,28 @@ class Table:
             ]
         )
 
+    def get_export_types(self, with_metadata):
+        """
+        Get the names and export types of the table columns, in the order
+        the columns are output by the "SELECT" command formatted by the
+        format_dump() method.
+
+        Args:
+            with_metadata:  True, if metadata columns should be included.
+                            False, if not.
+
+        Returns:
+            A dictionary of column names (with keys joined by underscores),
+            and the types of their values in columnar exports (see
+            Column.EXPORT_TYPE).
+        """
+        assert isinstance(with_metadata, bool)
+        return {
+            "_".join(c.keys): c.schema.EXPORT_TYPE
+            for c in self.columns.values()
+            if with_metadata or not c.schema.metadata_expr
+        }
+
     def format_get_first_modified(self, name):
         """
         Format the "SELECT" command returning the timestamp of first data
@@ -494,6 +521,28 @@ class Table:
                 None if value is None else column.schema.unpack(value)
         return unpacked_obj
 
+    def unpack_row(self, obj, with_metadata):
+        """
+        Unpack a database representation of an object into a tuple of JSON
+        representations of its column values, in the order of columns
+        returned by the get_export_types() method.
+
+        Args:
+            obj:            The object to unpack.
+            with_metadata:  Expect metadata columns in the object.
+
+        Returns:
+            The tuple of unpacked column values, with None for NULL.
+        """
+        columns = filter(
+            lambda c: with_metadata or not c.schema.metadata_expr,
+            self.columns.values()
+        )
+        return tuple(
+            None if value is None else column.schema.unpack(value)
+            for column, value in zip(columns, obj)
+        )
+
     def unpack_iter(self, obj_seq, with_metadata, drop_null=True):
         """
         Create a generator unpacking database object representations from
@@ -9,6 +9,9 @@ from kcidb.db.sql.schema import Constraint, Column, Table as _SQLTable
 class BoolColumn(Column):
     """A boolean column"""
 
+    # The type of the column's values in columnar exports
+    EXPORT_TYPE = "bool"
+
     @staticmethod
     def unpack(value):
         """
@@ -43,6 +46,9 @@ class BoolColumn(Column):
 class TextColumn(Column):
     """A text column"""
 
+    # The type of the column's values in columnar exports
+    EXPORT_TYPE = "string"
+
     def __init__(self, constraint=None,
                  conflict_func=None, metadata_expr=None):
         """
@@ -69,6 +75,9 @@ class TextColumn(Column):
 class IntegerColumn(Column):
     """An integer column"""
 
+    # The type of the column's values in columnar exports
+    EXPORT_TYPE = "int"
+
     def __init__(self, constraint=None,
                  conflict_func=None, metadata_expr=None):
         """
@@ -92,9 +101,41 @@ class IntegerColumn(Column):
                          metadata_expr=metadata_expr)
 
 
+class FloatColumn(Column):
+    """A floating-point number column"""
+
+    # The type of the column's values in columnar exports
+    EXPORT_TYPE = "float"
+
+    def __init__(self, constraint=None,
+                 conflict_func=None, metadata_expr=None):
+        """
+        Initialize the column description.
+
+        Args:
+            constraint:     The column's constraint.
+                            A member of the Constraint enum, or None,
+                            meaning no constraint.
+            conflict_func:  The (non-empty) string containing the name of the
+                            SQL function to use to resolve insertion conflicts
+                            for this column. None to resolve
+                            non-deterministically.
+            metadata_expr:  A (non-empty) SQL expression string to use as the
+                            value for this (metadata) column, if not supplied
+                            explicitly. None to consider this a normal column.
+        """
+        assert constraint is None or isinstance(constraint, Constraint)
+        super().__init__("REAL", constraint=constraint,
+                         conflict_func=conflict_func,
+                         metadata_expr=metadata_expr)
+
+
 class JSONColumn(TextColumn):
     """A JSON-encoded column"""
 
+    # The type of the column's values in columnar exports
+    EXPORT_TYPE = "json"
+
     @staticmethod
     def pack(value):
         """
@@ -138,6 +179,9 @@ class JSONColumn(TextColumn):
 class TimestampColumn(TextColumn):
     """A normalized timestamp column"""
 
+    # The type of the column's values in columnar exports
+    EXPORT_TYPE = "timestamp"
+
     @staticmethod
     def pack(value):
         """
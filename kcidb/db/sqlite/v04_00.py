@@ -15,9 +15,10 @@ from kcidb.db.schematic import \
     Schema as AbstractSchema, \
     Connection as AbstractConnection
 from kcidb.db.sqlite.schema import \
-    Constraint, Column, BoolColumn, IntegerColumn, TextColumn, \
+    Constraint, BoolColumn, IntegerColumn, FloatColumn, TextColumn, \
     JSONColumn, TimestampColumn, Table
 
+# It's OK for now, pylint: disable=too-many-lines
 
 # Module's logger
 LOGGER = logging.getLogger(__name__)
@@ -41,6 +42,11 @@ class Connection(AbstractConnection):
                         If starts with an exclamation mark ('!'), the
                         in-database data is prioritized explicitly initially,
                         instead of randomly. Double to include one literally.
+
+                        If starts with a caret ('^'), the loaded data is
+                        always prioritized over the in-database data, instead
+                        of alternating the priority with every load. Double
+                        to include one literally.
     """)
 
     def __init__(self, params):
@@ -58,15 +64,24 @@ class Connection(AbstractConnection):
                             self._PARAMS_DOC)
 
         self.load_prio_db = bool(random.randint(0, 1))
+        # True if the priority should be flipped after every load
+        self.load_prio_flip = True
         if params.startswith("!"):
             if not params.startswith("!!"):
                 self.load_prio_db = True
             params = params[1:]
+        elif params.startswith("^"):
+            if not params.startswith("^^"):
+                self.load_prio_db = False
+                self.load_prio_flip = False
+            params = params[1:]
 
         super().__init__(params)
 
         # Create the connection
-        self.conn = sqlite3.connect(params)
+        # Allow using the connection from other threads, one at a time,
+        # e.g. for background prefetching
+        self.conn = sqlite3.connect(params, check_same_thread=False)
         self.conn.set_trace_callback(
             lambda s: LOGGER.debug("Executing:\n%s", s)
         )
@@ -190,7 +205,7 @@ class Schema(AbstractSchema):
                 "origin": TextColumn(constraint=Constraint.NOT_NULL),
                 "comment": TextColumn(),
                 "start_time": TimestampColumn(),
-                "duration": Column("REAL"),
+                "duration": FloatColumn(),
                 "architecture": TextColumn(),
                 "command": TextColumn(),
                 "compiler": TextColumn(),
@@ -218,7 +233,7 @@ class Schema(AbstractSchema):
                 "status": TextColumn(),
                 "waived": BoolColumn(),
                 "start_time": TimestampColumn(),
-                "duration": Column("REAL"),
+                "duration": FloatColumn(),
                 "output_files": JSONColumn(),
                 "misc": JSONColumn()
             }
@@ -314,7 +329,7 @@ class Schema(AbstractSchema):
                 checkout_id=TextColumn(),
                 origin=TextColumn(),
                 start_time=TimestampColumn(),
-                duration=Column("REAL"),
+                duration=FloatColumn(),
                 architecture=TextColumn(),
                 command=TextColumn(),
                 compiler=TextColumn(),
@@ -358,11 +373,11 @@ class Schema(AbstractSchema):
                 environment_misc=JSONColumn(),
                 log_url=TextColumn(),
                 status=TextColumn(),
-                number_value=Column("REAL"),
+                number_value=FloatColumn(),
                 number_unit=TextColumn(),
                 number_prefix=TextColumn(),
                 start_time=TimestampColumn(),
-                duration=Column("REAL"),
+                duration=FloatColumn(),
                 output_files=JSONColumn(),
                 comment=TextColumn(),
                 misc=JSONColumn(),
@@ -547,6 +562,70 @@ class Schema(AbstractSchema):
             assert LIGHT_ASSERTS or self.io.is_valid_exactly(data)
             yield data
 
+    def dump_tables_iter(self, rows_per_batch, with_metadata, after, until):
+        """
+        Dump all data from the database as batches of table rows.
+
+        Args:
+            rows_per_batch:     A positive integer maximum number of rows in
+                                each returned batch.
+            with_metadata:      True, if metadata columns should be dumped as
+                                well. False, if not.
+            after:              A dictionary of names of I/O object types
+                                (list names) and timezone-aware datetime
+                                objects specifying the latest time the
+                                corresponding objects should've arrived to be
+                                *excluded* from the dump. Any objects which
+                                arrived later will be *eligible* for dumping.
+                                Object types missing from this dictionary will
+                                not be limited.
+            until:              A dictionary of names of I/O object types
+                                (list names) and timezone-aware datetime
+                                objects specifying the latest time the
+                                corresponding objects should've arrived to be
+                                *included* into the dump. Any objects which
+                                arrived later will be *ineligible* for
+                                dumping. Object types missing from this
+                                dictionary will not be limited.
+
+        Returns:
+            An iterator returning tuples, each containing a table (I/O object
+            list) name, a dictionary of the table's column names and their
+            export types (see kcidb.db.sql.schema.Column.EXPORT_TYPE), and a
+            list of row tuples, containing JSON representations of the
+            column values in the same order, with None for NULL.
+            Each table's column dictionary is the same in all its batches.
+            Each table has at least one batch, possibly empty.
+
+        Raises:
+            NoTimestamps    - Either "after" or "until" are not empty, and
+                              the database doesn't have row timestamps.
+        """
+        assert isinstance(rows_per_batch, int)
+        assert rows_per_batch > 0
+        assert isinstance(with_metadata, bool)
+
+        with self.conn:
+            cursor = self.conn.cursor()
+            try:
+                for table_name, table_schema in self.TABLES.items():
+                    columns = table_schema.get_export_types(with_metadata)
+                    cursor.execute(*table_schema.format_dump(
+                        table_name, with_metadata,
+                        after.get(table_name), until.get(table_name)
+                    ))
+                    rows = cursor.fetchmany(rows_per_batch)
+                    while True:
+                        yield table_name, columns, [
+                            table_schema.unpack_row(row, with_metadata)
+                            for row in rows
+                        ]
+                        rows = cursor.fetchmany(rows_per_batch)
+                        if not rows:
+                            break
+            finally:
+                cursor.close()
+
     # We can live with this for now, pylint: disable=too-many-arguments
     # Or if you prefer, pylint: disable=too-many-positional-arguments
     def query_iter(self, ids, children, parents, objects_per_report,
@@ -891,7 +970,8 @@ class Schema(AbstractSchema):
                 cursor.close()
         # Flip priority for the next load to maintain (rough)
         # parity with non-determinism of BigQuery's ANY_VALUE()
-        self.conn.load_prio_db = not self.conn.load_prio_db
+        if self.conn.load_prio_flip:
+            self.conn.load_prio_db = not self.conn.load_prio_db
 
     def get_first_modified(self):
         """
@@ -4,7 +4,7 @@ import logging
 import kcidb.io as io
 from kcidb.misc import merge_dicts
 from kcidb.db.sqlite.schema import \
-    Column, TextColumn, JSONColumn, Table
+    TextColumn, FloatColumn, JSONColumn, Table
 from .v04_02 import Schema as PreviousSchema
 
 # Module's logger
@@ -30,7 +30,7 @@ class Schema(PreviousSchema):
                 PreviousSchema.TABLES_ARGS["tests"]["columns"],
                 {
                     "environment.compatible": JSONColumn(),
-                    "number.value": Column("REAL"),
+                    "number.value": FloatColumn(),
                     "number.unit": TextColumn(),
                     "number.prefix": TextColumn()
                 }
@@ -0,0 +1,371 @@
+"""kcdib.db.bigquery module tests"""
+
+import re
+import json
+import datetime
+import pytest
+from google.cloud import bigquery
+from google.api_core.exceptions import NotFound as GoogleNotFound
+from kcidb.db.bigquery import Driver
+from kcidb.db.bigquery.v04_00 import Connection
+from kcidb.db.bigquery.v05_04 import Schema as V05_04Schema
+from kcidb.db.misc import OverBudget
+
+
+class FakeLoadJob:
+    """A fake BigQuery load job, completed on creation"""
+
+    def __init__(self, errors=None):
+        """
+        Initialize the fake load job.
+
+        Args:
+            errors: A list of error dictionaries the job has failed with,
+                    or None, if it succeeded.
+        """
+        self.errors = errors
+
+    def result(self):
+        """Wait for the job to complete (it already has)"""
+        return self
+
+
+class FakeQueryJob:
+    """A fake BigQuery query job, completed on creation"""
+
+    def __init__(self, bytes_processed, dry_run):
+        """
+        Initialize the fake query job.
+
+        Args:
+            bytes_processed:    The number of bytes the query processed.
+            dry_run:            True if the query was dry-run.
+        """
+        self.total_bytes_processed = bytes_processed
+        self.slot_millis = None if dry_run else 1
+        self.cache_hit = False
+
+    def add_done_callback(self, callback):
+        """Call a function with the job, as it is already done"""
+        callback(self)
+
+    def result(self):
+        """Return the (empty) query result"""
+        return []
+
+    def __iter__(self):
+        """Iterate over the (empty) query result"""
+        return iter(self.result())
+
+
+class FakeClient:
+    """A fake local BigQuery client, recording the loaded rows"""
+
+    def __init__(self, bytes_processed=0):
+        """
+        Initialize the fake client.
+
+        Args:
+            bytes_processed:    The number of bytes every query processes.
+        """
+        self.project = "project"
+        self.bytes_processed = bytes_processed
+        # A dictionary of table IDs and lists of rows loaded into them
+        self.table_rows = {}
+        # A list of job configurations loads were submitted with
+        self.load_job_configs = []
+        # A list of job configurations queries were submitted with
+        self.query_job_configs = []
+        # A list of (non-dry-run) query strings submitted
+        self.query_strings = []
+        # A dictionary of table IDs and (fake) table objects created
+        self.tables = {}
+
+    def query(self, query_string, job_config=None):
+        """
+        Create a query job.
+
+        Args:
+            query_string:   The SQL query string.
+            job_config:     The query job configuration.
+
+        Returns:
+            The (completed) query job.
+        """
+        assert isinstance(query_string, str)
+        self.query_job_configs.append(job_config)
+        if not job_config.dry_run:
+            self.query_strings.append(query_string)
+            match = re.fullmatch(
+                r"\s*ALTER TABLE `(\w+)` RENAME TO `(\w+)`\s*", query_string
+            )
+            if match:
+                self.tables[match[2]] = self.tables.pop(match[1])
+        return FakeQueryJob(self.bytes_processed, bool(job_config.dry_run))
+
+    def get_table(self, table_ref):
+        """
+        Get a table object.
+
+        Args:
+            table_ref:  The reference to the table to get.
+
+        Returns:
+            The table object.
+
+        Raises:
+            google.api_core.exceptions.NotFound - the table doesn't exist.
+        """
+        if table_ref.table_id not in self.tables:
+            raise GoogleNotFound(f"Table {table_ref.table_id!r} not found")
+        return self.tables[table_ref.table_id]
+
+    def create_table(self, table):
+        """
+        Create a table.
+
+        Args:
+            table:  The table object to create.
+        """
+        assert table.table_id not in self.tables
+        self.tables[table.table_id] = table
+
+    def delete_table(self, table_ref, not_found_ok=False):
+        """
+        Delete a table.
+
+        Args:
+            table_ref:      The reference to the table to delete.
+            not_found_ok:   True if a missing table should be ignored.
+        """
+        assert not_found_ok or table_ref.table_id in self.tables
+        self.tables.pop(table_ref.table_id, None)
+
+    def load_table_from_file(self, file_obj, destination,
+                             rewind=False, job_config=None):
+        """
+        Load newline-delimited JSON rows from a file into a table.
+
+        Args:
+            file_obj:       The binary file object to read rows from.
+            destination:    The reference to the table to load into.
+            rewind:         True, if the file should be rewound first.
+            job_config:     The load job configuration.
+
+        Returns:
+            The (completed) load job.
+        """
+        assert job_config.source_format == \
+            bigquery.SourceFormat.NEWLINE_DELIMITED_JSON
+        if rewind:
+            file_obj.seek(0)
+        self.load_job_configs.append(job_config)
+        self.table_rows.setdefault(destination.table_id, []).extend(
+            json.loads(line) for line in file_obj.read().splitlines()
+        )
+        return FakeLoadJob()
+
+
+class FakeConnection(Connection):
+    """A BigQuery connection using a fake client"""
+
+    # Not calling parent's __init__ to avoid connecting,
+    # pylint: disable=super-init-not-called
+    def __init__(self, client, max_bytes=None, refuse_over_budget=True):
+        """
+        Initialize the fake connection.
+
+        Args:
+            client:             The fake client to use.
+            max_bytes:          Maximum number of bytes a query can process,
+                                or None if unlimited.
+            refuse_over_budget: True if over-budget queries should be
+                                refused, false if only warned about.
+        """
+        self.client = client
+        self.max_bytes = max_bytes
+        self.refuse_over_budget = refuse_over_budget
+        self.query_hooks = []
+        self.dataset_ref = bigquery.DatasetReference(client.project,
+                                                     "dataset")
+
+
+def test_load_from_file():
+    """Check BigQuery loads rows streamed through files"""
+    schema_type = Driver.LatestSchema
+    client = FakeClient()
+    schema = schema_type(FakeConnection(client))
+    data = dict(
+        version=dict(major=schema_type.io.major,
+                     minor=schema_type.io.minor),
+        checkouts=[
+            dict(id="test:checkout:1", origin="test",
+                 misc=dict(foo="bar")),
+        ],
+        builds=[
+            dict(id="test:build:1", origin="test",
+                 checkout_id="test:checkout:1"),
+            dict(id="test:build:2", origin="test",
+                 checkout_id="test:checkout:1"),
+        ],
+    )
+    schema.load(data, with_metadata=False, copy=True)
+
+    # Check the original data is intact, and a single job per table was run
+    assert data["checkouts"][0]["misc"] == dict(foo="bar")
+    assert len(client.load_job_configs) == 2
+    assert client.table_rows == dict(
+        _checkouts=[
+            dict(id="test:checkout:1", origin="test",
+                 misc=json.dumps(dict(foo="bar"))),
+        ],
+        _builds=[
+            dict(id="test:build:1", origin="test",
+                 checkout_id="test:checkout:1"),
+            dict(id="test:build:2", origin="test",
+                 checkout_id="test:checkout:1"),
+        ],
+    )
+    # Check metadata fields were left out of the load schema
+    for job_config in client.load_job_configs:
+        assert all(not f.name.startswith("_") for f in job_config.schema)
+
+
+def test_query_budget():
+    """Check BigQuery queries are checked against the bytes budget"""
+    # No budget - no dry runs
+    client = FakeClient(bytes_processed=100)
+    conn = FakeConnection(client)
+    conn.query_create("SELECT 1")
+    assert [bool(c.dry_run) for c in client.query_job_configs] == [False]
+
+    # Within budget
+    client = FakeClient(bytes_processed=100)
+    conn = FakeConnection(client, max_bytes=100)
+    conn.query_create("SELECT 1")
+    assert [bool(c.dry_run) for c in client.query_job_configs] == \
+        [True, False]
+
+    # Over budget, refused
+    client = FakeClient(bytes_processed=101)
+    conn = FakeConnection(client, max_bytes=100)
+    with pytest.raises(OverBudget):
+        conn.query_create("SELECT 1")
+    assert [bool(c.dry_run) for c in client.query_job_configs] == [True]
+
+    # Over budget, warned about
+    client = FakeClient(bytes_processed=101)
+    conn = FakeConnection(client, max_bytes=100, refuse_over_budget=False)
+    conn.query_create("SELECT 1")
+    assert [bool(c.dry_run) for c in client.query_job_configs] == \
+        [True, False]
+
+
+def test_query_hooks():
+    """Check BigQuery query hooks receive statistics of each query"""
+    client = FakeClient(bytes_processed=100)
+    conn = FakeConnection(client)
+    stats_list = []
+    conn.query_hooks.append(stats_list.append)
+    conn.query_create("SELECT 1")
+    assert len(stats_list) == 1
+    stats = stats_list[0]
+    assert stats.caller.endswith(":test_query_hooks")
+    assert stats.query_string == "SELECT 1"
+    assert stats.bytes_processed == 100
+    assert stats.slot_millis == 1
+    assert stats.cache_hit is False
+
+
+def test_table_layout():
+    """Check BigQuery raw tables are partitioned and clustered"""
+    schema_type = Driver.LatestSchema
+    dataset_ref = bigquery.DatasetReference("project", "dataset")
+    for name, table_schema in schema_type.TABLE_MAP.items():
+        # We're testing it, pylint: disable=protected-access
+        table = schema_type._new_table(dataset_ref.table("_" + name), name)
+        assert table.time_partitioning.field == "_timestamp"
+        assert 0 < len(table.clustering_fields) <= 4
+        field_names = {f.name for f in table_schema}
+        assert set(table.clustering_fields) <= field_names
+
+
+def test_dump_time_limits():
+    """Check time-limited BigQuery dumps keep whole objects"""
+    after = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    until = datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc)
+    limits = "`_timestamp` > ? AND `_timestamp` <= ?"
+
+    # Check schemas before v5.4 filter the deduplicated views
+    client = FakeClient()
+    schema_type = V05_04Schema.__bases__[0]
+    schema = schema_type(FakeConnection(client))
+    list(schema.dump_iter(0, True, dict(builds=after), dict(builds=until)))
+    # A query is made for each table, in order
+    query_strings = dict(zip(schema_type.TABLE_MAP, client.query_strings))
+    assert query_strings["checkouts"].endswith(" FROM `checkouts`")
+    assert query_strings["builds"].endswith(
+        " FROM `builds` WHERE _timestamp > ? AND _timestamp <= ?"
+    )
+
+    # Check v5.4 looks up the objects in the raw table partitions
+    # within the limits, but deduplicates all their rows
+    client = FakeClient()
+    schema_type = V05_04Schema
+    schema = schema_type(FakeConnection(client))
+    list(schema.dump_iter(0, True, dict(builds=after), dict(builds=until)))
+    query_strings = dict(zip(schema_type.TABLE_MAP, client.query_strings))
+    assert query_strings["checkouts"].endswith(" FROM `checkouts`")
+    builds_query = query_strings["builds"]
+    assert "FROM `project.dataset._builds` WHERE (`id`) IN (" \
+        f"SELECT (`id`) FROM `project.dataset._builds` WHERE {limits}" \
+        ") GROUP BY id" in builds_query
+    assert "MAX(`_timestamp`) AS `_timestamp`" in builds_query
+    assert builds_query.endswith(f") WHERE {limits}")
+    query_parameters = [
+        job_config.query_parameters
+        for job_config in client.query_job_configs
+        if not job_config.dry_run
+    ]
+    assert [p.value for p in query_parameters[1]] == \
+        [after, until, after, until]
+
+
+def test_inherit_restart():
+    """Check BigQuery v5.4 table recreation can be restarted"""
+    client = FakeClient()
+    conn = FakeConnection(client)
+    old_schema_type = V05_04Schema.__bases__[0]
+    # We're testing it, pylint: disable=protected-access
+    for name in V05_04Schema.TABLE_MAP:
+        client.create_table(old_schema_type._new_table(
+            conn.dataset_ref.table("_" + name), name
+        ))
+    # Simulate an interrupted run: checkouts done, builds renaming pending,
+    # tests copying
+    client.tables["_checkouts"] = V05_04Schema._new_table(
+        conn.dataset_ref.table("_checkouts"), "checkouts"
+    )
+    client.tables["_builds_new"] = V05_04Schema._new_table(
+        conn.dataset_ref.table("_builds_new"), "builds"
+    )
+    del client.tables["_builds"]
+    client.tables["_tests_new"] = V05_04Schema._new_table(
+        conn.dataset_ref.table("_tests_new"), "tests"
+    )
+
+    V05_04Schema._inherit(conn)
+
+    assert set(client.tables) == {"_" + n for n in V05_04Schema.TABLE_MAP}
+    for table in client.tables.values():
+        assert table.time_partitioning.field == "_timestamp"
+    # Checkouts are not copied again, and builds are only renamed
+    copied = [
+        re.search(r"INSERT INTO `_(\w+)_new`", q)[1]
+        for q in client.query_strings if "INSERT INTO" in q
+    ]
+    assert copied == ["tests", "issues", "incidents"]
+    # Rerunning a completed inheritance does nothing
+    client.query_strings.clear()
+    V05_04Schema._inherit(conn)
+    assert not client.query_strings
@@ -147,7 +147,7 @@ class DummyDriver(NullDriver):
             self.schemas[int(self.major / self.major_step) *
                          self.minors_per_major]
 
-    def upgrade(self, target_version):
+    def upgrade(self, target_version, online=False):
         """
         Upgrade the database to the specified schema.
         The database must be initialized.
@@ -157,7 +157,11 @@ class DummyDriver(NullDriver):
                             the schema to upgrade to (must be one of the
                             database's available schema versions, newer than
                             the current one).
+            online:         True if the upgrade should be done without
+                            keeping the database locked for long, where
+                            supported. False otherwise.
         """
+        assert isinstance(online, bool)
         assert self.is_initialized()
         assert isinstance(target_version, tuple)
         assert len(target_version) == 2
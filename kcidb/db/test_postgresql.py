@@ -0,0 +1,166 @@
+"""kcdib.db.postgresql module tests"""
+
+import re
+import pytest
+from kcidb.db.postgresql.v04_00 import Connection
+from kcidb.db.postgresql.v05_00 import Schema as V05_00Schema
+
+
+class FakeCursor:
+    """A fake PostgreSQL cursor, tracking table columns"""
+
+    def __init__(self, conn):
+        """
+        Initialize the fake cursor.
+
+        Args:
+            conn:   The fake PostgreSQL connection the cursor belongs to.
+        """
+        self.conn = conn
+        self.rowcount = 0
+        self.row = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+    def execute(self, statement, parameters=None):
+        """
+        Execute a statement, tracking the added and removed table columns.
+
+        Args:
+            statement:  The statement to execute.
+            parameters: The statement parameters, or None if none.
+
+        Raises:
+            Exception   - the connection was set to fail at this statement.
+        """
+        statement = " ".join(statement.split())
+        if self.conn.fail_countdown is not None:
+            if self.conn.fail_countdown == 0:
+                self.conn.fail_countdown = None
+                raise Exception("Simulated failure")
+            self.conn.fail_countdown -= 1
+        self.conn.statements.append(statement)
+        self.rowcount = 0
+        self.row = None
+        if statement.startswith("SELECT 1 FROM information_schema.columns"):
+            if tuple(parameters) in self.conn.columns:
+                self.row = (1,)
+        elif match := re.match(
+            r"ALTER TABLE (\w+) ADD COLUMN IF NOT EXISTS (\w+) ", statement
+        ):
+            self.conn.columns.add((match[1], match[2]))
+        elif match := re.fullmatch(
+            r"ALTER TABLE (\w+) DROP COLUMN IF EXISTS (\w+)", statement
+        ):
+            self.conn.columns.discard((match[1], match[2]))
+
+    def fetchone(self):
+        """Fetch the result row, if any"""
+        return self.row
+
+
+class FakePGConnection:
+    """A fake PostgreSQL connection, tracking table columns"""
+
+    def __init__(self, columns):
+        """
+        Initialize the fake connection.
+
+        Args:
+            columns:    A set of (table name, column name) tuples of the
+                        columns the database starts with.
+        """
+        self.columns = set(columns)
+        self.statements = []
+        self.autocommit = False
+        # Number of statements to succeed before failing, or None
+        self.fail_countdown = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+    def cursor(self):
+        """Create a cursor"""
+        return FakeCursor(self)
+
+
+class FakeConnection(Connection):
+    """A PostgreSQL connection using a fake connection"""
+
+    # Not calling parent's __init__ to avoid connecting,
+    # pylint: disable=super-init-not-called
+    def __init__(self, columns):
+        """
+        Initialize the fake connection for online upgrades.
+
+        Args:
+            columns:    A set of (table name, column name) tuples of the
+                        columns the database starts with.
+        """
+        self.conn = FakePGConnection(columns)
+        self.online_upgrade = True
+
+
+def get_columns(schema_type):
+    """
+    Get the columns of a schema's tables.
+
+    Args:
+        schema_type:    The schema to get the table columns of.
+
+    Returns:
+        A set of (table name, column name) tuples.
+    """
+    return {
+        (table_name, column.name)
+        for table_name, table in schema_type.TABLES.items()
+        for column in table.columns.values()
+    }
+
+
+def test_upgrade_rerun():
+    """Check online PostgreSQL upgrades can be resumed after failure"""
+    schema_type = V05_00Schema
+    prev_schema_type = V05_00Schema.__bases__[0]
+    # Find out the number of statements in a complete upgrade
+    conn = FakeConnection(get_columns(prev_schema_type))
+    # We're testing it, pylint: disable=protected-access
+    schema_type._inherit(conn)
+    assert conn.conn.columns == get_columns(schema_type)
+    statement_num = len(conn.conn.statements)
+    assert any(s.startswith("INSERT INTO incidents ") and
+               s.endswith(" ON CONFLICT DO NOTHING")
+               for s in conn.conn.statements)
+
+    # Fail at every statement, and resume
+    for fail_at in range(statement_num):
+        conn = FakeConnection(get_columns(prev_schema_type))
+        conn.conn.fail_countdown = fail_at
+        with pytest.raises(Exception):
+            schema_type._inherit(conn)
+        executed = conn.conn.statements
+        conn.conn.statements = []
+        schema_type._inherit(conn)
+        assert conn.conn.columns == get_columns(schema_type)
+        # Data isn't migrated from removed columns
+        if ("tests", "waived") not in get_columns(schema_type) and \
+                any(s.startswith("ALTER TABLE tests DROP COLUMN") and
+                    s.endswith(" waived") for s in executed):
+            assert not any(s.startswith("INSERT INTO incidents ")
+                           for s in conn.conn.statements)
+        # Every step is safe to repeat
+        for statement in conn.conn.statements:
+            if statement.startswith("ALTER TABLE"):
+                assert " IF NOT EXISTS " in statement or \
+                    " IF EXISTS " in statement
+            elif statement.startswith("INSERT"):
+                assert statement.endswith(" ON CONFLICT DO NOTHING")
+            elif statement.startswith("CREATE"):
+                assert " IF NOT EXISTS " in statement
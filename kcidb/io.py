@@ -1,9 +1,69 @@
 """KCIDB package-specific I/O definitions"""
 
+from functools import lru_cache
+
 # Inherit all public definitions from kcidb_io package
 # We know what we're doing, flake8 and
 # pylint: disable=wildcard-import,unused-wildcard-import
 from kcidb_io import *  # noqa: F403
+from kcidb.validator import Validator
 
 # The I/O schema version used by KCIDB
 SCHEMA = schema.V5_3  # noqa: F405
+
+
+@lru_cache(maxsize=None)
+def get_validator(version):
+    """
+    Get the compiled validator for an I/O schema version, compiling it on
+    first request.
+
+    Args:
+        version:    The I/O schema version to get the validator for.
+
+    Returns:
+        The validator (kcidb.validator.Validator) for the version,
+        reporting errors exactly as the version's own validation.
+    """
+    assert issubclass(version, schema.VA)  # noqa: F405
+    return Validator(version.json, fallback=version.validate_exactly)
+
+
+def validate(version, data):
+    """
+    Validate I/O data against an I/O schema version, or a previous one,
+    matching the data, same as version.validate(data) does, but faster.
+
+    Args:
+        version:    The I/O schema version to validate against.
+        data:       The data to validate. Will not be changed.
+
+    Returns:
+        The validated (but unchanged) data.
+
+    Raises:
+        `jsonschema.exceptions.ValidationError` if the data did not adhere
+        to the version, or a previous version of the schema.
+    """
+    # Produce the version's validation failure, if not compatible
+    return get_validator(
+        version.get_exactly_compatible(data) or version
+    ).validate(data)
+
+
+def is_valid(version, data):
+    """
+    Check if I/O data is valid according to an I/O schema version, or a
+    previous one, matching the data, same as version.is_valid(data) does,
+    but faster.
+
+    Args:
+        version:    The I/O schema version to check against.
+        data:       The data to check.
+
+    Returns:
+        True if the data is valid, false otherwise.
+    """
+    return get_validator(
+        version.get_exactly_compatible(data) or version
+    ).is_valid(data)
@@ -0,0 +1,888 @@
+"""
+Kernel CI report queue loader.
+
+A long-running worker loading reports from the submission message queue
+into a database, overlapping pulling, decoding, merging, loading, and
+acknowledging in separate pipeline stages, connected with bounded queues.
+"""
+
+import sys
+import math
+import time
+import queue
+import signal
+import logging
+import threading
+import kcidb.orm
+from kcidb import misc, db, mq
+
+# Module's logger
+LOGGER = logging.getLogger(__name__)
+
+# The marker passed down the pipeline when the input ends
+_END = object()
+
+
+class _Aborted(Exception):
+    """The pipeline was aborted because of an error in a stage"""
+
+
+def get_updated_patterns(data):
+    """
+    Generate ORM patterns matching all objects affected by loading I/O
+    data into the database.
+
+    Args:
+        data:   The I/O data to generate patterns for.
+
+    Returns:
+        A normalized set of ORM patterns (kcidb.orm.query.Pattern) matching
+        all the affected objects.
+    """
+    pattern_set = kcidb.orm.query.Pattern.from_io(data, copy=False)
+    # Add patterns for all parents
+    pattern_set |= kcidb.orm.query.Pattern.expand(pattern_set, False)[1]
+    return kcidb.orm.query.Pattern.normalize(pattern_set)
+
+
+class StageStats:
+    """Throughput statistics of a loader pipeline stage"""
+    # It's OK, pylint: disable=too-many-instance-attributes
+
+    def __init__(self, name):
+        """
+        Initialize the statistics.
+
+        Args:
+            name:   The name of the stage.
+        """
+        assert isinstance(name, str)
+        self.name = name
+        # The lock protecting the counters
+        self.lock = threading.Lock()
+        # The monotonic time the stage started, or None if not started
+        self.start = None
+        # The monotonic time the stage stopped, or None if still running
+        self.stop = None
+        # The number of messages processed
+        self.messages = 0
+        # The number of I/O objects processed
+        self.objects = 0
+        # Seconds spent waiting for input
+        self.idle = 0.0
+        # Seconds spent waiting for space in the output queue
+        self.blocked = 0.0
+
+    def add(self, messages=0, objects=0, idle=0.0, blocked=0.0):
+        """
+        Add to the statistics counters.
+
+        Args:
+            messages:   The number of messages processed.
+            objects:    The number of I/O objects processed.
+            idle:       Seconds spent waiting for input.
+            blocked:    Seconds spent waiting for space in the output queue.
+        """
+        with self.lock:
+            self.messages += messages
+            self.objects += objects
+            self.idle += idle
+            self.blocked += blocked
+
+    def get(self):
+        """
+        Get a snapshot of the statistics.
+
+        Returns:
+            A dictionary with the following keys:
+            * "messages" - the number of messages processed,
+            * "objects" - the number of I/O objects processed,
+            * "elapsed" - seconds the stage was running,
+            * "idle" - seconds spent waiting for input,
+            * "blocked" - seconds spent waiting for space in the output
+              queue (back-pressure from the next stage),
+            * "busy" - seconds spent processing.
+        """
+        with self.lock:
+            if self.start is None:
+                elapsed = 0.0
+            else:
+                elapsed = (self.stop or time.monotonic()) - self.start
+            return dict(
+                messages=self.messages,
+                objects=self.objects,
+                elapsed=elapsed,
+                idle=self.idle,
+                blocked=self.blocked,
+                busy=max(elapsed - self.idle - self.blocked, 0.0),
+            )
+
+    def __str__(self):
+        """
+        Format the statistics as a human-readable string.
+        """
+        stats = self.get()
+        elapsed = stats["elapsed"] or math.inf
+        return (
+            f"{self.name}: "
+            f"{stats['messages']} msgs "
+            f"({stats['messages'] / elapsed:.1f}/s), "
+            f"{stats['objects']} objs "
+            f"({stats['objects'] / elapsed:.1f}/s), "
+            f"busy {stats['busy'] * 100 / elapsed:.0f}%, "
+            f"idle {stats['idle'] * 100 / elapsed:.0f}%, "
+            f"blocked {stats['blocked'] * 100 / elapsed:.0f}%"
+        )
+
+
+class BatchSizer:
+    """
+    A controller adjusting the maximum numbers of messages and objects to
+    load into the database in one go, so that loads take about the target
+    duration. It tracks the observed load latency per object and objects
+    per message, shrinks the limits as soon as a load takes too long, and
+    grows them (gradually) while the queue has a backlog, staying within
+    the configured hard bounds.
+    """
+    # It's OK, pylint: disable=too-many-instance-attributes
+
+    # It's OK, pylint: disable=too-many-arguments
+    # Or if you prefer, pylint: disable=too-many-positional-arguments
+    def __init__(self, msg_max, obj_max, target_duration,
+                 msg_min=1, obj_min=1, growth=2.0, smoothing=0.5):
+        """
+        Initialize the controller, starting with the limits at the hard
+        bounds.
+
+        Args:
+            msg_max:            The hard maximum of the message limit
+                                (a positive integer).
+            obj_max:            The hard maximum of the object limit (a
+                                positive integer), or infinity.
+            target_duration:    The target duration of a load, seconds.
+            msg_min:            The hard minimum of the message limit
+                                (a positive integer).
+            obj_min:            The hard minimum of the object limit (a
+                                positive integer).
+            growth:             Maximum factor to grow the limits by in a
+                                single adjustment (greater than one).
+            smoothing:          The weight of the latest observation in the
+                                exponentially-weighted averages of the load
+                                latency and message size (0 < smoothing <= 1).
+        """
+        assert isinstance(msg_max, int) and msg_max > 0
+        assert isinstance(obj_max, (int, float)) and obj_max > 0
+        assert isinstance(target_duration, (int, float)) and \
+            target_duration > 0
+        assert isinstance(msg_min, int) and 0 < msg_min <= msg_max
+        assert isinstance(obj_min, int) and 0 < obj_min <= obj_max
+        assert growth > 1
+        assert 0 < smoothing <= 1
+        self.msg_max = msg_max
+        self.obj_max = obj_max
+        self.msg_min = msg_min
+        self.obj_min = obj_min
+        self.target_duration = target_duration
+        self.growth = growth
+        self.smoothing = smoothing
+        # The lock protecting the state
+        self.lock = threading.Lock()
+        # The current message limit
+        self.msg_limit = msg_max
+        # The current object limit
+        self.obj_limit = obj_max
+        # The average load latency per object, seconds, or None if unknown
+        self.obj_latency = None
+        # The average number of objects per message, or None if unknown
+        self.msg_obj_num = None
+        # The number of adjustments made
+        self.adjustments = 0
+        # The last decision: "grow", "shrink", "hold", or None, if none yet
+        self.decision = None
+
+    def get_limits(self):
+        """
+        Get the current limits.
+
+        Returns:
+            The maximum number of messages, and the maximum number of
+            objects (possibly infinity) to load in one go.
+        """
+        with self.lock:
+            return self.msg_limit, self.obj_limit
+
+    def _average(self, average, value):
+        """
+        Add a value to an exponentially-weighted average.
+
+        Args:
+            average:    The current average, or None if no values yet.
+            value:      The value to add.
+
+        Returns:
+            The updated average.
+        """
+        if average is None:
+            return value
+        return self.smoothing * value + (1 - self.smoothing) * average
+
+    def update(self, msg_num, obj_num, duration, backlog):
+        """
+        Adjust the limits according to a completed load.
+
+        Args:
+            msg_num:    The number of messages loaded.
+            obj_num:    The number of objects loaded.
+            duration:   The duration of the load, seconds.
+            backlog:    True if more messages were likely waiting in the
+                        queue when the load batch was collected, e.g.
+                        because the batch hit the limits.
+
+        Returns:
+            The decision taken: "grow", "shrink", or "hold".
+        """
+        assert isinstance(msg_num, int) and msg_num >= 0
+        assert isinstance(obj_num, int) and obj_num >= 0
+        assert isinstance(duration, (int, float)) and duration >= 0
+        with self.lock:
+            if msg_num:
+                self.msg_obj_num = self._average(self.msg_obj_num,
+                                                 obj_num / msg_num)
+            if obj_num and duration:
+                self.obj_latency = self._average(self.obj_latency,
+                                                 duration / obj_num)
+            if self.obj_latency is None:
+                decision = "hold"
+                obj_limit = self.obj_limit
+            else:
+                # The object limit hitting the target duration
+                obj_target = self.target_duration / self.obj_latency
+                if duration > self.target_duration:
+                    decision = "shrink"
+                    obj_limit = min(obj_target, self.obj_limit)
+                elif backlog and \
+                        self.obj_limit < min(obj_target, self.obj_max):
+                    decision = "grow"
+                    obj_limit = min(obj_target,
+                                    self.obj_limit * self.growth)
+                else:
+                    decision = "hold"
+                    obj_limit = self.obj_limit
+            if decision != "hold":
+                self.obj_limit = max(min(obj_limit, self.obj_max),
+                                     self.obj_min)
+                if self.obj_limit != math.inf:
+                    self.obj_limit = int(self.obj_limit)
+                # Keep the message limit in step with the object limit
+                msg_limit = self.obj_limit / max(self.msg_obj_num or 1, 1)
+                self.msg_limit = int(max(min(msg_limit, self.msg_max),
+                                         self.msg_min))
+                self.adjustments += 1
+            self.decision = decision
+            return decision
+
+    def get_metrics(self):
+        """
+        Get the controller's metrics.
+
+        Returns:
+            A dictionary with the following keys:
+            * "msg_limit" - the current message limit,
+            * "obj_limit" - the current object limit (possibly infinity),
+            * "obj_latency" - the average load latency per object, seconds,
+              or None if unknown yet,
+            * "msg_obj_num" - the average number of objects per message, or
+              None if unknown yet,
+            * "adjustments" - the number of limit adjustments made,
+            * "decision" - the last decision ("grow", "shrink", or "hold"),
+              or None if none yet.
+        """
+        with self.lock:
+            return dict(
+                msg_limit=self.msg_limit,
+                obj_limit=self.obj_limit,
+                obj_latency=self.obj_latency,
+                msg_obj_num=self.msg_obj_num,
+                adjustments=self.adjustments,
+                decision=self.decision,
+            )
+
+    def __str__(self):
+        """
+        Format the controller's metrics as a human-readable string.
+        """
+        metrics = self.get_metrics()
+        return " ".join(f"{name}={value}" if not isinstance(value, float)
+                        else f"{name}={value:.6g}"
+                        for name, value in metrics.items())
+
+
+class Loader:
+    """
+    A pipelined loader of reports from the submission message queue into a
+    database. Each stage runs in its own thread, and passes batches of
+    messages to the next one through a bounded queue, so a slow stage
+    holds back (and doesn't overflow) the ones before it:
+
+    * pull - pulls messages from the queue through a stream (see
+      kcidb.mq.Stream), which keeps extending the leases (ACK deadlines) of
+      the messages, until they leave the pipeline,
+    * decode - decodes and validates the message data, dropping invalid
+      messages,
+    * merge - merges the decoded data into load batches, limited by
+      message and object numbers,
+    * load - loads the merged data into the database,
+    * ack - acknowledges the loaded messages, and calls the "done"
+      callback.
+    """
+    # It's OK, pylint: disable=too-many-instance-attributes
+
+    # Names of the pipeline stages, in order
+    STAGES = ("pull", "decode", "merge", "load", "ack")
+
+    # Seconds to wait on a queue between checks for an abort
+    POLL_INTERVAL = 0.1
+
+    # It's OK, pylint: disable=too-many-arguments
+    # Or if you prefer, pylint: disable=too-many-positional-arguments
+    def __init__(self, database, subscriber,
+                 msg_max=256, obj_max=math.inf, pull_timeout=10,
+                 queue_size=4, done_cb=None, load_target=None,
+                 lease_seconds=60, lease_interval=5):
+        """
+        Initialize the loader.
+
+        Args:
+            database:       The specification of the (initialized) database
+                            to load the data into. The database is
+                            connected to from the load stage's thread.
+            subscriber:     The kcidb.mq.IOSubscriber to pull the data with.
+                            Must be created with the database's I/O schema.
+            msg_max:        Maximum number of messages to load in one go
+                            (a positive integer).
+            obj_max:        Maximum number of objects to load in one go, or
+                            infinity for no limit. A single message is
+                            allowed to exceed it.
+            pull_timeout:   Seconds to wait for messages in a single pull.
+                            Also the maximum time stopping waits for the
+                            pull stage.
+            queue_size:     Maximum number of message batches waiting in
+                            each queue between stages (a positive integer).
+            done_cb:        A function to call with the loaded I/O data and
+                            the number of objects in it, after the data is
+                            loaded and its messages are acknowledged, or
+                            None to not call anything.
+            load_target:    The target duration of a load, seconds, to
+                            adjust the message and object limits for, within
+                            "msg_max" and "obj_max", or None to use those
+                            limits as is.
+            lease_seconds:  The number of seconds to extend the ACK deadline
+                            of the messages in the pipeline to, each time.
+            lease_interval: The number of seconds between the extensions.
+                            Must be less than both "lease_seconds" and the
+                            subscription's ACK deadline.
+        """
+        assert isinstance(database, str)
+        assert isinstance(subscriber, mq.IOSubscriber)
+        assert isinstance(msg_max, int) and msg_max > 0
+        assert isinstance(obj_max, (int, float)) and obj_max > 0
+        assert isinstance(pull_timeout, (int, float)) and pull_timeout > 0
+        assert isinstance(queue_size, int) and queue_size > 0
+        assert done_cb is None or callable(done_cb)
+        assert load_target is None or \
+            isinstance(load_target, (int, float)) and load_target > 0
+        assert isinstance(lease_seconds, int) and lease_seconds > 0
+        assert isinstance(lease_interval, (int, float)) and \
+            0 < lease_interval < lease_seconds
+        self.database = database
+        self.subscriber = subscriber
+        self.msg_max = msg_max
+        self.obj_max = obj_max
+        self.pull_timeout = pull_timeout
+        self.done_cb = done_cb
+        self.queue_size = queue_size
+        self.lease_seconds = lease_seconds
+        self.lease_interval = lease_interval
+        # The controller adjusting the load limits, if enabled
+        self.sizer = None if load_target is None else \
+            BatchSizer(msg_max, obj_max, load_target)
+        # The queues *before* each stage, except the first one
+        self.queues = {
+            name: queue.Queue(maxsize=queue_size)
+            for name in self.STAGES[1:]
+        }
+        # The statistics of each stage
+        self.stats = {name: StageStats(name) for name in self.STAGES}
+        # The stream pulling the messages, while running
+        self.stream = None
+        # The event set when stopping was requested
+        self.stopping = threading.Event()
+        # The event set when a stage failed
+        self.aborted = threading.Event()
+        # The exception which failed a stage, if any
+        self.error = None
+
+    def stop(self):
+        """
+        Request the loader to stop gracefully: stop pulling messages, and
+        finish processing the pulled ones. Can be called from any thread,
+        including signal handlers.
+        """
+        self.stopping.set()
+
+    def _abort(self, exc):
+        """
+        Abort the pipeline because of a stage failure.
+
+        Args:
+            exc:    The exception which failed the stage.
+        """
+        if not self.aborted.is_set():
+            self.error = exc
+            self.aborted.set()
+
+    def _get(self, name):
+        """
+        Get the next item from a stage's input queue, waiting as long as
+        necessary, and accounting the time spent waiting.
+
+        Args:
+            name:   The name of the stage to get the input item for.
+
+        Returns:
+            The input item, or _END, if the input has ended.
+
+        Raises:
+            _Aborted if the pipeline was aborted.
+        """
+        input_queue = self.queues[name]
+        start = time.monotonic()
+        try:
+            while True:
+                if self.aborted.is_set():
+                    raise _Aborted()
+                try:
+                    return input_queue.get(timeout=self.POLL_INTERVAL)
+                except queue.Empty:
+                    pass
+        finally:
+            self.stats[name].add(idle=time.monotonic() - start)
+
+    def _put(self, name, item):
+        """
+        Put an item into the queue after a stage, waiting for space as long
+        as necessary, and accounting the time spent waiting.
+
+        Args:
+            name:   The name of the stage to put the output item for.
+            item:   The item to put.
+
+        Raises:
+            _Aborted if the pipeline was aborted.
+        """
+        output_queue = self.queues[self.STAGES[self.STAGES.index(name) + 1]]
+        start = time.monotonic()
+        try:
+            while True:
+                if self.aborted.is_set():
+                    raise _Aborted()
+                try:
+                    output_queue.put(item, timeout=self.POLL_INTERVAL)
+                    return
+                except queue.Full:
+                    pass
+        finally:
+            self.stats[name].add(blocked=time.monotonic() - start)
+
+    def _pull(self):
+        """Execute the pull stage"""
+        while not self.stopping.is_set():
+            if self.aborted.is_set():
+                raise _Aborted()
+            start = time.monotonic()
+            # Take the received messages, waiting a little for the first one
+            ack_ids = []
+            messages = []
+            while len(messages) < min(self.msg_max, 256):
+                item = next(self.stream, None)
+                if item is None:
+                    break
+                ack_ids.append(item[0])
+                messages.append(item[1])
+            if not messages:
+                self.stats["pull"].add(idle=time.monotonic() - start)
+                continue
+            self.stats["pull"].add(messages=len(messages))
+            try:
+                self._put("pull", (ack_ids, messages, 0))
+            except _Aborted:
+                self.stream.nack_many(ack_ids)
+                raise
+
+    def _decode(self):
+        """Execute the decode stage"""
+        io_schema = self.subscriber.schema
+        while True:
+            item = self._get("decode")
+            if item is _END:
+                break
+            ack_ids = []
+            data_list = []
+            obj_num = 0
+            failed_ack_ids = []
+            for message in item[1]:
+                try:
+                    data = self.subscriber.decode_message(message)
+                # This is good enough for now
+                except Exception as err:  # pylint: disable=broad-except
+                    LOGGER.error("%s\nFailed decoding, ACK'ing and "
+                                 "dropping message:\n%s",
+                                 misc.format_exception_stack(err),
+                                 message.message.data)
+                    failed_ack_ids.append(message.ack_id)
+                    continue
+                ack_ids.append(message.ack_id)
+                data_list.append(data)
+                obj_num += io_schema.count(data)
+            self.stream.ack_many(failed_ack_ids)
+            self.stats["decode"].add(messages=len(item[1]), objects=obj_num)
+            if ack_ids:
+                self._put("decode", (ack_ids, data_list, obj_num))
+
+    def _merge(self):
+        """Execute the merge stage"""
+        io_schema = self.subscriber.schema
+        item = self._get("merge")
+        while item is not _END:
+            msg_limit, obj_limit = self.get_limits()
+            ack_ids = []
+            data_list = []
+            obj_num = 0
+            # Collect decoded batches while they're available and fit
+            while True:
+                ack_ids += item[0]
+                data_list += item[1]
+                obj_num += item[2]
+                if len(ack_ids) >= msg_limit or obj_num >= obj_limit:
+                    item = None
+                    break
+                try:
+                    item = self.queues["merge"].get_nowait()
+                except queue.Empty:
+                    item = None
+                    break
+                if item is _END:
+                    break
+                if len(ack_ids) + len(item[0]) > msg_limit or \
+                   obj_num + item[2] > obj_limit:
+                    break
+            data = io_schema.merge(io_schema.new(), data_list,
+                                   copy_target=False, copy_sources=False)
+            self.stats["merge"].add(messages=len(ack_ids), objects=obj_num)
+            self._put("merge", (ack_ids, data, obj_num))
+            if item is None:
+                item = self._get("merge")
+
+    def _load(self):
+        """Execute the load stage"""
+        db_client = db.Client(self.database)
+        while True:
+            item = self._get("load")
+            if item is _END:
+                break
+            ack_ids, data, obj_num = item
+            msg_limit, obj_limit = self.get_limits()
+            # There's a backlog, if the batch hit the limits, or more is
+            # waiting in the pipeline
+            backlog = len(ack_ids) >= msg_limit or obj_num >= obj_limit or \
+                not self.queues["load"].empty() or \
+                not self.queues["merge"].empty()
+            start = time.monotonic()
+            db_client.load(data)
+            duration = time.monotonic() - start
+            if self.sizer is not None:
+                decision = self.sizer.update(len(ack_ids), obj_num,
+                                             duration, backlog)
+                LOGGER.debug("Loaded %u objects in %.3fs, %s limits: %s",
+                             obj_num, duration, decision, self.sizer)
+            self.stats["load"].add(messages=len(ack_ids), objects=obj_num)
+            self._put("load", item)
+
+    def _ack(self):
+        """Execute the ack stage"""
+        while True:
+            item = self._get("ack")
+            if item is _END:
+                break
+            ack_ids, data, obj_num = item
+            self.stream.ack_many(ack_ids)
+            LOGGER.info("Loaded and ACK'ed %u objects in %u messages",
+                        obj_num, len(ack_ids))
+            if self.done_cb:
+                self.done_cb(data, obj_num)
+            self.stats["ack"].add(messages=len(ack_ids), objects=obj_num)
+
+    def _run_stage(self, name):
+        """
+        Run a pipeline stage, passing the end of input to the next stage,
+        once the stage's input ends, and aborting the pipeline, if the
+        stage fails.
+
+        Args:
+            name:   The name of the stage to run.
+        """
+        stats = self.stats[name]
+        stats.start = time.monotonic()
+        try:
+            getattr(self, "_" + name)()
+            if name != self.STAGES[-1]:
+                self._put(name, _END)
+        except _Aborted:
+            pass
+        # We report it in run()
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            LOGGER.error("Stage %r failed:\n%s",
+                         name, misc.format_exception_stack(exc))
+            self._abort(exc)
+        finally:
+            stats.stop = time.monotonic()
+
+    def get_limits(self):
+        """
+        Get the current limits of a load batch.
+
+        Returns:
+            The maximum number of messages, and the maximum number of
+            objects (possibly infinity) to load in one go.
+        """
+        if self.sizer is None:
+            return self.msg_max, self.obj_max
+        return self.sizer.get_limits()
+
+    def get_stats(self):
+        """
+        Get a snapshot of the statistics of each pipeline stage.
+
+        Returns:
+            A dictionary of stage names and dictionaries of their statistics,
+            as returned by StageStats.get().
+        """
+        return {name: stats.get() for name, stats in self.stats.items()}
+
+    def log_stats(self):
+        """
+        Log the statistics of each pipeline stage.
+        """
+        for stats in self.stats.values():
+            LOGGER.info("%s", stats)
+        if self.sizer is not None:
+            LOGGER.info("limits: %s", self.sizer)
+
+    def run(self, stats_interval=60):
+        """
+        Run the loader until stop() is called and all the pulled messages
+        are processed, or a pipeline stage fails. Messages remaining in the
+        pipeline after a failure are NACK'ed.
+
+        Args:
+            stats_interval: Seconds between logging stage statistics.
+
+        Raises:
+            The exception which failed a pipeline stage, if any.
+        """
+        assert isinstance(stats_interval, (int, float)) and \
+            stats_interval > 0
+        # Pull within the number of messages the pipeline can hold:
+        # a batch in each stage, and in each queue slot
+        self.stream = self.subscriber.stream(
+            max_messages=self.msg_max * len(self.STAGES) *
+            (self.queue_size + 1),
+            timeout=self.POLL_INTERVAL,
+            pull_timeout=self.pull_timeout,
+            lease_seconds=self.lease_seconds,
+            lease_interval=self.lease_interval,
+            decode=False,
+        )
+        try:
+            self._run(stats_interval)
+        finally:
+            # NACK the prefetched messages, and stop extending leases
+            self.stream.close()
+            self.stream = None
+
+    def _run(self, stats_interval):
+        """
+        Run the pipeline stages with the stream started, until they stop.
+
+        Args:
+            stats_interval: Seconds between logging stage statistics.
+
+        Raises:
+            The exception which failed a pipeline stage, if any.
+        """
+        threads = [
+            threading.Thread(target=self._run_stage, args=(name,),
+                             name=f"kcidb-loader-{name}", daemon=True)
+            for name in self.STAGES
+        ]
+        for thread in threads:
+            thread.start()
+        next_stats = time.monotonic() + stats_interval
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(max(min(next_stats - time.monotonic(),
+                                    stats_interval), 0))
+                if time.monotonic() >= next_stats:
+                    self.log_stats()
+                    next_stats += stats_interval
+        self.log_stats()
+
+        if self.error is not None:
+            # NACK the messages left in the pipeline
+            ack_ids = []
+            for input_queue in self.queues.values():
+                while True:
+                    try:
+                        item = input_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _END:
+                        ack_ids += item[0]
+            self.stream.nack_many(ack_ids)
+            LOGGER.debug("NACK'ed %u messages", len(ack_ids))
+            raise self.error
+
+
+def load_queue_main():
+    """Execute the kcidb-load-queue command-line tool"""
+    sys.excepthook = misc.log_and_print_excepthook
+    description = \
+        'kcidb-load-queue - Load reports from the submission message ' \
+        'queue into a database continuously, until interrupted'
+    parser = db.ArgumentParser(description=description)
+    mq.argparse_add_args(parser)
+    parser.add_argument(
+        '-s', '--subscription',
+        help='Name of the subscription to pull the reports with',
+        required=True
+    )
+    parser.add_argument(
+        '--updated-topic',
+        help='Name of the message queue topic to publish ORM patterns '
+             'matching the objects updated by loading to',
+        required=False
+    )
+    parser.add_argument(
+        '--msg-max',
+        metavar="NUMBER",
+        type=misc.non_negative_int,
+        help='Load maximum NUMBER of messages in one go. Default is 256.',
+        default=256,
+        required=False
+    )
+    parser.add_argument(
+        '--obj-max',
+        metavar="NUMBER",
+        type=misc.non_negative_int_or_inf,
+        help='Load maximum NUMBER of objects in one go, or "inf" for '
+             'infinity. Default is "inf".',
+        default=math.inf,
+        required=False
+    )
+    parser.add_argument(
+        '--pull-timeout',
+        metavar="SECONDS",
+        type=float,
+        help='Wait maximum SECONDS for messages in a single pull. '
+             'Default is 10.',
+        default=10,
+        required=False
+    )
+    parser.add_argument(
+        '--load-target',
+        metavar="SECONDS",
+        type=float,
+        help='Adjust the message and object limits, within --msg-max and '
+             '--obj-max, so loads take about SECONDS, according to the '
+             'observed load latency and queue backlog. Default is to use '
+             'fixed limits.',
+        default=None,
+        required=False
+    )
+    parser.add_argument(
+        '--queue-size',
+        metavar="NUMBER",
+        type=misc.non_negative_int,
+        help='Keep maximum NUMBER of message batches waiting between '
+             'pipeline stages. Default is 4.',
+        default=4,
+        required=False
+    )
+    parser.add_argument(
+        '--lease-seconds',
+        metavar="SECONDS",
+        type=misc.non_negative_int,
+        help='Extend the ACK deadlines of messages in the pipeline to '
+             'SECONDS each time. Default is 60.',
+        default=60,
+        required=False
+    )
+    parser.add_argument(
+        '--lease-interval',
+        metavar="SECONDS",
+        type=float,
+        help='Extend the ACK deadlines every SECONDS. Must be less than '
+             '--lease-seconds, and the subscription\'s ACK deadline. '
+             'Default is 5.',
+        default=5,
+        required=False
+    )
+    parser.add_argument(
+        '--stats-interval',
+        metavar="SECONDS",
+        type=float,
+        help='Log pipeline stage statistics every SECONDS. Default is 60.',
+        default=60,
+        required=False
+    )
+    args = parser.parse_args()
+    if args.msg_max == 0 or args.obj_max == 0 or args.queue_size == 0:
+        parser.error("--msg-max, --obj-max, and --queue-size "
+                     "must be positive")
+    if args.pull_timeout <= 0 or args.stats_interval <= 0 or \
+       args.load_target is not None and args.load_target <= 0:
+        parser.error("--pull-timeout, --stats-interval, and --load-target "
+                     "must be positive")
+    if not 0 < args.lease_interval < args.lease_seconds:
+        parser.error("--lease-interval must be positive, and less than "
+                     "--lease-seconds")
+
+    db_client = db.Client(args.database)
+    if not db_client.is_initialized():
+        raise Exception(f"Database {args.database!r} is not initialized")
+    subscriber = mq.IOSubscriber(args.project, args.topic,
+                                 args.subscription,
+                                 schema=db_client.get_schema()[1])
+    publisher = \
+        mq.ORMPatternPublisher(args.project, args.updated_topic) \
+        if args.updated_topic else None
+
+    def publish_updates(data, obj_num):
+        pattern_set = get_updated_patterns(data)
+        if pattern_set:
+            publisher.publish_iter(publisher.split_data(pattern_set))
+            LOGGER.info("Published updates made by %u loaded objects",
+                        obj_num)
+
+    loader = Loader(args.database, subscriber,
+                    msg_max=args.msg_max, obj_max=args.obj_max,
+                    pull_timeout=args.pull_timeout,
+                    queue_size=args.queue_size,
+                    done_cb=publish_updates if publisher else None,
+                    load_target=args.load_target,
+                    lease_seconds=args.lease_seconds,
+                    lease_interval=args.lease_interval)
+    # Stop gracefully on interrupts
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: loader.stop())
+    loader.run(stats_interval=args.stats_interval)
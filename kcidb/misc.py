@@ -10,8 +10,16 @@ import argparse
 import logging
 import json
 import datetime
+import collections
+import contextlib
+import time
+import gzip
+import zlib
+from io import TextIOWrapper
+from concurrent.futures import ProcessPoolExecutor
 from textwrap import indent
 from importlib import metadata
+import zstandard
 import dateutil
 import dateutil.relativedelta
 import dateutil.parser
@@ -39,6 +47,16 @@ LOGGING_LEVEL_MAP = {
                        key=lambda i: i[1], reverse=True)
 }
 
+# A dictionary of names of supported compression formats, and the "magic"
+# byte strings their streams start with
+COMPRESSION_MAGICS = dict(
+    gzip=b"\x1f\x8b",
+    zstd=b"\x28\xb5\x2f\xfd",
+)
+
+# A tuple of names of supported compression formats
+COMPRESSIONS = tuple(COMPRESSION_MAGICS)
+
 # Check light assertions only, if True
 LIGHT_ASSERTS = not os.environ.get("KCIDB_HEAVY_ASSERTS", "")
 
@@ -288,6 +306,13 @@ def argparse_output_add_args(parser):
         default=4,
         required=False
     )
+    parser.add_argument(
+        '--compress',
+        choices=COMPRESSIONS,
+        help='Compress JSON output with the specified format.',
+        default=None,
+        required=False
+    )
 
 
 def argparse_input_output_add_args(parser):
@@ -301,6 +326,25 @@ def argparse_input_output_add_args(parser):
     argparse_output_add_args(parser)
 
 
+def argparse_jobs_add_args(parser):
+    """
+    Add parallel processing arguments to a command-line argument parser.
+
+    Args:
+        parser: The parser to add arguments to.
+    """
+    parser.add_argument(
+        '-j', '--jobs',
+        metavar="NUMBER",
+        type=non_negative_int,
+        help='Process input values using NUMBER of parallel processes, '
+             'or one process per CPU, if zero. Default is 1, meaning '
+             'process serially, without starting any processes.',
+        default=1,
+        required=False
+    )
+
+
 class InputArgumentParser(ArgumentParser):
     """
     Command-line argument parser for tools inputting JSON.
@@ -430,9 +474,176 @@ def argparse_schema_add_args(parser, version_verb):
     )
 
 
-def json_load_stream_fd(stream_fd, seq=False, chunk_size=4*1024*1024):
+# The JSON escape sequence for the NUL character (the only way it can appear
+# in valid JSON text)
+JSON_NUL_ESCAPE = b"\\u0000"
+
+
+def json_reject_nul_chars(data):
+    """
+    Raise an exception if a string in JSON data (including object keys)
+    contains a NUL character. Walks the whole data, so should only be used
+    after the encoded data was found to contain a NUL escape.
+
+    Args:
+        data:   The JSON data to check.
+
+    Returns:
+        The checked (but unchanged) data.
+
+    Raises:
+        An exception if a string in the data contains a NUL character.
+    """
+    if isinstance(data, dict):
+        for key, value in data.items():
+            json_reject_nul_chars(key)
+            json_reject_nul_chars(value)
+    elif isinstance(data, list):
+        for value in data:
+            json_reject_nul_chars(value)
+    elif isinstance(data, str):
+        if '\0' in data:
+            raise Exception(f"NUL character in string {data!r}")
+    return data
+
+
+def json_loads_reject_nul(data_bytes):
+    """
+    Load a JSON value from UTF-8 bytes, rejecting NUL characters in its
+    strings. Only walks the loaded value if the bytes contain a NUL escape.
+
+    Args:
+        data_bytes: The bytes containing the UTF-8-encoded JSON text.
+
+    Returns:
+        The loaded JSON value.
+
+    Raises:
+        An exception if the text is not valid JSON, or a string in the value
+        contains a NUL character.
+    """
+    assert isinstance(data_bytes, bytes)
+    data = json.loads(data_bytes.decode())
+    if JSON_NUL_ESCAPE in data_bytes:
+        # Produce the diagnostics, or ignore escaped backslashes
+        json_reject_nul_chars(data)
+    return data
+
+
+def _decompressor_new(compression):
+    """
+    Create a decompressor object for a single gzip member or zstd frame.
+
+    Args:
+        compression:    The name of the compression format.
+
+    Returns:
+        The decompressor object, with the "decompress()" method, and the
+        "eof" and "unused_data" attributes.
+    """
+    assert compression in COMPRESSIONS
+    if compression == "gzip":
+        return zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def decompress_iter(chunk_iter):
+    """
+    Auto-detect the compression format of a stream of byte chunks, and
+    decompress it. Streams without a recognized compression format are
+    passed through unchanged. Concatenated gzip members and zstd frames are
+    decompressed as a single stream.
+
+    Args:
+        chunk_iter: An iterator returning byte chunks of the (possibly
+                    compressed) stream.
+
+    Returns:
+        An iterator returning byte chunks of the decompressed stream.
+
+    Raises:
+        An exception if the compressed stream is truncated.
+    """
+    chunk_iter = iter(chunk_iter)
+    # Accumulate enough of the stream start to recognize the format
+    magic_len = max(map(len, COMPRESSION_MAGICS.values()))
+    head = b""
+    for chunk in chunk_iter:
+        head += chunk
+        if len(head) >= magic_len:
+            break
+    compression = None
+    for name, magic in COMPRESSION_MAGICS.items():
+        if head.startswith(magic):
+            compression = name
+            break
+    if compression is None:
+        if head:
+            yield head
+        yield from chunk_iter
+        return
+
+    decompressor = _decompressor_new(compression)
+    for chunk in itertools.chain((head,), chunk_iter):
+        while chunk:
+            # Start a new member/frame, if the previous one ended
+            if decompressor.eof:
+                decompressor = _decompressor_new(compression)
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            chunk = decompressor.unused_data if decompressor.eof else b""
+    if not decompressor.eof:
+        raise Exception(f"Truncated {compression} input")
+
+
+def compress(data, compression):
+    """
+    Compress a byte string with the specified format.
+
+    Args:
+        data:           The byte string to compress.
+        compression:    The name of the compression format (one of
+                        COMPRESSIONS).
+
+    Returns:
+        The compressed byte string.
+    """
+    assert isinstance(data, bytes)
+    assert compression in COMPRESSIONS
+    if compression == "gzip":
+        return gzip.compress(data)
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def decompress(data, compression):
+    """
+    Decompress a byte string compressed with the specified format.
+
+    Args:
+        data:           The byte string to decompress.
+        compression:    The name of the compression format (one of
+                        COMPRESSIONS).
+
+    Returns:
+        The decompressed byte string.
+
+    Raises:
+        An exception if the data is not compressed with the specified
+        format, or is truncated.
+    """
+    assert isinstance(data, bytes)
+    assert compression in COMPRESSIONS
+    if not data.startswith(COMPRESSION_MAGICS[compression]):
+        raise Exception(f"Invalid {compression} input")
+    return b"".join(decompress_iter((data,)))
+
+
+def json_load_stream_fd(stream_fd, seq=False, chunk_size=4*1024*1024,
+                        reject_nul=False):
     """
     Load a series of JSON values from a stream file descriptor.
+    Decompress the stream, if it's compressed with a supported format.
 
     Args:
         stream_fd:  The file descriptor for the stream to read.
@@ -440,10 +651,16 @@ def json_load_stream_fd(stream_fd, seq=False, chunk_size=4*1024*1024):
                     input, matching RFC 7464 and the "application/json-seq"
                     media type.
         chunk_size: Maximum size of chunks to read from the file, bytes.
+        reject_nul: If true, raise an exception when loading a value with a
+                    string containing a NUL character. The values are only
+                    walked after a NUL escape was found in the read input.
 
     Returns:
         An iterator returning loaded JSON values.
     """
+    # True if a NUL escape was found in the input read so far
+    nul_found = False
+
     def read_chunk():
         while True:
             chunk = os.read(stream_fd, chunk_size)
@@ -452,7 +669,28 @@ def json_load_stream_fd(stream_fd, seq=False, chunk_size=4*1024*1024):
             else:
                 break
 
-    return jq.parse_json(text_iter=read_chunk(), seq=seq)
+    def scan_chunk(chunk_iter):
+        nonlocal nul_found
+        # The maximum length of an escape prefix left at the end of input
+        tail_len = len(JSON_NUL_ESCAPE) - 1
+        # The end of the input read so far, possibly holding an escape prefix
+        tail = b""
+        for chunk in chunk_iter:
+            if reject_nul and not nul_found:
+                nul_found = JSON_NUL_ESCAPE in chunk or \
+                    JSON_NUL_ESCAPE in tail + chunk[:tail_len]
+                tail = (tail + chunk[-tail_len:])[-tail_len:]
+            yield chunk
+
+    def check_values(values):
+        for value in values:
+            # Any value yielded has been read (and scanned) completely
+            yield json_reject_nul_chars(value) if nul_found else value
+
+    values = jq.parse_json(
+        text_iter=scan_chunk(decompress_iter(read_chunk())), seq=seq
+    )
+    return check_values(values) if reject_nul else values
 
 
 # It's OK, pylint: disable=redefined-outer-name
@@ -475,7 +713,7 @@ def json_dump(value, fp, indent=0, seq=False):
     fp.write("\n")
 
 
-def json_dump_stream(value_iter, fp, indent=0, seq=False):
+def json_dump_stream(value_iter, fp, indent=0, seq=False, flush_interval=1):
     """
     Dump a series of JSON values to a file, each followed by a newline.
 
@@ -488,13 +726,64 @@ def json_dump_stream(value_iter, fp, indent=0, seq=False):
         seq:            Prefix each value with an RS character, to make output
                         comply with RFC 7464 and the "application/json-seq"
                         media type.
+        flush_interval: Minimum number of seconds between flushes of the
+                        file after dumping a value, or zero to flush after
+                        each value. The file is always flushed after the
+                        last value.
     """
     # "fp" is OK, pylint: disable=invalid-name
-    for value in value_iter:
-        json_dump(value, fp, indent=indent, seq=seq)
+    assert isinstance(flush_interval, (int, float)) and flush_interval >= 0
+    flushed = time.monotonic()
+    try:
+        for value in value_iter:
+            json_dump(value, fp, indent=indent, seq=seq)
+            if time.monotonic() - flushed >= flush_interval:
+                fp.flush()
+                flushed = time.monotonic()
+    finally:
         fp.flush()
 
 
+@contextlib.contextmanager
+def json_output_open(compress=None, buffer_size=1024*1024):
+    """
+    Create a context opening the standard output for (large-buffered and
+    possibly compressed) JSON output, flushing and finishing the output on
+    exit. The standard output itself is not closed.
+
+    Args:
+        compress:       The name of the compression format to compress the
+                        output with (one of COMPRESSIONS), or None to output
+                        uncompressed text.
+        buffer_size:    The size of the output buffer, bytes.
+
+    Returns:
+        The context yielding a text file-like object for the output.
+    """
+    assert compress is None or compress in COMPRESSIONS
+    assert isinstance(buffer_size, int) and buffer_size > 0
+    sys.stdout.flush()
+    # Don't close stdout, pylint: disable=consider-using-with
+    raw = open(sys.stdout.fileno(), "wb", buffering=buffer_size,
+               closefd=False)
+    if compress == "gzip":
+        binary = gzip.GzipFile(fileobj=raw, mode="wb")
+    elif compress == "zstd":
+        binary = zstandard.ZstdCompressor().stream_writer(raw,
+                                                          closefd=False)
+    else:
+        binary = raw
+    text = TextIOWrapper(binary, encoding="utf-8")
+    try:
+        yield text
+    finally:
+        text.flush()
+        text.detach()
+        if binary is not raw:
+            binary.close()
+        raw.close()
+
+
 def get_secret(project_id, secret_id):
     """
     Get the latest version of a secret from Google Secret Manager.
@@ -515,6 +804,48 @@ def get_secret(project_id, secret_id):
     ).payload.data.decode()
 
 
+def parallel_map(func, iterable, jobs=1, max_pending=None):
+    """
+    Apply a function to every item of an iterable using a pool of processes,
+    yielding results in the order of the items. Only keeps a limited number
+    of items submitted to the pool at a time.
+
+    Args:
+        func:           The function to apply. Must be picklable, along with
+                        the items and the results.
+        iterable:       The iterable returning the items to apply the
+                        function to.
+        jobs:           The number of processes to use, or zero to use one
+                        per CPU. If one, apply the function in the current
+                        process instead.
+        max_pending:    Maximum number of items submitted to the pool and
+                        not yet yielded, or None to use twice the number of
+                        processes.
+
+    Returns:
+        An iterator returning the function results.
+    """
+    assert callable(func)
+    assert isinstance(jobs, int) and jobs >= 0
+    assert max_pending is None or \
+        isinstance(max_pending, int) and max_pending > 0
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs == 1:
+        yield from map(func, iterable)
+        return
+    if max_pending is None:
+        max_pending = jobs * 2
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = collections.deque()
+        for item in iterable:
+            if len(futures) >= max_pending:
+                yield futures.popleft().result()
+            futures.append(executor.submit(func, item))
+        while futures:
+            yield futures.popleft().result()
+
+
 def merge_dicts(*args, **kwargs):
     """
     Merge dictionaries together.
@@ -1,6 +1,10 @@
 """Kernel CI message queue"""
 
+import os
 import math
+import time
+import queue
+import concurrent.futures
 import datetime
 import json
 import logging
@@ -17,6 +21,7 @@ import kcidb.io as io
 import kcidb.orm
 from kcidb import misc
 from kcidb.misc import LIGHT_ASSERTS
+from kcidb.mq import sqlite
 
 
 # TODO: Break down the module along data type lines, but meanwhile:
@@ -26,10 +31,53 @@ from kcidb.misc import LIGHT_ASSERTS
 # Module's logger
 LOGGER = logging.getLogger(__name__)
 
+# Name of the message attribute specifying the compression format of the
+# message data, if compressed
+COMPRESSION_ATTR = "compression"
+
+# Name of the environment variable specifying the SQLite database file to
+# keep the message queue in (using kcidb.mq.sqlite clients), instead of
+# Google Pub/Sub, unless clients are specified explicitly
+SQLITE_ENV = "KCIDB_MQ_SQLITE"
+
+# Maximum number of ACK IDs to send in a single (N)ACK request,
+# staying within the Pub/Sub request size limit
+ACK_IDS_MAX = 2500
+
+
+def decompress(data, attributes):
+    """
+    Decompress message data, if the message attributes say it's compressed.
+
+    Args:
+        data:       The message data (bytes) to decompress.
+        attributes: A dictionary of the message attributes.
+
+    Returns:
+        The (decompressed) message data.
+
+    Raises:
+        An exception in case the compression format is not supported,
+        or decompression failed.
+    """
+    assert isinstance(data, bytes)
+    compression = (attributes or {}).get(COMPRESSION_ATTR)
+    if not compression:
+        return data
+    if compression not in misc.COMPRESSIONS:
+        raise Exception(
+            f"Unsupported message compression {compression!r}"
+        )
+    return misc.decompress(data, compression)
+
 
 class Publisher(ABC):
     """Abstract message queue publisher"""
 
+    # Maximum size of message data, leaving room within the
+    # 10MB Pub/Sub message size limit
+    MAX_MESSAGE_SIZE = 9 * 1024 * 1024
+
     @abstractmethod
     def encode_data(self, data):
         """
@@ -45,7 +93,8 @@ class Publisher(ABC):
             An exception in case data encoding failed.
         """
 
-    def __init__(self, project_id, topic_name, client=None):
+    def __init__(self, project_id, topic_name, client=None,
+                 compression=None):
         """
         Initialize a message queue publisher.
 
@@ -53,11 +102,23 @@ class Publisher(ABC):
             project_id:         ID of the Google Cloud project to which the
                                 message queue belongs.
             topic_name:         Name of the message queue topic to publish to.
-            client:             The Google Pub/Sub PublisherClient to use, or
+            client:             The Google Pub/Sub PublisherClient (or a
+                                kcidb.mq.sqlite.PublisherClient) to use, or
                                 None to create and use one with default
-                                settings.
-        """
-        assert client is None or isinstance(client, pubsub.PublisherClient)
+                                settings. A SQLite one is created, if the
+                                SQLITE_ENV environment variable is set.
+            compression:        The name of the format to compress message
+                                data with (one of misc.COMPRESSIONS), or None
+                                to not compress. Subscribers decompress the
+                                data automatically.
+        """
+        assert client is None or isinstance(
+            client, (pubsub.PublisherClient, sqlite.PublisherClient)
+        )
+        assert compression is None or compression in misc.COMPRESSIONS
+        self.compression = compression
+        if client is None and os.environ.get(SQLITE_ENV):
+            client = sqlite.PublisherClient(os.environ[SQLITE_ENV])
         limit_exceeded_behavior = pubsub.types.LimitExceededBehavior.BLOCK
         self.client = client or pubsub.PublisherClient(
             publisher_options=pubsub.types.PublisherOptions(
@@ -93,8 +154,27 @@ class Publisher(ABC):
             A "future" representing the publishing result, returning the
             publishing ID string.
         """
+        return self._publish_message(self.encode_data(data))
+
+    def _publish_message(self, message_data):
+        """
+        Publish encoded message data to the message queue in the future,
+        compressing it, if requested.
+
+        Args:
+            message_data:   The encoded message data to publish.
+
+        Returns:
+            A "future" representing the publishing result, returning the
+            publishing ID string.
+        """
+        assert isinstance(message_data, bytes)
+        attrs = {}
+        if self.compression:
+            message_data = misc.compress(message_data, self.compression)
+            attrs[COMPRESSION_ATTR] = self.compression
         return self.client.publish(topic=self.topic_path,
-                                   data=self.encode_data(data))
+                                   data=message_data, **attrs)
 
     def publish(self, data):
         """
@@ -107,7 +187,15 @@ class Publisher(ABC):
         Returns:
             Publishing ID string.
         """
-        return self.future_publish(data).result()
+        future = self.future_publish(data)
+        self.flush()
+        return future.result()
+
+    def flush(self):
+        """
+        Start publishing any data held back by the publisher, so that
+        futures returned by future_publish() for it could complete.
+        """
 
     def publish_iter(self, data_iter, done_cb=None):
         """
@@ -149,6 +237,8 @@ class Publisher(ABC):
                     futures.append(future)
                 future.add_done_callback(done)
         finally:
+            # Publish any held-back data
+            self.flush()
             # Grab remaining futures
             remaining_futures = []
             with futures_lock:
@@ -191,11 +281,17 @@ class Subscriber(ABC):
             topic_name:         Name of the message queue topic to subscribe
                                 to.
             subscription_name:  Name of the subscription to use.
-            client:             The Google Pub/Sub SubscriberClient to use, or
+            client:             The Google Pub/Sub SubscriberClient (or a
+                                kcidb.mq.sqlite.SubscriberClient) to use, or
                                 None to create and use one with default
-                                settings.
+                                settings. A SQLite one is created, if the
+                                SQLITE_ENV environment variable is set.
         """
-        assert client is None or isinstance(client, pubsub.SubscriberClient)
+        assert client is None or isinstance(
+            client, (pubsub.SubscriberClient, sqlite.SubscriberClient)
+        )
+        if client is None and os.environ.get(SQLITE_ENV):
+            client = sqlite.SubscriberClient(os.environ[SQLITE_ENV])
         self.client = client or pubsub.SubscriberClient()
         self.subscription_path = \
             self.client.subscription_path(project_id, subscription_name)
@@ -214,6 +310,73 @@ class Subscriber(ABC):
         """
         self.client.delete_subscription(subscription=self.subscription_path)
 
+    @staticmethod
+    def _decompress(message):
+        """
+        Decompress message data, if the message says it's compressed.
+
+        Args:
+            message:    The message (pubsub.types.PubsubMessage) to
+                        decompress the data of.
+
+        Returns:
+            The (decompressed) message data.
+
+        Raises:
+            An exception in case the compression format is not supported,
+            or decompression failed.
+        """
+        return decompress(message.data, message.attributes)
+
+    def pull_messages(self, max_num=256, timeout=3600):
+        """
+        Pull a batch of raw messages from the message queue with a single
+        request, without decoding them.
+
+        Args:
+            max_num:    Maximum number of messages to pull (a positive
+                        integer).
+            timeout:    The number of seconds to wait for the messages.
+
+        Returns:
+            A list of received messages (pubsub.types.ReceivedMessage), with
+            "ack_id" and "message" attributes. Possibly empty, if the
+            timeout expired. Decode their data with decode_message().
+        """
+        assert isinstance(max_num, int) and max_num > 0
+        assert isinstance(timeout, (int, float)) and timeout >= 0
+        LOGGER.debug("Pulling <= %u messages, with timeout %us...",
+                     max_num, timeout)
+        try:
+            response = self.client.pull(
+                subscription=self.subscription_path,
+                max_messages=max_num,
+                timeout=timeout
+            )
+        except DeadlineExceeded:
+            LOGGER.debug("Deadline exceeded")
+            return []
+        messages = list(response.received_messages)
+        LOGGER.debug("Pulled %u messages", len(messages))
+        return messages
+
+    def decode_message(self, message):
+        """
+        Decode the data of a raw received message, decompressing it first,
+        if necessary.
+
+        Args:
+            message:    The received message (pubsub.types.ReceivedMessage)
+                        to decode the data of.
+
+        Returns:
+            The decoded data.
+
+        Raises:
+            An exception in case data decoding failed.
+        """
+        return self.decode_data(self._decompress(message.message))
+
     def pull_iter(self, max_num=math.inf, timeout=math.inf):
         """
         Create a generator iterator pulling published data from the message
@@ -253,31 +416,21 @@ class Subscriber(ABC):
                 LOGGER.debug("Ran out of time, stopping pulling")
                 break
 
-            # Try getting messages
-            try:
-                # Cap messages/timeout to something PubSub API can handle
-                pull_max_messages = int(min(max_num - received_num, 256))
-                pull_timeout = min(timeout - elapsed_seconds, 3600)
-                LOGGER.debug("Pulling <= %u messages, "
-                             "with timeout %us...",
-                             pull_max_messages, pull_timeout)
-                response = self.client.pull(
-                    subscription=self.subscription_path,
-                    max_messages=pull_max_messages,
-                    timeout=pull_timeout
-                )
-                messages = response.received_messages
-                LOGGER.debug("Pulled %u messages", len(messages))
-            except DeadlineExceeded:
-                LOGGER.debug("Deadline exceeded")
-                messages = ()
+            # Try getting messages,
+            # capping messages/timeout to something PubSub API can handle
+            messages = self.pull_messages(
+                max_num=int(min(max_num - received_num, 256)),
+                timeout=min(timeout - elapsed_seconds, 3600)
+            )
 
             # Yield received message data
             i = 0
+            # ACK IDs of messages which failed decoding
+            failed_ack_ids = []
             try:
                 for i, message in enumerate(messages):
                     try:
-                        data = self.decode_data(message.message.data)
+                        data = self.decode_message(message)
                     # This is good enough for now,
                     # pylint: disable=broad-except
                     except Exception as err:
@@ -285,20 +438,18 @@ class Subscriber(ABC):
                                      "dropping message:\n%s",
                                      misc.format_exception_stack(err),
                                      message.message.data)
-                        self.ack(message.ack_id)
+                        failed_ack_ids.append(message.ack_id)
                         continue
                     received_num += 1
                     yield (message.ack_id, data)
             finally:
+                # Drop messages which failed decoding
+                self.ack_many(failed_ack_ids)
                 # Skip the last-processed message
                 i += 1
                 # NACK unprocessed messages, if any
                 if i < len(messages):
-                    self.client.modify_ack_deadline(
-                        subscription=self.subscription_path,
-                        ack_ids=[m.ack_id for m in messages[i:]],
-                        ack_deadline_seconds=0
-                    )
+                    self.nack_many([m.ack_id for m in messages[i:]])
                     LOGGER.debug("NACK'ed %s messages", len(messages) - i)
 
     def pull(self, max_num=1, timeout=math.inf):
@@ -332,8 +483,325 @@ class Subscriber(ABC):
         Args:
             ack_id: The ID received with the data to be acknowledged.
         """
-        self.client.acknowledge(subscription=self.subscription_path,
-                                ack_ids=[ack_id])
+        self.ack_many([ack_id])
+
+    def ack_many(self, ack_ids):
+        """
+        Acknowledge reception of multiple data, in as few requests as
+        possible.
+
+        Args:
+            ack_ids:    An iterable of IDs received with the data to be
+                        acknowledged.
+        """
+        for chunk in misc.isliced(ack_ids, ACK_IDS_MAX):
+            self.client.acknowledge(subscription=self.subscription_path,
+                                    ack_ids=list(chunk))
+
+    def nack(self, ack_id):
+        """
+        Signal data wasn't received.
+
+        Args:
+            ack_id: The ID received with the data to be marked not received.
+        """
+        self.nack_many([ack_id])
+
+    def nack_many(self, ack_ids):
+        """
+        Signal multiple data weren't received, in as few requests as
+        possible.
+
+        Args:
+            ack_ids:    An iterable of IDs received with the data to be
+                        marked not received.
+        """
+        self.modify_ack_deadline_many(ack_ids, 0)
+
+    def modify_ack_deadline_many(self, ack_ids, seconds):
+        """
+        Set the deadline for acknowledging reception of multiple data, in
+        as few requests as possible.
+
+        Args:
+            ack_ids:    An iterable of IDs received with the data to modify
+                        the deadline for.
+            seconds:    The new deadline, seconds from now. Zero to mark the
+                        data not received.
+        """
+        assert isinstance(seconds, int) and seconds >= 0
+        for chunk in misc.isliced(ack_ids, ACK_IDS_MAX):
+            self.client.modify_ack_deadline(
+                subscription=self.subscription_path,
+                ack_ids=list(chunk),
+                ack_deadline_seconds=seconds
+            )
+
+    def stream(self, **kwargs):
+        """
+        Start a streaming pull of published data from the message queue,
+        prefetching it in the background within flow control limits, and
+        keeping it leased until acknowledged. Close the returned stream
+        after use, or use it as a context manager.
+
+        Args:
+            kwargs: The keyword arguments to initialize the Stream with.
+
+        Returns:
+            The started stream (Stream).
+        """
+        return Stream(self, **kwargs)
+
+
+# The marker of the end of streamed messages
+_STREAM_END = object()
+
+
+class Stream:
+    """
+    A streaming pull from a message queue subscription: an iterator
+    returning received messages, prefetched by a background thread within
+    flow control limits. The leases (ACK deadlines) of "outstanding"
+    messages - received and not (N)ACK'ed through the stream yet - are
+    extended in the background, so they could be processed for as long as
+    necessary.
+    """
+
+    # It's OK, pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-arguments
+    def __init__(self, subscriber, *, max_messages=1000,
+                 max_bytes=100 * 1024 * 1024, timeout=math.inf,
+                 pull_timeout=10, lease_seconds=60, lease_interval=5,
+                 max_lease=3600, decode=True):
+        """
+        Initialize and start the stream.
+
+        Args:
+            subscriber:     The subscriber (Subscriber) to pull and decode
+                            messages with.
+            max_messages:   Maximum number of outstanding messages. No more
+                            messages are pulled until some are (N)ACK'ed.
+            max_bytes:      Maximum total size of data of outstanding
+                            messages, bytes. A single pull can overshoot it.
+            timeout:        Maximum number of seconds to wait for the next
+                            message when iterating, before stopping
+                            iteration, or infinity to wait forever.
+            pull_timeout:   Maximum number of seconds to wait for messages
+                            with each pull request. Also limits the time
+                            it takes to stop pulling.
+            lease_seconds:  The number of seconds to extend the ACK deadline
+                            of outstanding messages to, each time.
+            lease_interval: The number of seconds between the extensions.
+                            Must be less than both "lease_seconds" and the
+                            subscription's ACK deadline.
+            max_lease:      Maximum number of seconds to keep extending the
+                            lease of a message for. The message stops being
+                            outstanding afterwards.
+            decode:         True if the messages should be decoded before
+                            being returned, false if the raw received
+                            messages should be returned instead, for
+                            decoding with the subscriber's decode_message().
+        """
+        assert isinstance(subscriber, Subscriber)
+        assert isinstance(max_messages, int) and max_messages > 0
+        assert isinstance(max_bytes, int) and max_bytes > 0
+        assert isinstance(timeout, (int, float)) and timeout >= 0
+        assert isinstance(pull_timeout, (int, float)) and pull_timeout > 0
+        assert isinstance(lease_seconds, int) and lease_seconds > 0
+        assert isinstance(lease_interval, (int, float)) and \
+            0 < lease_interval < lease_seconds
+        assert isinstance(max_lease, (int, float)) and max_lease > 0
+        assert isinstance(decode, bool)
+        self.subscriber = subscriber
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.pull_timeout = pull_timeout
+        self.lease_seconds = lease_seconds
+        self.lease_interval = lease_interval
+        self.max_lease = max_lease
+        self.decode = decode
+        # The condition protecting, and signaling changes in, the
+        # outstanding messages
+        self.cond = threading.Condition()
+        # A dictionary of ACK IDs of outstanding messages, and tuples of
+        # their data sizes and (monotonic) times they were received
+        self.outstanding = {}
+        # The total data size of outstanding messages
+        self.outstanding_bytes = 0
+        # The queue of received and decoded messages,
+        # ended with _STREAM_END when pulling stops
+        self.queue = queue.Queue()
+        # The event signaling the stream is being closed
+        self.stopped = threading.Event()
+        # The exception pulling failed with, if any
+        self.error = None
+        self.threads = [
+            threading.Thread(target=self._pull, name="stream-pull",
+                             daemon=True),
+            threading.Thread(target=self._lease, name="stream-lease",
+                             daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def _pull(self):
+        """
+        Pull and decode messages into the queue, while within flow control
+        limits, until stopped, or failed.
+        """
+        try:
+            while True:
+                with self.cond:
+                    while not self.stopped.is_set() and (
+                        len(self.outstanding) >= self.max_messages or
+                        self.outstanding_bytes >= self.max_bytes
+                    ):
+                        self.cond.wait()
+                    if self.stopped.is_set():
+                        break
+                    max_num = min(self.max_messages - len(self.outstanding),
+                                  256)
+                messages = self.subscriber.pull_messages(
+                    max_num=max_num, timeout=self.pull_timeout
+                )
+                received = time.monotonic()
+                with self.cond:
+                    for message in messages:
+                        size = len(message.message.data)
+                        self.outstanding[message.ack_id] = (size, received)
+                        self.outstanding_bytes += size
+                for message in messages:
+                    if not self.decode:
+                        self.queue.put((message.ack_id, message))
+                        continue
+                    try:
+                        data = self.subscriber.decode_message(message)
+                    # This is good enough for now
+                    except Exception as err:  # pylint: disable=broad-except
+                        LOGGER.error("%s\nFailed decoding, ACK'ing and "
+                                     "dropping message:\n%s",
+                                     misc.format_exception_stack(err),
+                                     message.message.data)
+                        self.ack_many([message.ack_id])
+                        continue
+                    self.queue.put((message.ack_id, data))
+        # Report any failure to the consumer
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            LOGGER.error("Streaming pull failed:\n%s",
+                         misc.format_exception_stack(exc))
+            self.error = exc
+        finally:
+            self.queue.put(_STREAM_END)
+
+    def _lease(self):
+        """
+        Extend the leases of outstanding messages periodically, until
+        stopped, dropping messages leased for too long.
+        """
+        while not self.stopped.wait(self.lease_interval):
+            now = time.monotonic()
+            with self.cond:
+                expired_ack_ids = [
+                    ack_id for ack_id, (_, received) in
+                    self.outstanding.items()
+                    if now - received >= self.max_lease
+                ]
+                ack_ids = [
+                    ack_id for ack_id in self.outstanding
+                    if ack_id not in expired_ack_ids
+                ]
+            if expired_ack_ids:
+                LOGGER.warning("Dropping %u messages leased for over %ss",
+                               len(expired_ack_ids), self.max_lease)
+                self._release(expired_ack_ids)
+            if not ack_ids:
+                continue
+            LOGGER.debug("Extending leases of %u messages", len(ack_ids))
+            try:
+                self.subscriber.modify_ack_deadline_many(ack_ids,
+                                                         self.lease_seconds)
+            # Retry with the next extension
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                LOGGER.warning("Failed extending leases:\n%s",
+                               misc.format_exception_stack(exc))
+
+    def _release(self, ack_ids):
+        """
+        Stop considering messages outstanding, letting more to be pulled.
+
+        Args:
+            ack_ids:    An iterable of ACK IDs of the messages to release.
+        """
+        with self.cond:
+            for ack_id in ack_ids:
+                size, _ = self.outstanding.pop(ack_id, (0, None))
+                self.outstanding_bytes -= size
+            self.cond.notify_all()
+
+    def get_outstanding(self):
+        """
+        Get the amount of outstanding messages.
+
+        Returns:
+            The number of outstanding messages, and the total size of their
+            data, bytes.
+        """
+        with self.cond:
+            return len(self.outstanding), self.outstanding_bytes
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """
+        Get the next received message, waiting for it for the stream's
+        timeout at most.
+
+        Returns:
+            A tuple with two items:
+            * The ID to use when acknowledging the reception of the data.
+            * The decoded data from the message queue.
+
+        Raises:
+            StopIteration if the timeout expired, or the stream is closed.
+            An exception the pulling failed with, if it did.
+        """
+        try:
+            item = self.queue.get(
+                timeout=None if self.timeout == math.inf else self.timeout
+            )
+        except queue.Empty:
+            raise StopIteration from None
+        if item is _STREAM_END:
+            # Keep the iteration ended
+            self.queue.put(_STREAM_END)
+            if self.error is not None:
+                raise self.error
+            raise StopIteration
+        return item
+
+    def ack(self, ack_id):
+        """
+        Acknowledge reception of data.
+
+        Args:
+            ack_id: The ID received with the data to be acknowledged.
+        """
+        self.ack_many([ack_id])
+
+    def ack_many(self, ack_ids):
+        """
+        Acknowledge reception of multiple data, and stop extending their
+        leases.
+
+        Args:
+            ack_ids:    An iterable of IDs received with the data to be
+                        acknowledged.
+        """
+        ack_ids = list(ack_ids)
+        self.subscriber.ack_many(ack_ids)
+        self._release(ack_ids)
 
     def nack(self, ack_id):
         """
@@ -342,9 +810,49 @@ class Subscriber(ABC):
         Args:
             ack_id: The ID received with the data to be marked not received.
         """
-        self.client.modify_ack_deadline(subscription=self.subscription_path,
-                                        ack_ids=[ack_id],
-                                        ack_deadline_seconds=0)
+        self.nack_many([ack_id])
+
+    def nack_many(self, ack_ids):
+        """
+        Signal multiple data weren't received, and stop extending their
+        leases.
+
+        Args:
+            ack_ids:    An iterable of IDs received with the data to be
+                        marked not received.
+        """
+        ack_ids = list(ack_ids)
+        self.subscriber.nack_many(ack_ids)
+        self._release(ack_ids)
+
+    def close(self):
+        """
+        Stop pulling, and extending leases, and NACK the prefetched
+        messages which weren't returned yet. Messages already returned
+        should still be (N)ACK'ed, but their leases won't be extended.
+        """
+        self.stopped.set()
+        with self.cond:
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
+        ack_ids = []
+        while True:
+            item = self.queue.get()
+            if item is _STREAM_END:
+                break
+            ack_ids.append(item[0])
+        # Keep the iteration ended
+        self.queue.put(_STREAM_END)
+        if ack_ids:
+            self.nack_many(ack_ids)
+            LOGGER.debug("NACK'ed %s messages", len(ack_ids))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 
 class JSONPublisher(Publisher):
@@ -367,7 +875,11 @@ class JSONPublisher(Publisher):
 
 
 class IOPublisher(JSONPublisher):
-    """I/O data queue publisher"""
+    """
+    I/O data queue publisher, optionally coalescing published reports into
+    fewer messages.
+    """
+    # It's OK, pylint: disable=too-many-instance-attributes
 
     def encode_data(self, data):
         """
@@ -386,21 +898,164 @@ class IOPublisher(JSONPublisher):
         """
         assert self.schema.is_compatible(data)
         if not LIGHT_ASSERTS:
-            self.schema.validate(data)
+            io.validate(self.schema, data)
         return super().encode_data(data)
 
-    def __init__(self, *args, schema=io.SCHEMA, **kwargs):
+    def __init__(self, *args, schema=io.SCHEMA,
+                 coalesce_obj=0, coalesce_size=0, coalesce_linger=0,
+                 **kwargs):
         """
-        Initialize the I/O publisher.
+        Initialize the I/O publisher. Published reports are coalesced only
+        if any of "coalesce_obj", "coalesce_size", or "coalesce_linger" is
+        non-zero.
 
         Args:
-            args:   The positional arguments to initialize Subscriber with.
-            schema: The version of I/O schema to validate published data to.
-            kwargs: The keyword arguments to initialize Subscriber with.
+            args:               The positional arguments to initialize
+                                Publisher with.
+            schema:             The version of I/O schema to validate
+                                published data to.
+            coalesce_obj:       Maximum number of objects to coalesce
+                                published reports into a single message,
+                                or zero for no limit.
+            coalesce_size:      Maximum size of a coalesced message, bytes,
+                                or zero for MAX_MESSAGE_SIZE. A report
+                                larger than that is published alone.
+            coalesce_linger:    Maximum number of seconds to hold back
+                                published reports for coalescing, or zero to
+                                hold them until a limit is reached, or
+                                flush() is called.
+            kwargs:             The keyword arguments to initialize
+                                Publisher with.
         """
         assert issubclass(schema, io.schema.VA)
+        assert isinstance(coalesce_obj, int) and coalesce_obj >= 0
+        assert isinstance(coalesce_size, int) and coalesce_size >= 0
+        assert isinstance(coalesce_linger, (int, float)) and \
+            coalesce_linger >= 0
         super().__init__(*args, **kwargs)
         self.schema = schema
+        self.coalesce = bool(coalesce_obj or coalesce_size or coalesce_linger)
+        self.coalesce_obj = coalesce_obj or math.inf
+        self.coalesce_size = min(coalesce_size or math.inf,
+                                 self.MAX_MESSAGE_SIZE)
+        self.coalesce_linger = coalesce_linger
+        # The lock protecting the held-back reports
+        self.coalesced_lock = threading.Lock()
+        # The timer publishing held-back reports after the linger timeout
+        self.coalesced_timer = None
+        # The encoded objects held back for coalescing, per object list
+        self.coalesced_objs = {}
+        # The number of objects held back
+        self.coalesced_obj = 0
+        # The (upper bound of) size of the coalesced message held back
+        self.coalesced_size = 0
+        # The futures of the held-back reports
+        self.coalesced_futures = []
+
+    def future_publish(self, data):
+        """
+        Publish data to the message queue in the future, possibly
+        coalescing it with other published data into a single message.
+
+        Args:
+            data:   The data to publish to the message queue.
+                    Must adhere to a version of I/O schema.
+
+        Returns:
+            A "future" representing the publishing result, returning the
+            publishing ID string. Reports coalesced into the same message
+            share their publishing ID.
+        """
+        if not self.coalesce:
+            return super().future_publish(data)
+        assert self.schema.is_compatible(data)
+        if not LIGHT_ASSERTS:
+            io.validate(self.schema, data)
+        data = self.schema.upgrade(data, copy=False)
+        # Encode the objects, computing the size they would add
+        objs = {
+            obj_list_name: [json.dumps(obj) for obj in data[obj_list_name]]
+            for obj_list_name in self.schema.graph
+            if obj_list_name and data.get(obj_list_name)
+        }
+        obj_num = sum(len(encoded_objs) for encoded_objs in objs.values())
+        size = sum(
+            # Account for the list name, brackets, and separators
+            len(json.dumps(obj_list_name)) + 6 +
+            sum(len(encoded_obj) + 2 for encoded_obj in encoded_objs)
+            for obj_list_name, encoded_objs in objs.items()
+        )
+        future = concurrent.futures.Future()
+        with self.coalesced_lock:
+            # Publish what's held back, if the data wouldn't fit
+            if self.coalesced_futures and (
+                self.coalesced_obj + obj_num > self.coalesce_obj or
+                self.coalesced_size + size > self.coalesce_size
+            ):
+                self._flush()
+            for obj_list_name, encoded_objs in objs.items():
+                self.coalesced_objs.setdefault(obj_list_name, []). \
+                    extend(encoded_objs)
+            self.coalesced_obj += obj_num
+            self.coalesced_size += size
+            self.coalesced_futures.append(future)
+            # Publish, if limits are reached
+            if self.coalesced_obj >= self.coalesce_obj or \
+               self.coalesced_size >= self.coalesce_size:
+                self._flush()
+            elif self.coalesce_linger and self.coalesced_timer is None:
+                self.coalesced_timer = threading.Timer(self.coalesce_linger,
+                                                       self.flush)
+                self.coalesced_timer.daemon = True
+                self.coalesced_timer.start()
+        return future
+
+    def _flush(self):
+        """
+        Publish the reports held back for coalescing as a single message,
+        if any. Must be called with the held-back reports' lock taken.
+        """
+        if self.coalesced_timer is not None:
+            self.coalesced_timer.cancel()
+            self.coalesced_timer = None
+        if not self.coalesced_futures:
+            return
+        # Assemble the message out of the encoded objects
+        message_data = (
+            json.dumps(self.schema.new())[:-1] +
+            "".join(
+                f", {json.dumps(obj_list_name)}: [" +
+                ", ".join(encoded_objs) + "]"
+                for obj_list_name, encoded_objs in self.coalesced_objs.items()
+            ) +
+            "}"
+        ).encode()
+        futures = self.coalesced_futures
+        self.coalesced_objs = {}
+        self.coalesced_obj = 0
+        self.coalesced_size = 0
+        self.coalesced_futures = []
+        LOGGER.debug("Publishing %u reports coalesced into %u bytes",
+                     len(futures), len(message_data))
+
+        def done(message_future):
+            """Report the message publishing result for each report"""
+            exc = message_future.exception()
+            for future in futures:
+                if exc is None:
+                    future.set_result(message_future.result())
+                else:
+                    future.set_exception(exc)
+
+        self._publish_message(message_data).add_done_callback(done)
+
+    def flush(self):
+        """
+        Start publishing any reports held back for coalescing, so that
+        futures returned by future_publish() for them could complete.
+        """
+        with self.coalesced_lock:
+            self._flush()
 
 
 class JSONSubscriber(Subscriber):
@@ -444,26 +1099,11 @@ class IOSubscriber(JSONSubscriber):
         Raises:
             An exception in case data decoding failed.
         """
-        # TODO move the check to the I/O schema
-        def reject_nul_chars(data):
-            """Raise an Exception if a string in data contains NUL"""
-            if isinstance(data, dict):
-                for key, value in data.items():
-                    reject_nul_chars(key)
-                    reject_nul_chars(value)
-            elif isinstance(data, list):
-                for value in data:
-                    reject_nul_chars(value)
-            elif isinstance(data, str):
-                if '\0' in data:
-                    raise Exception(f"NUL character in string {data!r}")
-            return data
-
+        # Scan the raw message for NUL escapes before walking the data
         return self.schema.upgrade(
-            self.schema.validate(
-                reject_nul_chars(
-                    super().decode_data(message_data)
-                )
+            io.validate(
+                self.schema,
+                misc.json_loads_reject_nul(message_data)
             )
         )
 
@@ -586,6 +1226,59 @@ class ORMPatternPublisher(Publisher):
             repr(pattern) + "\n" for pattern in data
         ).encode()
 
+    def split_data(self, data, max_size=0):
+        """
+        Split a set of kcidb.orm.query.Pattern objects into sets encoding
+        into message data of limited size. Patterns limited to too many IDs
+        to fit are split into patterns limited to subsets of the IDs.
+
+        Args:
+            data:       The set to split.
+            max_size:   Maximum size of the encoded message data, bytes,
+                        or zero for MAX_MESSAGE_SIZE. A pattern larger than
+                        that, which cannot be split, is returned alone.
+
+        Returns:
+            A generator of pattern sets, covering the whole of the
+            original set.
+        """
+        assert isinstance(data, (set, frozenset))
+        assert all(isinstance(pattern, kcidb.orm.query.Pattern)
+                   for pattern in data)
+        assert isinstance(max_size, int) and max_size >= 0
+        max_size = min(max_size or math.inf, self.MAX_MESSAGE_SIZE)
+        # Patterns, and the sizes of their encoded lines
+        pattern_sizes = []
+        pending_patterns = list(data)
+        while pending_patterns:
+            pattern = pending_patterns.pop()
+            size = len(repr(pattern).encode()) + 1
+            if size > max_size and pattern.obj_id_set is not None and \
+               len(pattern.obj_id_set) > 1:
+                obj_ids = sorted(pattern.obj_id_set, key=repr)
+                half = len(obj_ids) // 2
+                for obj_id_list in (obj_ids[:half], obj_ids[half:]):
+                    pending_patterns.append(kcidb.orm.query.Pattern(
+                        pattern.base, pattern.child, pattern.obj_type,
+                        set(obj_id_list)
+                    ))
+            else:
+                pattern_sizes.append((pattern, size))
+
+        # Pack patterns into sets, largest first
+        pattern_sizes.sort(key=lambda pattern_size: -pattern_size[1])
+        pattern_set = set()
+        set_size = 0
+        for pattern, size in pattern_sizes:
+            if pattern_set and set_size + size > max_size:
+                yield pattern_set
+                pattern_set = set()
+                set_size = 0
+            pattern_set.add(pattern)
+            set_size += size
+        if pattern_set:
+            yield pattern_set
+
 
 class ORMPatternSubscriber(Subscriber):
     """ORM pattern queue subscriber"""
@@ -749,6 +1442,13 @@ def argparse_publisher_add_args(parser, data_name):
         data_name:  Name of the message queue data.
     """
     argparse_add_args(parser)
+    parser.add_argument(
+        '--compress',
+        choices=misc.COMPRESSIONS,
+        help='Compress published message data with the specified format.',
+        default=None,
+        required=False
+    )
     subparsers = parser.add_subparsers(dest="command",
                                        title="Available commands",
                                        metavar="COMMAND",
@@ -770,6 +1470,44 @@ def argparse_publisher_add_args(parser, data_name):
     )
 
 
+def argparse_coalesce_add_args(parser):
+    """
+    Add I/O publisher report coalescing arguments to an argument parser.
+
+    Args:
+        parser:     The parser to add arguments to.
+    """
+    parser.add_argument(
+        '--coalesce-obj',
+        metavar="NUMBER",
+        type=misc.non_negative_int,
+        help='Coalesce reports into messages of maximum NUMBER of objects, '
+             'or zero for no limit. Default is zero.',
+        default=0,
+        required=False
+    )
+    parser.add_argument(
+        '--coalesce-size',
+        metavar="BYTES",
+        type=misc.non_negative_int,
+        help='Coalesce reports into messages of maximum BYTES size, '
+             f'or zero for {IOPublisher.MAX_MESSAGE_SIZE}. Default is zero.',
+        default=0,
+        required=False
+    )
+    parser.add_argument(
+        '--coalesce-linger',
+        metavar="SECONDS",
+        type=float,
+        help='Hold reports back for coalescing for maximum SECONDS, '
+             'or zero to hold until another limit is reached, or the '
+             'input ends. Default is zero. Reports are only coalesced, '
+             'if any of the --coalesce-* options are non-zero.',
+        default=0,
+        required=False
+    )
+
+
 class PublisherArgumentParser(misc.ArgumentParser):
     """
     Command-line argument parser with common message queue arguments added.
@@ -876,8 +1614,15 @@ def io_publisher_main():
         'Kernel CI I/O data publisher management tool'
     parser = PublisherArgumentParser("I/O data", description=description)
     misc.argparse_input_add_args(parser.subparsers["publish"])
+    argparse_coalesce_add_args(parser.subparsers["publish"])
     args = parser.parse_args()
-    publisher = IOPublisher(args.project, args.topic)
+    coalesce_kwargs = {}
+    if args.command == "publish":
+        coalesce_kwargs = dict(coalesce_obj=args.coalesce_obj,
+                               coalesce_size=args.coalesce_size,
+                               coalesce_linger=args.coalesce_linger)
+    publisher = IOPublisher(args.project, args.topic,
+                            compression=args.compress, **coalesce_kwargs)
     if args.command == "init":
         publisher.init()
     elif args.command == "cleanup":
@@ -887,7 +1632,7 @@ def io_publisher_main():
             print(publishing_id, file=sys.stdout)
             sys.stdout.flush()
         publisher.publish_iter(
-            (publisher.schema.validate(data)
+            (io.validate(publisher.schema, data)
              for data in
              misc.json_load_stream_fd(sys.stdin.fileno(), seq=args.seq_in)),
             done_cb=print_publishing_id
@@ -909,12 +1654,14 @@ def io_subscriber_main():
     elif args.command == "cleanup":
         subscriber.cleanup()
     elif args.command == "pull":
-        for ack_id, data in \
-                subscriber.pull_iter(args.messages, timeout=args.timeout):
-            misc.json_dump(data, sys.stdout, indent=args.indent,
-                           seq=args.seq_out)
-            sys.stdout.flush()
-            subscriber.ack(ack_id)
+        with misc.json_output_open(args.compress) as output:
+            for ack_id, data in \
+                    subscriber.pull_iter(args.messages, timeout=args.timeout):
+                misc.json_dump(data, output, indent=args.indent,
+                               seq=args.seq_out)
+                # Only acknowledge the data once it's output
+                output.flush()
+                subscriber.ack(ack_id)
 
 
 def pattern_publisher_main():
@@ -930,7 +1677,8 @@ def pattern_publisher_main():
         help='Print pattern string documentation and exit.'
     )
     args = parser.parse_args()
-    publisher = ORMPatternPublisher(args.project, args.topic)
+    publisher = ORMPatternPublisher(args.project, args.topic,
+                                    compression=args.compress)
     if args.command == "init":
         publisher.init()
     elif args.command == "cleanup":
@@ -980,7 +1728,8 @@ def email_publisher_main():
         'Kernel CI email queue publisher management tool'
     parser = PublisherArgumentParser("email", description=description)
     args = parser.parse_args()
-    publisher = EmailPublisher(args.project, args.topic)
+    publisher = EmailPublisher(args.project, args.topic,
+                               compression=args.compress)
     if args.command == "init":
         publisher.init()
     elif args.command == "cleanup":
@@ -0,0 +1,496 @@
+"""
+Kernel CI message queue - local SQLite backend
+
+Publisher and subscriber clients implementing the subset of the Google
+Pub/Sub PublisherClient and SubscriberClient interfaces used by kcidb.mq,
+storing the messages in a local SQLite database. Support ACK deadlines,
+NACKs, redelivery, and concurrent consumers (threads or processes sharing
+the database file), so the message queue pipeline could be run and
+load-tested on a single machine, without Google Cloud.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import concurrent.futures
+from google.api_core.exceptions import AlreadyExists, NotFound
+
+# The default number of seconds a pulled message has to be acknowledged
+# within, before it is redelivered (same as Pub/Sub's)
+ACK_DEADLINE_SECONDS = 10
+
+# The number of seconds to sleep between polls for messages when pulling
+POLL_INTERVAL = 0.05
+
+# The topic path subscriptions are detached to, when their topic is deleted
+# (same as Pub/Sub's)
+DELETED_TOPIC = "_deleted-topic_"
+
+
+def _parse_ack_id(ack_id):
+    """
+    Parse an ACK ID.
+
+    Args:
+        ack_id: The ACK ID string to parse.
+
+    Returns:
+        The message ID and the delivery attempt number, as integers.
+    """
+    assert isinstance(ack_id, str)
+    message_id, delivery_attempt = ack_id.split(":")
+    return int(message_id), int(delivery_attempt)
+
+
+class Message:
+    """A message stored in the queue"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, message_id, data, attributes, publish_time):
+        """
+        Initialize the message.
+
+        Args:
+            message_id:     The ID of the message (a string).
+            data:           The message data (bytes).
+            attributes:     A dictionary of message attribute strings.
+            publish_time:   The time the message was published, seconds
+                            since epoch.
+        """
+        assert isinstance(message_id, str)
+        assert isinstance(data, bytes)
+        assert isinstance(attributes, dict)
+        assert isinstance(publish_time, float)
+        self.message_id = message_id
+        self.data = data
+        self.attributes = attributes
+        self.publish_time = publish_time
+
+
+class ReceivedMessage:
+    """A message received from a subscription"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, ack_id, message, delivery_attempt):
+        """
+        Initialize the received message.
+
+        Args:
+            ack_id:             The ID to use to (N)ACK the message.
+            message:            The received message (Message).
+            delivery_attempt:   The number of times the message was
+                                delivered, including this time.
+        """
+        assert isinstance(ack_id, str)
+        assert isinstance(message, Message)
+        assert isinstance(delivery_attempt, int) and delivery_attempt > 0
+        self.ack_id = ack_id
+        self.message = message
+        self.delivery_attempt = delivery_attempt
+
+
+class PullResponse:
+    """A response to a pull request"""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, received_messages):
+        """
+        Initialize the pull response.
+
+        Args:
+            received_messages:  A list of received messages
+                                (ReceivedMessage).
+        """
+        assert isinstance(received_messages, list)
+        assert all(isinstance(m, ReceivedMessage) for m in received_messages)
+        self.received_messages = received_messages
+
+
+class Client:
+    """An abstract client of a message queue stored in a SQLite database"""
+
+    def __init__(self, filename):
+        """
+        Initialize the client, creating the database, if it doesn't exist.
+
+        Args:
+            filename:   The name of the SQLite database file to store the
+                        message queue in.
+        """
+        assert isinstance(filename, str)
+        self.filename = filename
+        # The lock serializing access to the connection
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filename, timeout=60,
+                                    isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+
+        def create_tables(conn):
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS topics (\n"
+                "    name TEXT PRIMARY KEY,\n"
+                "    message_num INTEGER NOT NULL DEFAULT 0\n"
+                ")"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS subscriptions (\n"
+                "    name TEXT PRIMARY KEY,\n"
+                "    topic TEXT NOT NULL,\n"
+                "    ack_deadline_seconds INTEGER NOT NULL\n"
+                ")"
+            )
+            # One row per message per subscription, removed when ACK'ed
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages (\n"
+                "    subscription TEXT NOT NULL,\n"
+                "    id INTEGER NOT NULL,\n"
+                "    data BLOB NOT NULL,\n"
+                "    attributes TEXT NOT NULL,\n"
+                "    publish_time REAL NOT NULL,\n"
+                "    deadline REAL NOT NULL,\n"
+                "    delivery_attempt INTEGER NOT NULL,\n"
+                "    PRIMARY KEY (subscription, id)\n"
+                ")"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS messages_deadline "
+                "ON messages (subscription, deadline)"
+            )
+        self._execute(create_tables)
+
+    def _execute(self, func):
+        """
+        Execute a function within a write transaction, committing the
+        transaction if it succeeds, and rolling back if it fails.
+
+        Args:
+            func:   The function to execute. Will be called with the
+                    database connection.
+
+        Returns:
+            The return value of the function.
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self.conn)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+        return result
+
+    @staticmethod
+    def topic_path(project, topic):
+        """
+        Format a topic path.
+
+        Args:
+            project:    The ID of the project containing the topic.
+            topic:      The name of the topic.
+
+        Returns:
+            The topic path string.
+        """
+        return f"projects/{project}/topics/{topic}"
+
+    @staticmethod
+    def subscription_path(project, subscription):
+        """
+        Format a subscription path.
+
+        Args:
+            project:        The ID of the project containing the
+                            subscription.
+            subscription:   The name of the subscription.
+
+        Returns:
+            The subscription path string.
+        """
+        return f"projects/{project}/subscriptions/{subscription}"
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self.lock:
+            self.conn.close()
+
+
+class PublisherClient(Client):
+    """A publisher client of a message queue stored in a SQLite database"""
+
+    def create_topic(self, name):
+        """
+        Create a topic.
+
+        Args:
+            name:   The path of the topic to create.
+
+        Raises:
+            google.api_core.exceptions.AlreadyExists if the topic exists.
+        """
+        def create(conn):
+            try:
+                conn.execute("INSERT INTO topics (name) VALUES (?)", (name,))
+            except sqlite3.IntegrityError:
+                raise AlreadyExists(f"Topic already exists: {name}") \
+                    from None
+        self._execute(create)
+
+    def delete_topic(self, topic):
+        """
+        Delete a topic. Its subscriptions are detached, and stop receiving
+        messages, even if a topic with the same path is created again, but
+        keep the messages already delivered to them.
+
+        Args:
+            topic:  The path of the topic to delete.
+
+        Raises:
+            google.api_core.exceptions.NotFound if the topic doesn't exist.
+        """
+        def delete(conn):
+            if not conn.execute("DELETE FROM topics WHERE name = ?",
+                                (topic,)).rowcount:
+                raise NotFound(f"Topic not found: {topic}")
+            # Message IDs restart with a recreated topic,
+            # so don't deliver them to the same subscriptions
+            conn.execute("UPDATE subscriptions SET topic = ? "
+                         "WHERE topic = ?", (DELETED_TOPIC, topic))
+        self._execute(delete)
+
+    def publish(self, topic, data, **attrs):
+        """
+        Publish a message to a topic, delivering it to every subscription
+        of the topic.
+
+        Args:
+            topic:  The path of the topic to publish to.
+            data:   The message data (bytes).
+            attrs:  The message attributes (strings).
+
+        Returns:
+            A completed future, returning the message ID string, or raising
+            google.api_core.exceptions.NotFound if the topic doesn't exist.
+        """
+        assert isinstance(data, bytes)
+        assert all(isinstance(v, str) for v in attrs.values())
+        publish_time = time.time()
+
+        def publish(conn):
+            if not conn.execute(
+                "UPDATE topics SET message_num = message_num + 1 "
+                "WHERE name = ?", (topic,)
+            ).rowcount:
+                raise NotFound(f"Topic not found: {topic}")
+            message_id, = conn.execute(
+                "SELECT message_num FROM topics WHERE name = ?", (topic,)
+            ).fetchone()
+            conn.execute(
+                "INSERT INTO messages\n"
+                "SELECT name, ?, ?, ?, ?, 0, 0\n"
+                "FROM subscriptions WHERE topic = ?",
+                (message_id, data, json.dumps(attrs), publish_time, topic)
+            )
+            return str(message_id)
+
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(self._execute(publish))
+        # Report any error via the future, like Pub/Sub does
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            future.set_exception(exc)
+        return future
+
+
+class SubscriberClient(Client):
+    """A subscriber client of a message queue stored in a SQLite database"""
+
+    def create_subscription(self, name, topic,
+                            ack_deadline_seconds=ACK_DEADLINE_SECONDS):
+        """
+        Create a subscription to a topic. The subscription receives
+        messages published after its creation.
+
+        Args:
+            name:                   The path of the subscription to create.
+            topic:                  The path of the topic to subscribe to.
+            ack_deadline_seconds:   The number of seconds a pulled message
+                                    has to be acknowledged within, before it
+                                    is redelivered.
+
+        Raises:
+            google.api_core.exceptions.AlreadyExists if the subscription
+            exists, google.api_core.exceptions.NotFound if the topic
+            doesn't.
+        """
+        assert isinstance(ack_deadline_seconds, int) and \
+            ack_deadline_seconds > 0
+
+        def create(conn):
+            if not conn.execute("SELECT 1 FROM topics WHERE name = ?",
+                                (topic,)).fetchone():
+                raise NotFound(f"Topic not found: {topic}")
+            try:
+                conn.execute("INSERT INTO subscriptions VALUES (?, ?, ?)",
+                             (name, topic, ack_deadline_seconds))
+            except sqlite3.IntegrityError:
+                raise AlreadyExists(
+                    f"Subscription already exists: {name}"
+                ) from None
+        self._execute(create)
+
+    def delete_subscription(self, subscription):
+        """
+        Delete a subscription, along with its messages.
+
+        Args:
+            subscription:   The path of the subscription to delete.
+
+        Raises:
+            google.api_core.exceptions.NotFound if the subscription doesn't
+            exist.
+        """
+        def delete(conn):
+            if not conn.execute("DELETE FROM subscriptions WHERE name = ?",
+                                (subscription,)).rowcount:
+                raise NotFound(f"Subscription not found: {subscription}")
+            conn.execute("DELETE FROM messages WHERE subscription = ?",
+                         (subscription,))
+        self._execute(delete)
+
+    def _pull(self, subscription, max_messages):
+        """
+        Pull available messages from a subscription without waiting,
+        starting their ACK deadlines.
+
+        Args:
+            subscription:   The path of the subscription to pull from.
+            max_messages:   Maximum number of messages to pull.
+
+        Returns:
+            A list of received messages (ReceivedMessage).
+
+        Raises:
+            google.api_core.exceptions.NotFound if the subscription doesn't
+            exist.
+        """
+        def pull(conn):
+            row = conn.execute(
+                "SELECT ack_deadline_seconds FROM subscriptions "
+                "WHERE name = ?", (subscription,)
+            ).fetchone()
+            if not row:
+                raise NotFound(f"Subscription not found: {subscription}")
+            now = time.time()
+            rows = conn.execute(
+                "SELECT id, data, attributes, publish_time, "
+                "delivery_attempt + 1\n"
+                "FROM messages WHERE subscription = ? AND deadline <= ?\n"
+                "ORDER BY id LIMIT ?",
+                (subscription, now, max_messages)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE messages\n"
+                "SET deadline = ?, delivery_attempt = ?\n"
+                "WHERE subscription = ? AND id = ?",
+                ((now + row[0], r[4], subscription, r[0]) for r in rows)
+            )
+            return [
+                ReceivedMessage(
+                    f"{id}:{attempt}",
+                    Message(str(id), data, json.loads(attributes),
+                            publish_time),
+                    attempt
+                )
+                for id, data, attributes, publish_time, attempt in rows
+            ]
+        return self._execute(pull)
+
+    def pull(self, subscription, max_messages, timeout=None):
+        """
+        Pull messages from a subscription, waiting for at least one to
+        become available, starting their ACK deadlines.
+
+        Args:
+            subscription:   The path of the subscription to pull from.
+            max_messages:   Maximum number of messages to pull.
+            timeout:        Maximum number of seconds to wait for messages,
+                            or None to wait forever.
+
+        Returns:
+            The pull response, with the list of received messages
+            (ReceivedMessage) in "received_messages". Empty, if the
+            timeout expired.
+
+        Raises:
+            google.api_core.exceptions.NotFound if the subscription doesn't
+            exist.
+        """
+        assert isinstance(max_messages, int) and max_messages > 0
+        assert timeout is None or \
+            isinstance(timeout, (int, float)) and timeout >= 0
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            messages = self._pull(subscription, max_messages)
+            if messages:
+                break
+            remaining = None if deadline is None \
+                else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            time.sleep(POLL_INTERVAL if remaining is None
+                       else min(POLL_INTERVAL, remaining))
+        return PullResponse(messages)
+
+    def acknowledge(self, subscription, ack_ids):
+        """
+        Acknowledge messages, removing them from a subscription. ACK IDs
+        of messages which were since redelivered, or acknowledged, are
+        ignored.
+
+        Args:
+            subscription:   The path of the subscription the messages were
+                            pulled from.
+            ack_ids:        A list of ACK IDs of the messages.
+        """
+        def acknowledge(conn):
+            conn.executemany(
+                "DELETE FROM messages\n"
+                "WHERE subscription = ? AND id = ? AND delivery_attempt = ?",
+                ((subscription, *_parse_ack_id(ack_id)) for ack_id in ack_ids)
+            )
+        self._execute(acknowledge)
+
+    def modify_ack_deadline(self, subscription, ack_ids,
+                            ack_deadline_seconds):
+        """
+        Modify the ACK deadlines of messages. ACK IDs of messages which
+        were since redelivered, or acknowledged, are ignored.
+
+        Args:
+            subscription:           The path of the subscription the
+                                    messages were pulled from.
+            ack_ids:                A list of ACK IDs of the messages.
+            ack_deadline_seconds:   The new deadline, seconds from now.
+                                    Zero to make the messages available for
+                                    redelivery immediately (NACK them).
+        """
+        assert isinstance(ack_deadline_seconds, int) and \
+            ack_deadline_seconds >= 0
+        deadline = time.time() + ack_deadline_seconds
+
+        def modify(conn):
+            conn.executemany(
+                "UPDATE messages SET deadline = ?\n"
+                "WHERE subscription = ? AND id = ? AND delivery_attempt = ?",
+                ((deadline, subscription, *_parse_ack_id(ack_id))
+                 for ack_id in ack_ids)
+            )
+        self._execute(modify)
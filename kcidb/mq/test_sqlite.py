@@ -0,0 +1,202 @@
+"""kcdib.mq.sqlite module tests"""
+
+import math
+import time
+import threading
+import pytest
+from google.api_core.exceptions import AlreadyExists, NotFound
+import kcidb
+from kcidb.mq.sqlite import PublisherClient, SubscriberClient
+
+
+def make_clients(tmp_path, ack_deadline_seconds=10):
+    """
+    Create publisher and subscriber clients of a queue with a topic and a
+    subscription.
+
+    Args:
+        tmp_path:               The directory to create the database in.
+        ack_deadline_seconds:   The ACK deadline of the subscription.
+
+    Returns:
+        The publisher client, the subscriber client, the topic path, and the
+        subscription path.
+    """
+    filename = str(tmp_path / "mq.sqlite3")
+    publisher = PublisherClient(filename)
+    subscriber = SubscriberClient(filename)
+    topic = publisher.topic_path("project", "topic")
+    subscription = subscriber.subscription_path("project", "subscription")
+    publisher.create_topic(name=topic)
+    subscriber.create_subscription(
+        name=subscription, topic=topic,
+        ack_deadline_seconds=ack_deadline_seconds
+    )
+    return publisher, subscriber, topic, subscription
+
+
+def pull(subscriber, subscription, max_messages=10, timeout=0):
+    """
+    Pull messages from a subscription.
+
+    Args:
+        subscriber:     The subscriber client to pull with.
+        subscription:   The path of the subscription to pull from.
+        max_messages:   Maximum number of messages to pull.
+        timeout:        Maximum number of seconds to wait for messages.
+
+    Returns:
+        A list of tuples of received message ACK IDs and data.
+    """
+    return [
+        (m.ack_id, m.message.data)
+        for m in subscriber.pull(subscription=subscription,
+                                 max_messages=max_messages,
+                                 timeout=timeout).received_messages
+    ]
+
+
+def test_setup(tmp_path):
+    """Check topics and subscriptions are created and deleted"""
+    publisher, subscriber, topic, subscription = make_clients(tmp_path)
+    with pytest.raises(AlreadyExists):
+        publisher.create_topic(name=topic)
+    with pytest.raises(AlreadyExists):
+        subscriber.create_subscription(name=subscription, topic=topic)
+    with pytest.raises(NotFound):
+        subscriber.create_subscription(
+            name=subscriber.subscription_path("project", "other"),
+            topic=publisher.topic_path("project", "other"),
+        )
+    subscriber.delete_subscription(subscription=subscription)
+    with pytest.raises(NotFound):
+        subscriber.delete_subscription(subscription=subscription)
+    with pytest.raises(NotFound):
+        pull(subscriber, subscription)
+    publisher.delete_topic(topic=topic)
+    with pytest.raises(NotFound):
+        publisher.publish(topic=topic, data=b"").result()
+
+
+def test_topic_recreation(tmp_path):
+    """Check subscriptions are detached from deleted topics"""
+    publisher, subscriber, topic, subscription = make_clients(tmp_path)
+    publisher.publish(topic=topic, data=b"0").result()
+    publisher.delete_topic(topic=topic)
+    publisher.create_topic(name=topic)
+    new_subscription = subscriber.subscription_path("project", "new")
+    subscriber.create_subscription(name=new_subscription, topic=topic)
+    # Messages published to the recreated topic (restarting message IDs)
+    # aren't delivered to the old subscription
+    publisher.publish(topic=topic, data=b"1").result()
+    publisher.publish(topic=topic, data=b"2").result()
+    assert [data for _, data in pull(subscriber, subscription)] == [b"0"]
+    assert [data for _, data in pull(subscriber, new_subscription)] == \
+        [b"1", b"2"]
+
+
+def test_ack_nack(tmp_path):
+    """Check messages are delivered, ACK'ed, NACK'ed, and redelivered"""
+    publisher, subscriber, topic, subscription = make_clients(tmp_path, 1)
+    # Messages are delivered in order, with attributes
+    ids = [publisher.publish(topic=topic, data=str(i).encode(),
+                             attr=str(i)).result()
+           for i in range(3)]
+    assert len(set(ids)) == 3
+    messages = subscriber.pull(subscription=subscription, max_messages=2,
+                               timeout=0).received_messages
+    assert [m.message.data for m in messages] == [b"0", b"1"]
+    assert [m.message.message_id for m in messages] == ids[:2]
+    assert [m.message.attributes for m in messages] == \
+        [dict(attr="0"), dict(attr="1")]
+    assert [m.delivery_attempt for m in messages] == [1, 1]
+    # Pulled messages aren't delivered again before the deadline
+    (ack_id_2, data_2), = pull(subscriber, subscription)
+    assert data_2 == b"2"
+    assert pull(subscriber, subscription) == []
+
+    # ACK'ed messages are gone, NACK'ed ones are redelivered
+    subscriber.acknowledge(subscription=subscription,
+                           ack_ids=[messages[0].ack_id])
+    subscriber.modify_ack_deadline(subscription=subscription,
+                                   ack_ids=[messages[1].ack_id],
+                                   ack_deadline_seconds=0)
+    (ack_id_1, data_1), = pull(subscriber, subscription)
+    assert data_1 == b"1"
+    # Stale ACK IDs are ignored
+    subscriber.acknowledge(subscription=subscription,
+                           ack_ids=[messages[1].ack_id])
+
+    # Messages are redelivered after the deadline expires
+    subscriber.acknowledge(subscription=subscription, ack_ids=[ack_id_2])
+    time.sleep(1.1)
+    messages = subscriber.pull(subscription=subscription, max_messages=10,
+                               timeout=0).received_messages
+    assert [m.message.data for m in messages] == [b"1"]
+    assert messages[0].delivery_attempt == 3
+    subscriber.acknowledge(subscription=subscription, ack_ids=[ack_id_1])
+    subscriber.acknowledge(subscription=subscription,
+                           ack_ids=[messages[0].ack_id])
+    time.sleep(1.1)
+    assert pull(subscriber, subscription) == []
+
+
+def test_concurrent_consumers(tmp_path):
+    """Check concurrent consumers receive each message once"""
+    publisher, _, topic, subscription = make_clients(tmp_path)
+    message_num = 200
+    for i in range(message_num):
+        publisher.publish(topic=topic, data=str(i).encode())
+    received = []
+    received_lock = threading.Lock()
+
+    def consume():
+        # Use a separate connection per consumer
+        subscriber = SubscriberClient(str(tmp_path / "mq.sqlite3"))
+        while True:
+            messages = pull(subscriber, subscription, max_messages=7)
+            if not messages:
+                break
+            with received_lock:
+                received.extend(data for _, data in messages)
+            subscriber.acknowledge(
+                subscription=subscription,
+                ack_ids=[ack_id for ack_id, _ in messages]
+            )
+        subscriber.close()
+
+    threads = [threading.Thread(target=consume) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(received, key=int) == \
+        [str(i).encode() for i in range(message_num)]
+
+
+def test_io_queue(tmp_path, monkeypatch):
+    """Check I/O publishers and subscribers work over a SQLite queue"""
+    monkeypatch.setenv(kcidb.mq.SQLITE_ENV, str(tmp_path / "mq.sqlite3"))
+    publisher = kcidb.mq.IOPublisher("project", "topic", compression="gzip")
+    subscriber = kcidb.mq.IOSubscriber("project", "topic", "subscription")
+    assert isinstance(publisher.client, PublisherClient)
+    assert isinstance(subscriber.client, SubscriberClient)
+    publisher.init()
+    subscriber.init()
+
+    data = kcidb.io.SCHEMA.new()
+    data["checkouts"] = [dict(id="test:1", origin="test")]
+    publisher.publish(data)
+    publisher.publish(kcidb.io.SCHEMA.new())
+    messages = subscriber.pull(max_num=2, timeout=1, max_obj=math.inf)
+    assert [message[1] for message in messages] == \
+        [data, kcidb.io.SCHEMA.new()]
+    subscriber.nack(messages[1][0])
+    subscriber.ack(messages[0][0])
+    messages = subscriber.pull(max_num=2, timeout=0.1, max_obj=math.inf)
+    assert [message[1] for message in messages] == [kcidb.io.SCHEMA.new()]
+    subscriber.ack(messages[0][0])
+    assert not subscriber.pull(max_num=1, timeout=0.1, max_obj=math.inf)
+
+    subscriber.cleanup()
+    publisher.cleanup()
@@ -79,13 +79,10 @@ class Object:
         if name in self._data:
             return self._data[name]
         id = self.get_id()
+        base_set = {Pattern(None, True, self._type, {id})}
         if name in self._type.parents:
             response = self._client.query(
-                # TODO Get rid of formatting and parsing
-                Pattern.parse(
-                    ">" + self._type.name + "%<" + name + "#",
-                    [{tuple(str(part) for part in id)}]
-                )
+                Pattern.expand(base_set, False, name)[1]
             )
             try:
                 return response[name][0]
@@ -95,11 +92,7 @@ class Object:
             child_type_name = name[:-1]
             if child_type_name in self._type.children:
                 return self._client.query(
-                    # TODO Get rid of formatting and parsing
-                    Pattern.parse(
-                        ">" + self._type.name + "%>" + child_type_name + "#",
-                        [{tuple(str(part) for part in id)}]
-                    )
+                    Pattern.expand(base_set, True, child_type_name)[1]
                 )[child_type_name]
         raise AttributeError(f"Attribute {name!r} not found")
 
@@ -729,7 +722,11 @@ assert set(CLASSES) == set(SCHEMA.types)
 class Client:
     """Object-oriented data client"""
 
-    def __init__(self, source, prefetch=True, cache=True, sort=False):
+    # It's OK, pylint: disable=too-many-arguments
+    # Or if you prefer, pylint: disable=too-many-positional-arguments
+    def __init__(self, source, prefetch=True, cache=True, sort=False,
+                 cache_max_objs=None, cache_max_bytes=None,
+                 cache_max_age=None):
         """
         Initialize the client.
 
@@ -737,22 +734,40 @@ class Client:
             source:     Raw object-oriented data source, an instance of
                         kcidb.orm.Source.
             prefetch:   If True, prefetch data using kcidb.orm.Prefetcher.
-                        If False, do not prefetch. Doesn't really make much
-                        sense without caching enabled too.
+                        If a kcidb.orm.PrefetchPolicy, prefetch data
+                        according to it. If False, do not prefetch.
+                        Doesn't really make much sense without caching
+                        enabled too.
             cache:      If True, cache the retrieved data using
                         kcidb.orm.Cache. If False, do not cache.
             sort:       If True, sort data fetched from the source (useful for
                         tests). If False, do not sort.
+            cache_max_objs:     Maximum number of objects (and pattern
+                                responses) to keep cached, or None for no
+                                limit. See kcidb.orm.Cache.
+            cache_max_bytes:    Maximum estimated size of the cache, in
+                                bytes, or None for no limit.
+                                See kcidb.orm.Cache.
+            cache_max_age:      Maximum age of the cached data, in seconds,
+                                or None for no limit. See kcidb.orm.Cache.
         """
         assert isinstance(source, Source)
+        assert isinstance(prefetch, (bool, kcidb.orm.PrefetchPolicy))
         assert isinstance(sort, bool)
         self.source = source
         self.cache = None
+        self.prefetcher = None
         if cache:
-            self.cache = kcidb.orm.Cache(self.source)
+            self.cache = kcidb.orm.Cache(self.source,
+                                         max_objs=cache_max_objs,
+                                         max_bytes=cache_max_bytes,
+                                         max_age=cache_max_age)
             self.source = self.cache
         if prefetch:
-            self.source = kcidb.orm.Prefetcher(self.source)
+            self.prefetcher = kcidb.orm.Prefetcher(
+                self.source, None if prefetch is True else prefetch
+            )
+            self.source = self.prefetcher
         self.sort = sort
 
     def query(self, pattern_set):
@@ -790,9 +805,44 @@ class Client:
         """
         Reset the cache, if enabled. No effect, if the cache was disabled.
         """
+        self.wait_prefetch()
         if self.cache:
             self.cache.reset()
 
+    def invalidate_cache(self, pattern_set):
+        """
+        Invalidate cached data, which could be affected by (re)loading
+        objects matching a pattern set, if the cache is enabled.
+        See kcidb.orm.Cache.invalidate().
+
+        Args:
+            pattern_set:    A set of patterns ("kcidb.orm.query.Pattern"
+                            instances) matching the loaded objects, and
+                            possibly their parents.
+        """
+        assert isinstance(pattern_set, set)
+        assert all(isinstance(r, Pattern) for r in pattern_set)
+        self.wait_prefetch()
+        if self.cache:
+            self.cache.invalidate(pattern_set)
+
+    def wait_prefetch(self):
+        """
+        Wait for background prefetching to complete, if enabled and running.
+        """
+        if self.prefetcher:
+            self.prefetcher.wait()
+
+    def get_cache_stats(self):
+        """
+        Get cache statistics, if enabled.
+
+        Returns:
+            The cache statistics (see kcidb.orm.Cache.get_stats()), or None,
+            if the cache was disabled.
+        """
+        return self.cache and self.cache.get_stats()
+
 
 class ArgumentParser(kcidb.misc.ArgumentParser):
     """
@@ -849,7 +899,8 @@ def query_main():
     pattern_set = set()
     for pattern_string in args.pattern_strings:
         pattern_set |= Pattern.parse(pattern_string)
-    kcidb.misc.json_dump(
-        db_client.oo_query(pattern_set),
-        sys.stdout, indent=args.indent, seq=args.seq_out
-    )
+    with kcidb.misc.json_output_open(args.compress) as output:
+        kcidb.misc.json_dump(
+            db_client.oo_query(pattern_set),
+            output, indent=args.indent, seq=args.seq_out
+        )
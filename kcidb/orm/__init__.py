@@ -3,8 +3,12 @@ Kernel CI report object-relational mapping (ORM) - report data organized into
 objects, but without the object-oriented interface.
 """
 
+import json
+import time
 import logging
+import threading
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 import kcidb.misc
 from kcidb.misc import LIGHT_ASSERTS
 from kcidb.orm import query, data
@@ -32,18 +36,163 @@ class Source(ABC):
         assert all(isinstance(r, query.Pattern) for r in pattern_set)
 
 
+class PrefetchPolicy:
+    """A policy for prefetching descendants of retrieved root objects"""
+
+    def __init__(self, type_names=None, depth=None, max_objs=None,
+                 background=False):
+        """
+        Initialize the prefetching policy.
+
+        Args:
+            type_names: A set of names of object types to prefetch, or None
+                        to prefetch objects of all types. Descendants are
+                        only prefetched through the prefetched types.
+            depth:      Maximum number of levels of descendants to prefetch
+                        (a positive integer), or None for no limit.
+            max_objs:   Maximum number of objects to prefetch (a positive
+                        integer), or None for no limit. If specified, the
+                        descendants are prefetched one level at a time,
+                        stopping after the level reaching the limit.
+            background: True if the descendants should be prefetched in a
+                        background thread, letting the response reach the
+                        caller before that. The source must support being
+                        used from another thread (one at a time).
+                        False if they should be prefetched before returning
+                        the response.
+        """
+        assert type_names is None or \
+            isinstance(type_names, (set, frozenset)) and \
+            type_names <= set(data.SCHEMA.types)
+        assert depth is None or isinstance(depth, int) and depth > 0
+        assert max_objs is None or isinstance(max_objs, int) and max_objs > 0
+        assert isinstance(background, bool)
+        self.type_names = None if type_names is None \
+            else frozenset(type_names)
+        self.depth = depth
+        self.max_objs = max_objs
+        self.background = background
+
+    def get_child_pattern_set(self, base_set):
+        """
+        Create patterns for children of specified patterns, which should be
+        prefetched according to the policy.
+
+        Args:
+            base_set:   The set of patterns to create child patterns for.
+
+        Returns:
+            The set of patterns for the children to prefetch.
+        """
+        assert isinstance(base_set, set)
+        assert all(isinstance(base, query.Pattern) for base in base_set)
+        return {
+            query.Pattern(base, True, relation.child)
+            for base in base_set
+            for relation in base.obj_type.children.values()
+            if self.type_names is None or
+            relation.child.name in self.type_names
+        }
+
+
 class Prefetcher(Source):
     """A prefetching source of object-oriented data"""
 
-    def __init__(self, source):
+    def __init__(self, source, policy=None):
         """
         Initialize the prefetching source.
 
         Args:
             source: The source to request objects from.
+            policy: The prefetching policy (PrefetchPolicy), or None to
+                    prefetch all descendants before returning responses.
         """
         assert isinstance(source, Source)
+        assert policy is None or isinstance(policy, PrefetchPolicy)
         self.source = source
+        self.policy = policy or PrefetchPolicy()
+        # The background prefetching thread, if any
+        self.thread = None
+
+    def wait(self):
+        """
+        Wait for background prefetching to complete, if it's running.
+        """
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _prefetch(self, response):
+        """
+        Prefetch descendants of root objects in a response, according to
+        the policy.
+
+        Args:
+            response:   The response to prefetch the descendants for.
+
+        Returns:
+            The number of prefetched objects, or None, if unknown.
+        """
+        policy = self.policy
+        # Generate patterns for root objects
+        base_set = set()
+        for obj_type_name, objs in response.items():
+            obj_type = data.SCHEMA.types[obj_type_name]
+            if not obj_type.parents and objs:
+                base_set.add(query.Pattern(
+                    None, True, obj_type,
+                    {obj_type.get_id(obj) for obj in objs}
+                ))
+        level = 0
+
+        # If there's no limit on the number of objects
+        if policy.max_objs is None:
+            # Prefetch all levels at once
+            prefetch_pattern_set = set()
+            while base_set and (policy.depth is None or level < policy.depth):
+                base_set = policy.get_child_pattern_set(base_set)
+                prefetch_pattern_set |= base_set
+                level += 1
+            if prefetch_pattern_set:
+                LOGGER.debug("Prefetching %r", prefetch_pattern_set)
+                self.source.oo_query(prefetch_pattern_set)
+            return None
+
+        # Otherwise prefetch one level at a time,
+        # basing each on the objects fetched for the previous one
+        obj_num = 0
+        while base_set and (policy.depth is None or level < policy.depth) \
+                and obj_num < policy.max_objs:
+            prefetch_pattern_set = policy.get_child_pattern_set(base_set)
+            if not prefetch_pattern_set:
+                break
+            LOGGER.debug("Prefetching %r", prefetch_pattern_set)
+            base_set = set()
+            for obj_type_name, objs in \
+                    self.source.oo_query(prefetch_pattern_set).items():
+                obj_type = data.SCHEMA.types[obj_type_name]
+                if objs:
+                    base_set.add(query.Pattern(
+                        None, True, obj_type,
+                        {obj_type.get_id(obj) for obj in objs}
+                    ))
+                    obj_num += len(objs)
+            level += 1
+        return obj_num
+
+    def _prefetch_background(self, response):
+        """
+        Prefetch descendants of root objects in a response, according to
+        the policy, logging any failures, as the caller's gone.
+
+        Args:
+            response:   The response to prefetch the descendants for.
+        """
+        try:
+            self._prefetch(response)
+        # Prefetching is just an optimization
+        except Exception:  # pylint: disable=broad-exception-caught
+            LOGGER.exception("Background prefetching failed")
 
     def oo_query(self, pattern_set):
         """
@@ -58,47 +207,75 @@ class Prefetcher(Source):
         """
         assert isinstance(pattern_set, set)
         assert all(isinstance(r, query.Pattern) for r in pattern_set)
+        # Don't use the source while prefetching
+        self.wait()
         # First fetch the response we were asked for
         response = self.source.oo_query(pattern_set)
-        # Generate patterns for all children of fetched root objects
-        prefetch_pattern_set = set()
-        for obj_type_name, objs in response.items():
-            obj_type = data.SCHEMA.types[obj_type_name]
-            if not obj_type.parents and objs:
-                # TODO Get rid of formatting and parsing
-                # It isn't,
-                # pylint: disable=bad-option-value,unnecessary-dunder-call
-                prefetch_pattern_set |= query.Pattern.parse(
-                    query.Pattern(
-                        None, True, obj_type,
-                        {
-                            tuple(str(part) for part in obj_type.get_id(obj))
-                            for obj in objs
-                        }
-                    ).
-                    __repr__(final=False) + ">*#"
-                )
-        # Prefetch, if generated any patterns
-        if prefetch_pattern_set:
-            LOGGER.debug("Prefetching %r", prefetch_pattern_set)
-            self.source.oo_query(prefetch_pattern_set)
-
+        # Prefetch the descendants
+        if self.policy.background:
+            self.thread = threading.Thread(
+                target=self._prefetch_background, args=(response,),
+                name="prefetch", daemon=True
+            )
+            self.thread.start()
+        else:
+            self._prefetch(response)
         # Return the response for the original request
         return response
 
 
 class Cache(Source):
     """A cache source of object-oriented data"""
+    # It's OK, pylint: disable=too-many-instance-attributes
 
-    def __init__(self, source):
+    # It's OK, pylint: disable=too-many-arguments
+    # Or if you prefer, pylint: disable=too-many-positional-arguments
+    def __init__(self, source, batch_size=256,
+                 max_objs=None, max_bytes=None, max_age=None):
         """
         Initialize the cache source.
 
         Args:
-            source: The source to request uncached objects from.
+            source:     The source to request uncached objects from.
+            batch_size: Maximum number of uncached patterns to request from
+                        the source with a single query (along with their
+                        uncached bases).
+            max_objs:   Maximum number of objects to keep cached, counting
+                        each cached pattern response as an object too, or
+                        None for no limit. Least recently used pattern
+                        responses are evicted after each query exceeding
+                        the limit.
+            max_bytes:  Maximum estimated size of the cached objects and
+                        pattern responses, in bytes, or None for no limit.
+                        Least recently used pattern responses are evicted
+                        after each query exceeding the limit.
+            max_age:    Maximum age of the cached data, in seconds, or None
+                        for no limit. The cache is reset before a query,
+                        once that much time passed since its last reset.
+                        Bounds the staleness of data updated without the
+                        cache being invalidated.
         """
         assert isinstance(source, Source)
+        assert isinstance(batch_size, int) and batch_size > 0
+        assert max_objs is None or \
+            isinstance(max_objs, int) and max_objs >= 0
+        assert max_bytes is None or \
+            isinstance(max_bytes, int) and max_bytes >= 0
+        assert max_age is None or \
+            isinstance(max_age, (int, float)) and max_age > 0
         self.source = source
+        self.batch_size = batch_size
+        self.max_objs = max_objs
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        # Numbers of patterns found and not found in the cache,
+        # and numbers of patterns evicted from it and invalidated,
+        # and number of times it expired
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.expirations = 0
         self.reset()
 
     def reset(self):
@@ -106,7 +283,145 @@ class Cache(Source):
         Reset the cache.
         """
         self.type_id_objs = {type_name: {} for type_name in data.SCHEMA.types}
-        self.pattern_responses = {}
+        # Numbers of cached pattern responses referencing each cached
+        # object, and estimated sizes of the objects, by type and ID
+        self.type_id_refs = {type_name: {} for type_name in data.SCHEMA.types}
+        self.type_id_bytes = {
+            type_name: {} for type_name in data.SCHEMA.types
+        }
+        # Pattern responses, least recently used first
+        self.pattern_responses = OrderedDict()
+        # Number of cached objects, and estimated size (in bytes) of cached
+        # objects and pattern responses
+        self.obj_num = 0
+        self.byte_num = 0
+        # The (monotonic) time of the reset
+        self.reset_time = time.monotonic()
+
+    def get_stats(self):
+        """
+        Get cache statistics.
+
+        Returns:
+            A dictionary with the numbers of patterns found ("hits"), and
+            not found ("misses") in the cache, the numbers of patterns
+            evicted from it ("evictions") and invalidated
+            ("invalidations"), the number of times it was reset for
+            exceeding its maximum age ("expirations"), the numbers of cached
+            patterns ("patterns") and objects ("objs"), and their estimated
+            size in bytes ("bytes").
+        """
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            invalidations=self.invalidations,
+            expirations=self.expirations,
+            patterns=len(self.pattern_responses),
+            objs=self.obj_num,
+            bytes=self.byte_num,
+        )
+
+    def _ref_objs(self, response):
+        """
+        Reference cached objects from a response being cached.
+
+        Args:
+            response:   The response to reference the objects of.
+                        The objects must be in self.type_id_objs.
+        """
+        for type_name, objs in response.items():
+            get_id = data.SCHEMA.types[type_name].get_id
+            id_refs = self.type_id_refs[type_name]
+            id_bytes = self.type_id_bytes[type_name]
+            for obj in objs:
+                # We like our "id", pylint: disable=invalid-name
+                id = get_id(obj)
+                assert id in self.type_id_objs[type_name]
+                if id in id_refs:
+                    id_refs[id] += 1
+                else:
+                    id_refs[id] = 1
+                    id_bytes[id] = len(json.dumps(obj))
+                    self.obj_num += 1
+                    self.byte_num += id_bytes[id]
+
+    def _unref_objs(self, response):
+        """
+        Unreference cached objects from a response being uncached,
+        dropping the objects no longer referenced by any cached responses.
+
+        Args:
+            response:   The response to unreference the objects of.
+        """
+        for type_name, objs in response.items():
+            get_id = data.SCHEMA.types[type_name].get_id
+            id_objs = self.type_id_objs[type_name]
+            id_refs = self.type_id_refs[type_name]
+            id_bytes = self.type_id_bytes[type_name]
+            for obj in objs:
+                # We like our "id", pylint: disable=invalid-name
+                id = get_id(obj)
+                id_refs[id] -= 1
+                if not id_refs[id]:
+                    del id_objs[id]
+                    del id_refs[id]
+                    self.obj_num -= 1
+                    self.byte_num -= id_bytes.pop(id)
+
+    def _cache_pattern(self, pattern, response):
+        """
+        Store a pattern response in the cache as the most recently used one,
+        replacing any cached response to the same pattern.
+
+        Args:
+            pattern:    The pattern to store the response for.
+            response:   The response to store. The objects must be in
+                        self.type_id_objs.
+        """
+        assert isinstance(pattern, query.Pattern)
+        old_response = self.pattern_responses.pop(pattern, None)
+        self.pattern_responses[pattern] = response
+        self._ref_objs(response)
+        if old_response is None:
+            self.byte_num += len(repr(pattern))
+        else:
+            self._unref_objs(old_response)
+
+    def _uncache_pattern(self, pattern):
+        """
+        Remove a pattern response from the cache.
+
+        Args:
+            pattern:    The pattern to remove the response for.
+                        Must be cached.
+        """
+        assert isinstance(pattern, query.Pattern)
+        self._unref_objs(self.pattern_responses.pop(pattern))
+        self.byte_num -= len(repr(pattern))
+
+    def _is_full(self):
+        """
+        Check if the cache exceeds its capacity.
+
+        Returns:
+            True if the cache exceeds its capacity, False otherwise.
+        """
+        return self.max_objs is not None and \
+            self.obj_num + len(self.pattern_responses) > self.max_objs or \
+            self.max_bytes is not None and \
+            self.byte_num > self.max_bytes
+
+    def _evict(self):
+        """
+        Evict least recently used pattern responses from the cache, until
+        it fits into its capacity.
+        """
+        while self.pattern_responses and self._is_full():
+            pattern = next(iter(self.pattern_responses))
+            self._uncache_pattern(pattern)
+            self.evictions += 1
+            LOGGER.debug("Evicted from the cache: %r", pattern)
 
     def _merge_pattern_response(self, pattern, response):
         """
@@ -136,7 +451,8 @@ class Cache(Source):
         id_objs = self.type_id_objs[type_name]
         base_pattern = pattern.base
         base_type = base_pattern and base_pattern.obj_type
-        cached = set()
+        # The responses to cache
+        cached = {}
         # For each object in the response
         for obj in objs:
             # Deduplicate or cache the object
@@ -160,13 +476,9 @@ class Cache(Source):
                     child=True, obj_type=pattern.obj_type
                 )
                 if parent_child_pattern in cached:
-                    r = self.pattern_responses[parent_child_pattern]
-                    r[type_name].append(obj)
+                    cached[parent_child_pattern][type_name].append(obj)
                 elif parent_child_pattern not in self.pattern_responses:
-                    self.pattern_responses[parent_child_pattern] = {
-                        type_name: [obj]
-                    }
-                    cached.add(parent_child_pattern)
+                    cached[parent_child_pattern] = {type_name: [obj]}
 
         # If we've just loaded all children of the parent pattern
         if (
@@ -187,12 +499,10 @@ class Cache(Source):
                     child=True, obj_type=pattern.obj_type
                 )
                 # If we don't have its children cached
-                if parent_child_pattern not in self.pattern_responses:
+                if parent_child_pattern not in self.pattern_responses and \
+                   parent_child_pattern not in cached:
                     # Store the fact that it has none
-                    self.pattern_responses[parent_child_pattern] = {
-                        type_name: []
-                    }
-                    cached.add(parent_child_pattern)
+                    cached[parent_child_pattern] = {type_name: []}
 
         # For every parent-child relation of this pattern's type
         for child_relation in pattern.obj_type.children.values():
@@ -201,6 +511,14 @@ class Cache(Source):
                 base=pattern, child=True, obj_type=child_relation.child
             )
             if sub_pattern in self.pattern_responses:
+                # Group the children by their parents
+                child_type = child_relation.child
+                parent_id_children = {}
+                for child_obj in \
+                        self.pattern_responses[sub_pattern][child_type.name]:
+                    parent_id_children.setdefault(
+                        child_type.get_parent_id(type_name, child_obj), []
+                    ).append(child_obj)
                 # For each object in our response
                 for obj in objs:
                     # Create pattern for its children of this type
@@ -213,18 +531,21 @@ class Cache(Source):
                         obj_type=child_relation.child,
                     )
                     # If we don't have its children cached
-                    if parent_child_pattern not in self.pattern_responses:
-                        # Store the fact that it has none
-                        self.pattern_responses[parent_child_pattern] = {
-                            child_relation.child.name: []
+                    if parent_child_pattern not in self.pattern_responses \
+                       and parent_child_pattern not in cached:
+                        # Store them, as the sub-pattern response has all
+                        # of them (even if their cached facts were evicted)
+                        cached[parent_child_pattern] = {
+                            child_type.name:
+                            parent_id_children.get(get_id(obj), [])
                         }
-                        cached.add(parent_child_pattern)
 
-        # Add pattern response to the cache
-        self.pattern_responses[pattern] = response
-        cached.add(pattern)
+        # Add pattern response and the facts to the cache
+        cached[pattern] = response
+        for cached_pattern, cached_response in cached.items():
+            self._cache_pattern(cached_pattern, cached_response)
         # Log cached patterns
-        LOGGER.debug("Cached patterns %r", cached)
+        LOGGER.debug("Cached patterns %r", set(cached))
         if LOGGER.getEffectiveLevel() <= logging.INFO:
             LOGGER.debug(
                 "Cache has %s",
@@ -234,11 +555,224 @@ class Cache(Source):
                         for type_name, id_objs in self.type_id_objs.items()
                         if id_objs
                     )
-                    + (f"{len(self.pattern_responses)} patterns",)
+                    + (f"{len(self.pattern_responses)} patterns",
+                       f"~{self.byte_num} bytes")
                 ),
             )
         return response
 
+    @staticmethod
+    def _is_stale(pattern, response, type_id_objs):
+        """
+        Check if a cached pattern response could be affected by
+        (re)loading specified objects.
+
+        Args:
+            pattern:        The cached pattern.
+            response:       The cached response to the pattern.
+            type_id_objs:   A dictionary of type names and dictionaries of
+                            IDs and current data of the loaded objects,
+                            or None for their (possibly derived) parents,
+                            which weren't loaded themselves.
+
+        Returns:
+            True if the response could be stale, False otherwise.
+        """
+        assert isinstance(pattern, query.Pattern)
+        obj_type = pattern.obj_type
+        id_objs = type_id_objs.get(obj_type.name)
+        if not id_objs:
+            return False
+        # If the response has any of the objects (even if they moved)
+        if any(obj_type.get_id(obj) in id_objs
+               for obj in response[obj_type.name]):
+            return True
+        # If the pattern is limited to other IDs
+        if pattern.obj_id_set is not None:
+            return not pattern.obj_id_set.isdisjoint(id_objs)
+        base = pattern.base
+        # If the pattern is for children of specific parents (e.g. a fact)
+        if base is not None and base.base is None and pattern.child and \
+           base.obj_id_set is not None:
+            # Only the loaded objects could have changed their parents
+            return any(
+                obj_type.get_parent_id(base.obj_type.name, obj) in
+                base.obj_id_set
+                for obj in id_objs.values() if obj is not None
+            )
+        # Otherwise any object of the type could match
+        return True
+
+    def invalidate(self, pattern_set):
+        """
+        Invalidate cached responses, which could be affected by (re)loading
+        objects matching a pattern set, so they're fetched from the source
+        again. Only the objects matched by the patterns without bases are
+        considered loaded, and only those are fetched from the source. The
+        patterns with bases (such as the parents the loader publishes as
+        updated) are ignored, and the direct parents of the loaded objects
+        are invalidated instead, as the data of derived parents
+        (e.g. revisions) changes with them.
+
+        Args:
+            pattern_set:    A set of patterns ("kcidb.orm.query.Pattern"
+                            instances) matching the loaded objects, and
+                            possibly their parents.
+
+        Returns:
+            The number of invalidated pattern responses.
+        """
+        assert isinstance(pattern_set, set)
+        assert all(isinstance(r, query.Pattern) for r in pattern_set)
+        root_pattern_set = {
+            pattern for pattern in pattern_set if pattern.base is None
+        }
+        if not self.pattern_responses or not root_pattern_set:
+            return 0
+        # Get the current data of the loaded objects
+        type_id_objs = {
+            type_name: {
+                data.SCHEMA.types[type_name].get_id(obj): obj
+                for obj in objs
+            }
+            for type_name, objs in
+            self.source.oo_query(root_pattern_set).items()
+        }
+        # Add the IDs of their parents
+        type_parent_ids = {}
+        for type_name, id_objs in type_id_objs.items():
+            obj_type = data.SCHEMA.types[type_name]
+            for parent_type_name in obj_type.parents:
+                type_parent_ids.setdefault(parent_type_name, set()).update(
+                    obj_type.get_parent_id(parent_type_name, obj)
+                    for obj in id_objs.values()
+                )
+        for type_name, parent_ids in type_parent_ids.items():
+            id_objs = type_id_objs.setdefault(type_name, {})
+            for parent_id in parent_ids:
+                if None not in parent_id:
+                    id_objs.setdefault(parent_id, None)
+        stale_patterns = [
+            pattern
+            for pattern, response in self.pattern_responses.items()
+            if self._is_stale(pattern, response, type_id_objs)
+        ]
+        for pattern in stale_patterns:
+            self._uncache_pattern(pattern)
+        self.invalidations += len(stale_patterns)
+        LOGGER.debug("Invalidated patterns %r", set(stale_patterns))
+        return len(stale_patterns)
+
+    def _is_batchable(self, pattern):
+        """
+        Check if a pattern can be fetched from the source in a batch with
+        other patterns. That is, if the objects matching its uncached bases
+        (which need to be fetched along with it) are limited by IDs.
+
+        Args:
+            pattern:    The pattern to check.
+
+        Returns:
+            True if the pattern can be fetched in a batch, False otherwise.
+        """
+        assert isinstance(pattern, query.Pattern)
+        while pattern.base is not None:
+            pattern = pattern.base
+            if pattern in self.pattern_responses:
+                return True
+        return pattern.obj_id_set is not None
+
+    @staticmethod
+    def _get_pattern_objs(pattern, response, base_objs):
+        """
+        Extract objects matching a pattern from a response to a query
+        containing it, given the objects matching its base.
+
+        Args:
+            pattern:    The pattern to extract the objects for.
+            response:   The response to extract the objects from.
+            base_objs:  The list of objects matching the pattern's base,
+                        or None if the pattern has no base.
+
+        Returns:
+            The list of objects matching the pattern.
+        """
+        assert isinstance(pattern, query.Pattern)
+        assert (base_objs is None) == (pattern.base is None)
+        obj_type = pattern.obj_type
+        objs = response.get(obj_type.name, [])
+        get_id = obj_type.get_id
+
+        # Match the relations and IDs the way the databases do,
+        # never matching NULLs
+        if pattern.base is not None:
+            base_type = pattern.base.obj_type
+            if pattern.child:
+                base_ids = {base_type.get_id(obj) for obj in base_objs}
+                base_ids = {id for id in base_ids if None not in id}
+                objs = [
+                    obj for obj in objs
+                    if obj_type.get_parent_id(base_type.name, obj)
+                    in base_ids
+                ]
+            else:
+                parent_ids = {
+                    base_type.get_parent_id(obj_type.name, obj)
+                    for obj in base_objs
+                }
+                parent_ids = {id for id in parent_ids if None not in id}
+                objs = [obj for obj in objs if get_id(obj) in parent_ids]
+        if pattern.obj_id_set is not None:
+            objs = [
+                obj for obj in objs
+                if get_id(obj) in pattern.obj_id_set and
+                None not in get_id(obj)
+            ]
+        return objs
+
+    def _fetch_batch(self, pattern_list):
+        """
+        Fetch uncached patterns and their uncached bases from the source
+        with a single query, split the response per pattern, and merge it
+        into the cache.
+
+        Args:
+            pattern_list:   The list of uncached patterns to fetch.
+                            Each must be batchable (see _is_batchable()).
+        """
+        assert isinstance(pattern_list, list)
+        assert all(self._is_batchable(pattern) for pattern in pattern_list)
+        # Collect the patterns to fetch, along with their uncached bases,
+        # and the depths of their base chains
+        pattern_depths = {}
+        for pattern in pattern_list:
+            chain = []
+            while pattern is not None and \
+                    pattern not in self.pattern_responses:
+                chain.insert(0, pattern)
+                pattern = pattern.base
+            pattern_depths.update(
+                (chain_pattern, depth)
+                for depth, chain_pattern in enumerate(chain)
+            )
+        response = self.source.oo_query(set(pattern_depths))
+        # Split the response per pattern, bases first
+        pattern_objs = {}
+        for pattern in sorted(pattern_depths, key=pattern_depths.get):
+            base = pattern.base
+            base_objs = None
+            if base is not None:
+                base_objs = pattern_objs.get(base)
+                if base_objs is None:
+                    base_objs = \
+                        self.pattern_responses[base][base.obj_type.name]
+            pattern_objs[pattern] = \
+                self._get_pattern_objs(pattern, response, base_objs)
+            self._merge_pattern_response(
+                pattern, {pattern.obj_type.name: pattern_objs[pattern]}
+            )
+            LOGGER.debug("Merged into the cache: %r", pattern)
+
     def oo_query(self, pattern_set):
         """
         Retrieve raw data for objects specified via a pattern set.
@@ -253,22 +787,40 @@ class Cache(Source):
         assert isinstance(pattern_set, set)
         assert all(isinstance(r, query.Pattern) for r in pattern_set)
 
-        # Start with an empty response
-        response_type_id_objs = {}
+        # Reset the cache, if its data got too old
+        if self.max_age is not None and \
+           time.monotonic() - self.reset_time >= self.max_age:
+            LOGGER.debug("Cache expired, resetting")
+            self.reset()
+            self.expirations += 1
 
-        # For each pattern
+        # Fetch uncached patterns, batching them where possible
+        batch_list = []
         for pattern in pattern_set:
-            # Try to get the response from the cache
-            pattern_response = self.pattern_responses.get(pattern)
-            # If not found
-            if pattern_response is None:
+            if pattern in self.pattern_responses:
+                self.hits += 1
+                continue
+            self.misses += 1
+            if self._is_batchable(pattern):
+                batch_list.append(pattern)
+            else:
                 # Query the source and merge the response into the cache
-                pattern_response = self._merge_pattern_response(
+                self._merge_pattern_response(
                     pattern, self.source.oo_query({pattern})
                 )
                 LOGGER.debug("Merged into the cache: %r", pattern)
-            else:
-                LOGGER.debug("Fetched from the cache: %r", pattern)
+        for batch in kcidb.misc.isliced(batch_list, self.batch_size):
+            self._fetch_batch(list(batch))
+
+        # Start with an empty response
+        response_type_id_objs = {}
+
+        # For each pattern
+        for pattern in pattern_set:
+            # Get the response from the cache, marking it recently used
+            pattern_response = self.pattern_responses[pattern]
+            self.pattern_responses.move_to_end(pattern)
+            LOGGER.debug("Fetched from the cache: %r", pattern)
             # Merge into the overall response
             for type_name, objs in pattern_response.items():
                 get_id = data.SCHEMA.types[type_name].get_id
@@ -283,6 +835,9 @@ class Cache(Source):
             for type_name, id_objs in response_type_id_objs.items()
         }
         assert LIGHT_ASSERTS or data.SCHEMA.is_valid(response)
+        # Fit the cache into its capacity, now that we don't need the
+        # responses anymore
+        self._evict()
         return response
 
 
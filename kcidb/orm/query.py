@@ -12,6 +12,8 @@ import kcidb.io as io
 import kcidb.misc
 from kcidb.misc import LIGHT_ASSERTS
 
+# It's OK for now, pylint: disable=too-many-lines
+
 # A (verbose) regular expression pattern matching an unquoted ID field
 _PATTERN_STRING_ID_FIELD_UNQUOTED_PATTERN = """
     [\x30-\x39\x41-\x5a\x61-\x7a_:/.?%+-]+
@@ -204,6 +206,40 @@ class Pattern:
     def __hash__(self):
         return self._hash
 
+    def subsumes(self, other):
+        """
+        Check if this pattern matches all the objects another pattern
+        matches. That is, if this pattern's base chain matches the end of
+        the other pattern's chain, with the same object types and relations,
+        and limited to the same IDs or their superset (or not limited) at
+        each level. Since relations map each object separately, the other
+        pattern can't match anything this one doesn't.
+
+        Args:
+            other:  The pattern to check.
+
+        Returns:
+            True if this pattern subsumes the other one, False if it might
+            not.
+        """
+        assert isinstance(other, Pattern)
+        pattern = self
+        while True:
+            if pattern.obj_type != other.obj_type:
+                return False
+            if pattern.obj_id_set is not None and (
+                other.obj_id_set is None or
+                not other.obj_id_set <= pattern.obj_id_set
+            ):
+                return False
+            # The root matches any objects of its type and IDs
+            if pattern.base is None:
+                return True
+            if other.base is None or pattern.child != other.child:
+                return False
+            pattern = pattern.base
+            other = other.base
+
     @staticmethod
     def _format_id_field(id_field):
         """
@@ -329,7 +365,7 @@ class Pattern:
 
     @staticmethod
     def _expand_relation(schema, base_set,
-                         child, obj_type_expr, obj_str_id_set):
+                         child, obj_type_expr, get_obj_id_set):
         """
         Expand a single level of parent/child relation into a list of
         patterns, for a parsed pattern specification.
@@ -344,8 +380,10 @@ class Pattern:
             obj_type_expr:  Object type expression, one of:
                             "*" - all child/parent types,
                             or a name of the specific child/parent type.
-            obj_str_id_set: The set/frozenset of object string IDs to limit
-                            the pattern to, or None to not limit the pattern.
+            get_obj_id_set: A function returning the set/frozenset of IDs
+                            to limit the pattern for the type
+                            (kcidb.orm.data.Type) passed to it to, or None
+                            to not limit the pattern.
 
         Returns:
             Two values: a set of new patterns expanded from the
@@ -357,12 +395,7 @@ class Pattern:
         assert all(isinstance(base, Pattern) for base in base_set)
         assert isinstance(child, bool)
         assert isinstance(obj_type_expr, str)
-        assert obj_str_id_set is None or \
-            (isinstance(obj_str_id_set, (set, frozenset)) and
-             all(isinstance(obj_str_id, tuple) and
-                 all(isinstance(str_part, (str, type(None)))
-                     for str_part in obj_str_id)
-                 for obj_str_id in obj_str_id_set))
+        assert callable(get_obj_id_set)
 
         new_set = set()
         unused_set = set()
@@ -380,11 +413,8 @@ class Pattern:
                 for obj_type in related_types:
                     if obj_type_expr in ("*", obj_type.name):
                         base_new_set.add(
-                            Pattern(
-                                base, child, obj_type,
-                                Pattern._parse_obj_str_id_set(obj_type,
-                                                              obj_str_id_set)
-                            )
+                            Pattern(base, child, obj_type,
+                                    get_obj_id_set(obj_type))
                         )
                 # If we have expanded to something
                 if base_new_set:
@@ -402,11 +432,8 @@ class Pattern:
             for obj_type_name, obj_type in schema.types.items():
                 if obj_type_expr in ("*", obj_type_name):
                     new_set.add(
-                        Pattern(
-                            None, child, obj_type,
-                            Pattern._parse_obj_str_id_set(obj_type,
-                                                          obj_str_id_set)
-                        )
+                        Pattern(None, child, obj_type,
+                                get_obj_id_set(obj_type))
                     )
             # If we have expanded to nothing
             if not new_set and obj_type_expr != "*":
@@ -418,7 +445,7 @@ class Pattern:
     # It's OK for now, pylint: disable=too-many-positional-arguments
     @staticmethod
     def _expand(schema, base_set, match_set, child, obj_type_expr,
-                obj_str_id_set, match_spec):
+                get_obj_id_set, match_spec):
         """
         Expand a parsed pattern specification into a list of referenced
         patterns, and a list of matching patterns.
@@ -435,8 +462,10 @@ class Pattern:
             obj_type_expr:  Object type expression, one of:
                             "*" - all children/parents,
                             or a name of the specific type.
-            obj_str_id_set: The set/frozenset of object string IDs to limit
-                            the pattern to, or None to not limit the pattern.
+            get_obj_id_set: A function returning the set/frozenset of IDs
+                            to limit the pattern for the type
+                            (kcidb.orm.data.Type) passed to it to, or None
+                            to not limit the pattern.
             match_spec:     The matching specification string ("#", or "$"),
                             or None, if expanded patterns shouldn't be marked
                             for matching.
@@ -450,18 +479,13 @@ class Pattern:
         assert isinstance(match_set, set)
         assert isinstance(child, bool)
         assert isinstance(obj_type_expr, str)
-        assert obj_str_id_set is None or \
-            (isinstance(obj_str_id_set, (set, frozenset)) and
-             all(isinstance(obj_str_id, tuple) and
-                 all(isinstance(str_part, (str, type(None)))
-                     for str_part in obj_str_id)
-                 for obj_str_id in obj_str_id_set))
+        assert callable(get_obj_id_set)
         assert match_spec in (None, "#", "$")
 
         ref_set = set()
         while True:
             base_set, unused_set = Pattern._expand_relation(
-                schema, base_set, child, obj_type_expr, obj_str_id_set)
+                schema, base_set, child, obj_type_expr, get_obj_id_set)
             if obj_type_expr == "*":
                 ref_set |= unused_set
                 if match_spec == "$":
@@ -770,7 +794,10 @@ class Pattern:
             try:
                 base_set = Pattern._expand(
                     schema, base_set, match_set, relation == ">",
-                    obj_type_expr, obj_str_id_set, match_spec
+                    obj_type_expr,
+                    lambda obj_type, obj_str_id_set=obj_str_id_set:
+                    Pattern._parse_obj_str_id_set(obj_type, obj_str_id_set),
+                    match_spec
                 )
             except Exception as exc:
                 raise Exception(
@@ -784,6 +811,61 @@ class Pattern:
             )
         return match_set
 
+    # It's OK, pylint: disable=too-many-positional-arguments
+    @staticmethod
+    def expand(base_set, child, obj_type_expr="*", obj_id_set=None,
+               match_spec="#", schema=None):
+        """
+        Expand a set of patterns into patterns for their children or
+        parents, the same way a "pattern" part of a pattern string would
+        (see kcidb.orm.query.Pattern.STRING_DOC), but without formatting
+        and parsing pattern strings.
+
+        E.g. Pattern.expand(pattern_set, False) is equivalent to parsing
+        the string representations of patterns in pattern_set, each
+        suffixed with "<*#".
+
+        Args:
+            base_set:       The set of patterns to base the created patterns
+                            on. Empty set means patterns shouldn't be based
+                            on anything (based on the "root" object).
+            child:          True if the created patterns are for children
+                            of the bases (">"). False for parents ("<").
+            obj_type_expr:  Object type expression, one of:
+                            "*" - all children/parents (recursively),
+                            or a name of the specific type.
+            obj_id_set:     The set/frozenset of IDs to limit the created
+                            patterns to, or None to not limit them. Each ID
+                            is a tuple of values of the ID fields of the
+                            object type. Can only be specified with a
+                            specific object type.
+            match_spec:     The matching specification string ("#", or "$"),
+                            or None, if created patterns shouldn't be marked
+                            for matching.
+            schema:         An object type schema to use, or None to use
+                            kcidb.orm.data.SCHEMA.
+
+        Returns:
+            Two sets of created patterns: the ones referenced by the
+            specification (to base further expansion on), and the ones
+            marked for matching.
+        """
+        assert isinstance(base_set, (set, frozenset))
+        assert all(isinstance(base, Pattern) for base in base_set)
+        assert isinstance(child, bool)
+        assert isinstance(obj_type_expr, str)
+        assert obj_id_set is None or obj_type_expr != "*"
+        assert match_spec in (None, "#", "$")
+        assert schema is None or isinstance(schema, Schema)
+        if schema is None:
+            schema = SCHEMA
+        match_set = set()
+        ref_set = Pattern._expand(
+            schema, set(base_set), match_set, child, obj_type_expr,
+            lambda obj_type: obj_id_set, match_spec
+        )
+        return ref_set, match_set
+
     @staticmethod
     def from_io(io_data, schema=None, max_objs=0, copy=True):
         """
@@ -847,6 +929,182 @@ class Pattern:
                 )
         return pattern_set
 
+    @staticmethod
+    def normalize(pattern_set):
+        """
+        Normalize a pattern set, merging patterns which differ only in the
+        IDs they're limited to, at a single level of their base chains,
+        into one pattern, limited to the union of the IDs at that level.
+        Since relations map each object separately, the normalized set
+        matches the same objects, but has fewer (and denser) patterns.
+
+        Args:
+            pattern_set:    The set of patterns to normalize.
+
+        Returns:
+            The normalized set of patterns.
+        """
+        assert isinstance(pattern_set, (set, frozenset))
+        assert all(isinstance(pattern, Pattern) for pattern in pattern_set)
+
+        # Convert patterns to tuples of (child, obj_type, obj_id_set)
+        # tuples for each level of their chains, starting from the root
+        chain_set = set()
+        for pattern in pattern_set:
+            chain = []
+            while pattern is not None:
+                chain.insert(0, (pattern.child, pattern.obj_type,
+                                 pattern.obj_id_set))
+                pattern = pattern.base
+            chain_set.add(tuple(chain))
+
+        # Merge chains differing at one level, until none are left
+        merged = True
+        while merged:
+            merged = False
+            max_len = max((len(chain) for chain in chain_set), default=0)
+            # Start from the leaves, where the most patterns differ
+            for index in range(max_len - 1, -1, -1):
+                # Chains keyed by everything except IDs at the index
+                groups = {}
+                for chain in chain_set:
+                    if len(chain) > index:
+                        key = (chain[:index], chain[index][:2],
+                               chain[index + 1:])
+                    else:
+                        key = (chain, )
+                    groups.setdefault(key, []).append(chain)
+                chain_set = set()
+                for chains in groups.values():
+                    if len(chains) == 1:
+                        chain_set.add(chains[0])
+                        continue
+                    obj_id_sets = [chain[index][2] for chain in chains]
+                    obj_id_set = None if None in obj_id_sets \
+                        else frozenset().union(*obj_id_sets)
+                    chain = chains[0]
+                    chain_set.add(
+                        chain[:index] + (chain[index][:2] + (obj_id_set,),) +
+                        chain[index + 1:]
+                    )
+                    merged = True
+
+        # Convert chains back to patterns
+        normalized_set = set()
+        for chain in chain_set:
+            pattern = None
+            for child, obj_type, obj_id_set in chain:
+                pattern = Pattern(pattern, child, obj_type, obj_id_set)
+            normalized_set.add(pattern)
+        return normalized_set
+
+    @staticmethod
+    def prune(pattern_set):
+        """
+        Remove patterns subsumed by other patterns from a pattern set
+        (see Pattern.subsumes()). The pruned set matches the same objects.
+
+        Args:
+            pattern_set:    The set of patterns to prune.
+
+        Returns:
+            The pruned set of patterns.
+        """
+        assert isinstance(pattern_set, (set, frozenset))
+        assert all(isinstance(pattern, Pattern) for pattern in pattern_set)
+        # Index the patterns by type, and by the IDs they're limited to,
+        # as a subsuming pattern has to be unlimited, or has to have all
+        # the IDs of the subsumed one
+        type_unlimited = {}
+        type_id_patterns = {}
+        for pattern in pattern_set:
+            if pattern.obj_id_set is None:
+                type_unlimited.setdefault(pattern.obj_type.name, []). \
+                    append(pattern)
+            else:
+                id_patterns = type_id_patterns.setdefault(
+                    pattern.obj_type.name, {}
+                )
+                for obj_id in pattern.obj_id_set:
+                    id_patterns.setdefault(obj_id, []).append(pattern)
+
+        pruned_set = set()
+        for pattern in pattern_set:
+            type_name = pattern.obj_type.name
+            candidates = type_unlimited.get(type_name, [])
+            if pattern.obj_id_set:
+                candidates = candidates + \
+                    type_id_patterns[type_name][next(iter(pattern.obj_id_set))]
+            elif pattern.obj_id_set is not None:
+                candidates = [c for c in pattern_set
+                              if c.obj_type.name == type_name]
+            if not any(candidate is not pattern and candidate.subsumes(pattern)
+                       for candidate in candidates):
+                pruned_set.add(pattern)
+        return pruned_set
+
+
+class Planner:
+    """
+    A query planner, canonicalizing pattern sets before they're queried,
+    and keeping the statistics.
+    """
+
+    def __init__(self):
+        """
+        Initialize the planner.
+        """
+        # Number of planned pattern sets
+        self.sets = 0
+        # Number of patterns received, removed by merging, removed as
+        # subsumed, and output
+        self.input_patterns = 0
+        self.merged_patterns = 0
+        self.subsumed_patterns = 0
+        self.output_patterns = 0
+
+    def plan(self, pattern_set):
+        """
+        Canonicalize a pattern set for querying: merge patterns differing
+        only in IDs (see Pattern.normalize()), and remove patterns subsumed
+        by others (see Pattern.prune()). The planned set matches the same
+        objects.
+
+        Args:
+            pattern_set:    The set of patterns to plan.
+
+        Returns:
+            The planned set of patterns.
+        """
+        assert isinstance(pattern_set, (set, frozenset))
+        assert all(isinstance(pattern, Pattern) for pattern in pattern_set)
+        normalized_set = Pattern.normalize(pattern_set)
+        planned_set = Pattern.prune(normalized_set)
+        self.sets += 1
+        self.input_patterns += len(pattern_set)
+        self.merged_patterns += len(pattern_set) - len(normalized_set)
+        self.subsumed_patterns += len(normalized_set) - len(planned_set)
+        self.output_patterns += len(planned_set)
+        return planned_set
+
+    def get_stats(self):
+        """
+        Get planning statistics.
+
+        Returns:
+            A dictionary with the numbers of planned pattern sets ("sets"),
+            patterns received ("input_patterns"), removed by merging
+            ("merged_patterns"), removed as subsumed ("subsumed_patterns"),
+            and output ("output_patterns").
+        """
+        return dict(
+            sets=self.sets,
+            input_patterns=self.input_patterns,
+            merged_patterns=self.merged_patterns,
+            subsumed_patterns=self.subsumed_patterns,
+            output_patterns=self.output_patterns,
+        )
+
 
 class PatternHelpAction(argparse.Action):
     """Argparse action outputting pattern string help and exiting."""
@@ -1,5 +1,6 @@
 """kcdib.db module tests"""
 
+import os
 import re
 import textwrap
 import time
@@ -494,9 +495,10 @@ def test_all_fields(empty_database):
     assert io_data == client.dump(with_metadata=False)
 
 
-def test_metadata_introduction(clean_database):
+@pytest.mark.parametrize("online", [False, True])
+def test_metadata_introduction(clean_database, online):
     """
-    Check metadata generation works right on database upgrade.
+    Check metadata generation works right on (online) database upgrade.
     """
     # It's OK, pylint: disable=too-many-branches
     client = clean_database
@@ -581,7 +583,7 @@ def test_metadata_introduction(clean_database):
     client.load(pre_metadata_schema[1].upgrade(pre_metadata_io))
     after_load = client.get_current_time()
     # Upgrade to post-metadata schema
-    client.upgrade(post_metadata_schema[0])
+    client.upgrade(post_metadata_schema[0], online=online)
     after_upgrade = client.get_current_time()
     # Get the upgraded data with metadata
     post_metadata_io = client.dump(with_metadata=True)
@@ -2899,3 +2901,157 @@ def test_dump_limits(empty_database):
             client.dump(until=now)
         with pytest.raises(kcidb.db.misc.NoTimestamps):
             client.dump(after=now, until=now)
+
+
+def test_dump_limits_merged(empty_database):
+    """
+    Test time-limited dumps include the data of objects which arrived
+    before the limits
+    """
+    client = empty_database
+    io_schema = client.get_schema()[1]
+    drivers = [*client.driver.drivers] \
+        if isinstance(client.driver, kcidb.db.mux.Driver) \
+        else [client.driver]
+    # If this is a database and schema which *should* support time limits
+    if not all(
+        isinstance(driver,
+                   (kcidb.db.bigquery.Driver,
+                    kcidb.db.postgresql.Driver,
+                    kcidb.db.sqlite.Driver)) and
+        driver.get_schema()[0] >= (4, 2)
+        for driver in drivers
+    ):
+        return
+    version = dict(major=io_schema.major, minor=io_schema.minor)
+    client.load(dict(
+        version=version,
+        checkouts=[dict(id="test:checkout:1", origin="test")],
+        builds=[dict(id="test:build:1", origin="test",
+                     checkout_id="test:checkout:1")],
+    ))
+    time.sleep(1)
+    after = client.get_current_time()
+    time.sleep(1)
+    # Have the checkout fields arrive on both sides of the limit
+    client.load(dict(
+        version=version,
+        checkouts=[dict(id="test:checkout:1", origin="test",
+                        tree_name="mainline")],
+    ))
+    assert client.dump(with_metadata=False, after=after) == dict(
+        version=version,
+        checkouts=[dict(id="test:checkout:1", origin="test",
+                        tree_name="mainline")],
+    )
+
+
+def test_merge_iter():
+    """Check merging I/O data through a temporary database works"""
+    io_schema = kcidb.io.SCHEMA
+    assert not list(kcidb.db.merge_iter([]))
+    merged = list(kcidb.db.merge_iter([COMPREHENSIVE_IO_DATA]))
+    assert merged == [COMPREHENSIVE_IO_DATA]
+
+    # Check duplicates are merged and the output is split
+    report_a = dict(
+        version=dict(major=io_schema.major, minor=io_schema.minor),
+        checkouts=[dict(id="test:checkout:1", origin="test")],
+        builds=[dict(id="test:build:1", origin="test",
+                     checkout_id="test:checkout:1")],
+    )
+    report_b = dict(
+        version=dict(major=io_schema.major, minor=io_schema.minor),
+        checkouts=[dict(id="test:checkout:1", origin="test",
+                        tree_name="mainline")],
+        builds=[dict(id="test:build:2", origin="test",
+                     checkout_id="test:checkout:1")],
+    )
+    reports = list(kcidb.db.merge_iter([report_a, report_b],
+                                       objects_per_report=2))
+    assert [io_schema.count(report) for report in reports] == [2, 1]
+    merged = io_schema.merge(io_schema.new(), reports)
+    assert merged["checkouts"] == [
+        dict(id="test:checkout:1", origin="test", tree_name="mainline")
+    ]
+    assert sorted(build["id"] for build in merged["builds"]) == \
+        ["test:build:1", "test:build:2"]
+
+    # Check conflicting values are taken from the latest dataset,
+    # consistently
+    report_c = dict(
+        version=dict(major=io_schema.major, minor=io_schema.minor),
+        checkouts=[dict(id="test:checkout:1", origin="test",
+                        tree_name="next")],
+    )
+    for _ in range(4):
+        merged, = kcidb.db.merge_iter([report_b, report_c])
+        assert merged["checkouts"] == report_c["checkouts"]
+        merged, = kcidb.db.merge_iter([report_c, report_b])
+        assert merged["checkouts"] == report_b["checkouts"]
+
+
+def test_dump_tables(empty_database, tmp_path):
+    """Test dumping and exporting table rows works, where supported"""
+    # It's OK, pylint: disable=too-many-locals
+    io_data = COMPREHENSIVE_IO_DATA
+    client = empty_database
+    client.load(io_data, with_metadata=True)
+    try:
+        batches = list(client.dump_tables_iter(rows_per_batch=1))
+    except kcidb.db.misc.NoTableDump:
+        return
+    table_columns = {}
+    table_rows = {}
+    table_values = {}
+    for table_name, columns, rows in batches:
+        assert table_columns.setdefault(table_name, columns) == columns
+        assert len(rows) <= 1
+        assert all(len(row) == len(columns) for row in rows)
+        table_rows[table_name] = table_rows.get(table_name, 0) + len(rows)
+        table_values.setdefault(table_name, []).extend(rows)
+    # Enumerated values are exported as plain strings
+    for table_name, column_name in (("builds", "status"),
+                                    ("tests", "status"),
+                                    ("tests", "number_prefix")):
+        assert table_columns[table_name][column_name] == "string"
+    assert table_rows == {
+        obj_list_name: len(io_data.get(obj_list_name, []))
+        for obj_list_name in kcidb.io.SCHEMA.id_fields
+    }
+    # Nothing arrived in the far future
+    after = datetime.datetime(3000, 1, 1, tzinfo=datetime.timezone.utc)
+    assert not any(
+        rows for _, _, rows in client.dump_tables_iter(after=after)
+    )
+
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+    paths = kcidb.db.export.write_tables(
+        client.dump_tables_iter(rows_per_batch=1), str(tmp_path)
+    )
+    assert len(paths) == len(table_columns)
+    for path in paths:
+        table_name = os.path.basename(path).split(".")[0]
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        assert parquet_file.schema_arrow.names == \
+            list(table_columns[table_name])
+        assert parquet_file.metadata.num_rows == table_rows[table_name]
+        assert parquet_file.metadata.num_row_groups == \
+            max(table_rows[table_name], 1)
+        # Check the exported values match the dumped ones
+        exported_rows = parquet_file.read().to_pylist()
+        assert len(exported_rows) == len(table_values[table_name])
+        for exported_row, row in zip(exported_rows,
+                                     table_values[table_name]):
+            for (column_name, export_type), value in \
+                    zip(table_columns[table_name].items(), row):
+                exported_value = exported_row[column_name]
+                if value is None:
+                    assert exported_value is None
+                elif export_type == "json":
+                    assert json.loads(exported_value) == value
+                elif export_type == "timestamp":
+                    assert exported_value == dateutil.parser.isoparse(value)
+                else:
+                    assert exported_value == value
@@ -0,0 +1,235 @@
+"""kcdib.loader module tests"""
+
+import json
+import math
+import time
+import threading
+from unittest.mock import Mock
+import pytest
+from google.cloud import pubsub
+import kcidb
+
+
+def make_subscriber(message_data_list):
+    """
+    Create an I/O subscriber with a mock client, returning the specified
+    message data from pulls, one message per pull, then nothing.
+
+    Args:
+        message_data_list:  A list of message data (bytes) to return.
+
+    Returns:
+        The subscriber, and its mock client.
+    """
+    client = Mock(spec=pubsub.SubscriberClient)
+    lock = threading.Lock()
+    messages = [
+        Mock(ack_id=str(i), message=Mock(data=data, attributes={}))
+        for i, data in enumerate(message_data_list)
+    ]
+
+    def pull(subscription, max_messages, timeout):
+        assert subscription == subscriber.subscription_path
+        assert max_messages > 0
+        with lock:
+            if messages:
+                return Mock(received_messages=[messages.pop(0)])
+        time.sleep(min(timeout, 0.01))
+        return Mock(received_messages=[])
+
+    client.pull = pull
+    subscriber = kcidb.mq.IOSubscriber("project", "topic", "subscription",
+                                       client=client)
+    return subscriber, client
+
+
+def report(*checkout_ids):
+    """
+    Create an encoded report with checkouts with specified IDs.
+
+    Args:
+        checkout_ids:   The checkout IDs, without the origin.
+
+    Returns:
+        The report JSON, encoded into bytes.
+    """
+    data = kcidb.io.SCHEMA.new()
+    data["checkouts"] = [dict(id=f"test:{id}", origin="test")
+                         for id in checkout_ids]
+    return json.dumps(data).encode()
+
+
+def test_loader(tmp_path):
+    """Check the loader loads, ACKs, and reports stats"""
+    database = f"sqlite:{tmp_path / 'db.sqlite3'}"
+    db_client = kcidb.db.Client(database)
+    db_client.init()
+    subscriber, client = make_subscriber(
+        [report(1), b"{", report(2, 3), report(), report(4)]
+    )
+    loaded = []
+
+    def done_cb(data, obj_num):
+        loaded.append(obj_num)
+        if sum(loaded) == 4:
+            loader.stop()
+
+    loader = kcidb.loader.Loader(database, subscriber, msg_max=2,
+                                 pull_timeout=0.1, queue_size=1,
+                                 done_cb=done_cb)
+    loader.run()
+
+    assert sum(loaded) == 4
+    assert sorted(
+        checkout["id"] for checkout in db_client.dump()["checkouts"]
+    ) == ["test:1", "test:2", "test:3", "test:4"]
+    acked_ids = sorted(
+        ack_id
+        for call in client.acknowledge.call_args_list
+        for ack_id in call.kwargs["ack_ids"]
+    )
+    assert acked_ids == ["0", "1", "2", "3", "4"]
+    client.modify_ack_deadline.assert_not_called()
+    stats = loader.get_stats()
+    assert stats["pull"]["messages"] == 5
+    assert stats["decode"]["messages"] == 5
+    assert stats["decode"]["objects"] == 4
+    for name in ("merge", "load", "ack"):
+        assert stats[name]["messages"] == 4
+        assert stats[name]["objects"] == 4
+    for name, stage_stats in stats.items():
+        assert stage_stats["elapsed"] > 0, name
+        assert stage_stats["busy"] >= 0, name
+        assert str(loader.stats[name]).startswith(f"{name}: ")
+
+
+def test_loader_failure(tmp_path):
+    """Check the loader stops and reports stage failures"""
+    database = f"sqlite:{tmp_path / 'db.sqlite3'}"
+    db_client = kcidb.db.Client(database)
+    db_client.init()
+    subscriber, client = make_subscriber([report(1), report(2)])
+
+    def done_cb(data, obj_num):
+        raise Exception("Publishing failed")
+
+    loader = kcidb.loader.Loader(database, subscriber,
+                                 pull_timeout=0.1, done_cb=done_cb)
+    with pytest.raises(Exception, match="Publishing failed"):
+        loader.run()
+    # The first loaded message was ACK'ed before failing
+    assert "0" in client.acknowledge.call_args_list[0].kwargs["ack_ids"]
+
+
+def test_batch_sizer():
+    """Check the batch sizer adjusts limits within the bounds"""
+    sizer = kcidb.loader.BatchSizer(100, 1000, 1.0, smoothing=1)
+    assert sizer.get_limits() == (100, 1000)
+    assert sizer.get_metrics()["decision"] is None
+
+    # Slow loads shrink the limits to the target
+    assert sizer.update(100, 1000, 4.0, True) == "shrink"
+    assert sizer.get_limits() == (25, 250)
+    # On-target loads without backlog hold them
+    assert sizer.update(25, 250, 1.0, False) == "hold"
+    assert sizer.get_limits() == (25, 250)
+    # Fast loads with backlog grow them gradually
+    assert sizer.update(25, 250, 0.1, True) == "grow"
+    assert sizer.get_limits() == (50, 500)
+    # Fast loads without backlog hold them
+    assert sizer.update(10, 100, 0.01, False) == "hold"
+    assert sizer.get_limits() == (50, 500)
+    # Growth stops at the hard bounds
+    assert sizer.update(50, 500, 0.1, True) == "grow"
+    assert sizer.get_limits() == (100, 1000)
+    assert sizer.update(100, 1000, 0.1, True) == "hold"
+    assert sizer.get_limits() == (100, 1000)
+    # Shrinking stops at the hard minimums
+    assert sizer.update(1, 1000, 1000.0, True) == "shrink"
+    assert sizer.get_limits() == (1, 1)
+
+    metrics = sizer.get_metrics()
+    assert metrics["adjustments"] == 4
+    assert metrics["decision"] == "shrink"
+    assert metrics["obj_latency"] == 1.0
+    assert metrics["msg_obj_num"] == 1000
+    assert "decision=shrink" in str(sizer)
+
+    # Infinite object limit starts unbounded, and shrinks on slow loads
+    sizer = kcidb.loader.BatchSizer(100, math.inf, 1.0, smoothing=1)
+    assert sizer.get_limits() == (100, math.inf)
+    assert sizer.update(100, 200, 0.1, True) == "hold"
+    assert sizer.update(100, 200, 2.0, True) == "shrink"
+    assert sizer.get_limits() == (50, 100)
+
+
+def test_loader_load_target(tmp_path):
+    """Check the loader adjusts load limits, if requested"""
+    database = f"sqlite:{tmp_path / 'db.sqlite3'}"
+    db_client = kcidb.db.Client(database)
+    db_client.init()
+    subscriber, _ = make_subscriber([report(i) for i in range(10)])
+    loaded = []
+
+    def done_cb(data, obj_num):
+        loaded.append(obj_num)
+        if sum(loaded) == 10:
+            loader.stop()
+
+    loader = kcidb.loader.Loader(database, subscriber, msg_max=4,
+                                 pull_timeout=0.1, done_cb=done_cb,
+                                 load_target=1000)
+    loader.run()
+    assert len(db_client.dump()["checkouts"]) == 10
+    assert max(loaded) <= 4
+    assert loader.sizer.get_metrics()["obj_latency"] > 0
+    assert loader.get_limits() == loader.sizer.get_limits()
+
+
+def test_loader_slow_load(tmp_path, monkeypatch):
+    """
+    Check the loader keeps the messages leased through loads outliving the
+    subscription's ACK deadline, pulling from an SQLite message queue
+    """
+    database = f"sqlite:{tmp_path / 'db.sqlite3'}"
+    db_client = kcidb.db.Client(database)
+    db_client.init()
+    mq_filename = str(tmp_path / "mq.sqlite3")
+    publisher_client = kcidb.mq.sqlite.PublisherClient(mq_filename)
+    subscriber = kcidb.mq.IOSubscriber(
+        "project", "topic", "subscription",
+        client=kcidb.mq.sqlite.SubscriberClient(mq_filename)
+    )
+    publisher_client.create_topic(name=subscriber.topic_path)
+    subscriber.client.create_subscription(name=subscriber.subscription_path,
+                                          topic=subscriber.topic_path,
+                                          ack_deadline_seconds=1)
+    for i in range(3):
+        publisher_client.publish(topic=subscriber.topic_path, data=report(i))
+
+    orig_load = kcidb.db.Client.load
+
+    def slow_load(self, *args, **kwargs):
+        time.sleep(1.5)
+        return orig_load(self, *args, **kwargs)
+
+    monkeypatch.setattr(kcidb.db.Client, "load", slow_load)
+    loaded = []
+
+    def done_cb(data, obj_num):
+        loaded.append(obj_num)
+        if sum(loaded) == 3:
+            loader.stop()
+
+    loader = kcidb.loader.Loader(database, subscriber, msg_max=1,
+                                 pull_timeout=0.1, done_cb=done_cb,
+                                 lease_seconds=1, lease_interval=0.2)
+    loader.run()
+
+    # Every message was pulled and loaded once, and ACK'ed
+    assert loaded == [1, 1, 1]
+    assert loader.get_stats()["pull"]["messages"] == 3
+    assert len(db_client.dump()["checkouts"]) == 3
+    assert not kcidb.mq.sqlite.SubscriberClient(mq_filename).pull(
+        subscription=subscriber.subscription_path, max_messages=10, timeout=0
+    ).received_messages
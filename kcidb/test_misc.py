@@ -1,7 +1,9 @@
 """kcdib.misc module tests"""
 
 import datetime
+import gzip
 from pytest import raises
+import zstandard
 from jsonschema.exceptions import ValidationError
 import kcidb.misc
 
@@ -86,3 +88,68 @@ def test_timedelta_json_parse():
         dict(delta=dict(months=3)),
         datetime.datetime(2023, 4, 3, 2, 1, tzinfo=datetime.timezone.utc)
     ) == datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def test_json_loads_reject_nul():
+    """Check JSON loading rejects NUL characters"""
+    f = kcidb.misc.json_loads_reject_nul
+    assert f(b'{"a": ["b", 1]}') == dict(a=["b", 1])
+    # An escaped backslash followed by "u0000" is not a NUL
+    assert f(b'["\\\\u0000"]') == ["\\u0000"]
+    with raises(Exception, match="NUL character"):
+        f(b'["a\\u0000b"]')
+    with raises(Exception, match="NUL character"):
+        f(b'{"a": {"\\u0000": 1}}')
+
+
+def test_parallel_map():
+    """Check parallel_map() preserves order and propagates exceptions"""
+    f = kcidb.misc.parallel_map
+    items = list(range(-50, 50))
+    for jobs in (1, 2, 0):
+        assert list(f(abs, items, jobs=jobs)) == list(map(abs, items))
+        assert list(f(abs, items, jobs=jobs, max_pending=1)) == \
+            list(map(abs, items))
+        assert not list(f(abs, [], jobs=jobs))
+        results = f(abs, [1, "a", 2], jobs=jobs)
+        assert next(results) == 1
+        with raises(TypeError):
+            next(results)
+
+
+def test_decompress_iter():
+    """Check decompress_iter() detects and decompresses streams"""
+    def decompress(data, chunk_size):
+        return b"".join(kcidb.misc.decompress_iter(
+            data[i:i + chunk_size] for i in range(0, len(data), chunk_size)
+        ))
+
+    text = b'{"version": {"major": 4, "minor": 0}}\n' * 100
+    compressor = zstandard.ZstdCompressor()
+    for chunk_size in (1, 3, 1000, 100000):
+        assert decompress(b"", chunk_size) == b""
+        assert decompress(text, chunk_size) == text
+        assert decompress(gzip.compress(text), chunk_size) == text
+        assert decompress(gzip.compress(text) + gzip.compress(text),
+                          chunk_size) == text + text
+        assert decompress(compressor.compress(text), chunk_size) == text
+        assert decompress(compressor.compress(text) +
+                          compressor.compress(text),
+                          chunk_size) == text + text
+        with raises(Exception, match="Truncated gzip input"):
+            decompress(gzip.compress(text)[:-1], chunk_size)
+        with raises(Exception, match="Truncated zstd input"):
+            decompress(compressor.compress(text)[:-1], chunk_size)
+
+
+def test_compress():
+    """Check one-shot compression and decompression works"""
+    text = b"Hello, compression!" * 100
+    for compression in kcidb.misc.COMPRESSIONS:
+        compressed = kcidb.misc.compress(text, compression)
+        assert compressed != text
+        assert kcidb.misc.decompress(compressed, compression) == text
+        with raises(Exception, match=f"Invalid {compression} input"):
+            kcidb.misc.decompress(text, compression)
+    with raises(Exception, match="Invalid zstd input"):
+        kcidb.misc.decompress(kcidb.misc.compress(text, "gzip"), "zstd")
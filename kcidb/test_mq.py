@@ -1,8 +1,14 @@
 """kcdib.mq module tests"""
 
 import re
+import time
 import textwrap
 import json
+import concurrent.futures
+from unittest.mock import Mock, call
+import pytest
+from google.cloud import pubsub
+from google.api_core.exceptions import NotFound
 import kcidb
 from kcidb.unittest import assert_executes
 
@@ -18,7 +24,8 @@ def test_io_publisher_main_init():
         with patch("kcidb.mq.IOPublisher", return_value=publisher) as \
                 Publisher:
             status = function()
-        Publisher.assert_called_once_with("project", "topic")
+        Publisher.assert_called_once_with("project", "topic",
+                                          compression=None)
         publisher.init.assert_called_once()
         return status
     """)
@@ -36,7 +43,8 @@ def test_io_publisher_main_cleanup():
         with patch("kcidb.mq.IOPublisher", return_value=publisher) as \
                 Publisher:
             status = function()
-        Publisher.assert_called_once_with("project", "topic")
+        Publisher.assert_called_once_with("project", "topic",
+                                          compression=None)
         publisher.cleanup.assert_called_once()
         return status
     """)
@@ -64,7 +72,11 @@ def test_io_publisher_main_publish():
         with patch("kcidb.mq.IOPublisher", return_value=publisher) as \
                 Publisher:
             status = function()
-        Publisher.assert_called_once_with("project", "topic")
+        Publisher.assert_called_once_with("project", "topic",
+                                          coalesce_obj=0,
+                                          coalesce_size=0,
+                                          coalesce_linger=0,
+                                          compression=None)
         return status
     """)
 
@@ -83,6 +95,283 @@ def test_io_publisher_main_publish():
                                         json.dumps(empty) + "\n"))
 
 
+def test_io_publisher_coalesce():
+    """Check IOPublisher coalesces published reports"""
+    client = Mock(spec=pubsub.PublisherClient)
+    client.topic_path = Mock(return_value="topic_path")
+    message_futures = []
+
+    def publish(topic, data):
+        assert topic == "topic_path"
+        future = concurrent.futures.Future()
+        message_futures.append((json.loads(data), future))
+        return future
+    client.publish = publish
+
+    def report(*checkout_ids):
+        return dict(
+            version=dict(major=kcidb.io.SCHEMA.major,
+                         minor=kcidb.io.SCHEMA.minor),
+            checkouts=[dict(id=f"test:{id}", origin="test")
+                       for id in checkout_ids]
+        )
+
+    # Check the object limit
+    publisher = kcidb.mq.IOPublisher("project", "topic", client=client,
+                                     coalesce_obj=3)
+    futures = [publisher.future_publish(report(1)),
+               publisher.future_publish(report(2, 3)),
+               publisher.future_publish(report(4, 5)),
+               publisher.future_publish(report())]
+    assert len(message_futures) == 1
+    assert message_futures[0][0] == report(1, 2, 3)
+    publisher.flush()
+    assert len(message_futures) == 2
+    assert message_futures[1][0] == report(4, 5)
+    assert not any(future.done() for future in futures)
+    message_futures[0][1].set_result("id1")
+    message_futures[1][1].set_result("id2")
+    assert [future.result() for future in futures] == \
+        ["id1", "id1", "id2", "id2"]
+    del message_futures[:]
+
+    # Check the size limit
+    publisher = kcidb.mq.IOPublisher(
+        "project", "topic", client=client,
+        coalesce_size=len(json.dumps(report(1, 2)))
+    )
+    publisher.future_publish(report(1))
+    publisher.future_publish(report(2))
+    publisher.future_publish(report(3))
+    assert len(message_futures) == 1
+    assert message_futures[0][0] == report(1, 2)
+    del message_futures[:]
+
+    # Check the linger timeout
+    publisher = kcidb.mq.IOPublisher("project", "topic", client=client,
+                                     coalesce_linger=0.1)
+    publisher.future_publish(report(1))
+    publisher.future_publish(report(2))
+    assert not message_futures
+    time.sleep(1)
+    assert len(message_futures) == 1
+    assert message_futures[0][0] == report(1, 2)
+    del message_futures[:]
+
+    # Check publishing errors are reported for each report
+    publisher = kcidb.mq.IOPublisher("project", "topic", client=client,
+                                     coalesce_obj=2)
+    futures = [publisher.future_publish(report(1)),
+               publisher.future_publish(report(2))]
+    message_futures[0][1].set_exception(Exception("Failed"))
+    for future in futures:
+        with pytest.raises(Exception, match="Failed"):
+            future.result()
+    del message_futures[:]
+
+    # Check publishing iterators and IDs
+    publisher = kcidb.mq.IOPublisher("project", "topic", client=client,
+                                     coalesce_obj=100)
+    publishing_ids = []
+    client.publish = lambda topic, data: \
+        Mock(add_done_callback=lambda cb: cb(
+            Mock(exception=lambda: None, result=lambda: "id")
+        ))
+    publisher.publish_iter((report(1), report(2)),
+                           done_cb=publishing_ids.append)
+    assert publishing_ids == ["id", "id"]
+
+
+def test_compression():
+    """Check message data compression is transparent to subscribers"""
+    publisher_client = Mock(spec=pubsub.PublisherClient)
+    publisher_client.topic_path = Mock(return_value="topic_path")
+    subscriber_client = Mock(spec=pubsub.SubscriberClient)
+    messages = []
+
+    def publish(topic, data, **attrs):
+        assert topic == "topic_path"
+        messages.append(Mock(data=data, attributes=attrs))
+        future = concurrent.futures.Future()
+        future.set_result(str(len(messages)))
+        return future
+    publisher_client.publish = publish
+
+    io_subscriber = kcidb.mq.IOSubscriber("project", "topic", "subscription",
+                                          client=subscriber_client)
+    pattern_subscriber = kcidb.mq.ORMPatternSubscriber(
+        "project", "topic", "subscription", client=subscriber_client
+    )
+    report = kcidb.io.SCHEMA.new()
+    report["checkouts"] = [dict(id="test:1", origin="test",
+                                comment="Compressible " * 100)]
+    pattern_set = kcidb.orm.query.Pattern.parse(">build[test:1]")
+    for compression in (None,) + kcidb.misc.COMPRESSIONS:
+        del messages[:]
+        kcidb.mq.IOPublisher(
+            "project", "topic", client=publisher_client,
+            compression=compression
+        ).publish(report)
+        kcidb.mq.IOPublisher(
+            "project", "topic", client=publisher_client,
+            compression=compression, coalesce_obj=1
+        ).publish(report)
+        kcidb.mq.ORMPatternPublisher(
+            "project", "topic", client=publisher_client,
+            compression=compression
+        ).publish(pattern_set)
+        assert len(messages) == 3
+        for message in messages:
+            if compression:
+                assert message.attributes == dict(compression=compression)
+            else:
+                assert message.attributes == {}
+        # It's a test, pylint: disable=protected-access
+        for message in messages[:2]:
+            if compression:
+                assert len(message.data) < \
+                    len(report["checkouts"][0]["comment"])
+            assert io_subscriber.decode_data(
+                io_subscriber._decompress(message)
+            ) == report
+        assert pattern_subscriber.decode_data(
+            pattern_subscriber._decompress(messages[2])
+        ) == pattern_set
+
+    # Check unsupported compression is detected
+    with pytest.raises(Exception, match="Unsupported message compression"):
+        # It's a test, pylint: disable=protected-access
+        io_subscriber._decompress(
+            Mock(data=b"", attributes=dict(compression="lzma"))
+        )
+
+
+def test_ack_many():
+    """Check subscribers (N)ACK messages in bulk"""
+    client = Mock(spec=pubsub.SubscriberClient)
+    client.subscription_path = Mock(return_value="subscription_path")
+    subscriber = kcidb.mq.IOSubscriber("project", "topic", "subscription",
+                                       client=client)
+    ack_ids = [str(i) for i in range(kcidb.mq.ACK_IDS_MAX * 2 + 1)]
+
+    subscriber.ack_many([])
+    subscriber.nack_many(iter([]))
+    client.acknowledge.assert_not_called()
+    client.modify_ack_deadline.assert_not_called()
+
+    subscriber.ack_many(iter(ack_ids))
+    assert client.acknowledge.call_args_list == [
+        call(subscription="subscription_path", ack_ids=ack_ids[:2500]),
+        call(subscription="subscription_path", ack_ids=ack_ids[2500:5000]),
+        call(subscription="subscription_path", ack_ids=ack_ids[5000:]),
+    ]
+    subscriber.nack_many(ack_ids[:3])
+    client.modify_ack_deadline.assert_called_once_with(
+        subscription="subscription_path", ack_ids=ack_ids[:3],
+        ack_deadline_seconds=0
+    )
+
+    # Check pulling (N)ACKs dropped and unprocessed messages in bulk
+    client.acknowledge.reset_mock()
+    client.modify_ack_deadline.reset_mock()
+    report = kcidb.io.SCHEMA.new()
+    report["checkouts"] = [dict(id="test:1", origin="test")]
+    client.pull = Mock(return_value=Mock(received_messages=[
+        Mock(ack_id=ack_id,
+             message=Mock(data=json.dumps(report).encode() if ack_id > "1"
+                          else b"{", attributes={}))
+        for ack_id in ("0", "1", "2", "3", "4", "5")
+    ]))
+    msgs = subscriber.pull(max_num=10, timeout=10, max_obj=2)
+    assert [msg[0] for msg in msgs] == ["2", "3"]
+    client.acknowledge.assert_called_once_with(
+        subscription="subscription_path", ack_ids=["0", "1"]
+    )
+    assert client.modify_ack_deadline.call_args_list == [
+        call(subscription="subscription_path", ack_ids=["4"],
+             ack_deadline_seconds=0),
+        call(subscription="subscription_path", ack_ids=["5"],
+             ack_deadline_seconds=0),
+    ]
+
+
+def test_stream(tmp_path):
+    """Check streaming pulls prefetch within limits and extend leases"""
+    filename = str(tmp_path / "mq.sqlite3")
+    publisher = kcidb.mq.JSONPublisher(
+        "project", "topic", client=kcidb.mq.sqlite.PublisherClient(filename)
+    )
+    subscriber = kcidb.mq.JSONSubscriber(
+        "project", "topic", "subscription",
+        client=kcidb.mq.sqlite.SubscriberClient(filename)
+    )
+    publisher.init()
+    subscriber.client.create_subscription(name=subscriber.subscription_path,
+                                          topic=subscriber.topic_path,
+                                          ack_deadline_seconds=1)
+    for i in range(10):
+        publisher.publish(i)
+    publisher.client.publish(topic=publisher.topic_path, data=b"{")
+
+    # Check messages are prefetched within limits, and decoded
+    with subscriber.stream(max_messages=4, timeout=0.5,
+                           pull_timeout=0.1) as stream:
+        received = []
+        for ack_id, data in stream:
+            assert stream.get_outstanding()[0] <= 4
+            received.append(data)
+            stream.ack(ack_id)
+        assert received == list(range(10))
+        assert stream.get_outstanding() == (0, 0)
+
+    publisher.publish(10)
+    publisher.publish(11)
+    other_client = kcidb.mq.sqlite.SubscriberClient(filename)
+    # Check leases are extended past the subscription's ACK deadline
+    with subscriber.stream(max_messages=2, timeout=0.5, pull_timeout=0.1,
+                           lease_seconds=1, lease_interval=0.2) as stream:
+        ack_id, data = next(stream)
+        assert data == 10
+        time.sleep(1.5)
+        assert not other_client.pull(subscription=subscriber.subscription_path,
+                                     max_messages=10,
+                                     timeout=0).received_messages
+        assert stream.get_outstanding() == (2, 4)
+    # Check the prefetched message is NACK'ed on close
+    messages = other_client.pull(subscription=subscriber.subscription_path,
+                                 max_messages=10, timeout=0).received_messages
+    assert [m.message.data for m in messages] == [b"11"]
+    other_client.acknowledge(subscription=subscriber.subscription_path,
+                             ack_ids=[messages[0].ack_id])
+    # Check the returned message stops being leased
+    time.sleep(1.1)
+    messages = other_client.pull(subscription=subscriber.subscription_path,
+                                 max_messages=10, timeout=0).received_messages
+    assert [m.message.data for m in messages] == [b"10"]
+
+    other_client.acknowledge(subscription=subscriber.subscription_path,
+                             ack_ids=[messages[0].ack_id])
+
+    # Check raw messages are returned, if requested
+    publisher.publish(12)
+    with subscriber.stream(timeout=0.5, pull_timeout=0.1,
+                           decode=False) as stream:
+        ack_id, message = next(stream)
+        assert subscriber.decode_message(message) == 12
+        stream.ack(ack_id)
+        assert stream.get_outstanding() == (0, 0)
+
+    # Check pulling failures are reported to the consumer
+    subscriber.client.delete_subscription(
+        subscription=subscriber.subscription_path
+    )
+    with subscriber.stream(pull_timeout=0.1) as stream:
+        with pytest.raises(NotFound):
+            next(stream)
+        with pytest.raises(NotFound):
+            next(stream)
+
+
 def test_io_subscriber_main_init():
     """Check kcidb-mq-io-subscriber init works"""
     argv = ["kcidb.mq.io_subscriber_main",
@@ -158,7 +447,8 @@ def test_pattern_publisher_main_init():
         with patch("kcidb.mq.ORMPatternPublisher",
                    return_value=publisher) as Publisher:
             status = function()
-        Publisher.assert_called_once_with("project", "topic")
+        Publisher.assert_called_once_with("project", "topic",
+                                          compression=None)
         publisher.init.assert_called_once()
         return status
     """)
@@ -176,7 +466,8 @@ def test_pattern_publisher_main_cleanup():
         with patch("kcidb.mq.ORMPatternPublisher",
                    return_value=publisher) as Publisher:
             status = function()
-        Publisher.assert_called_once_with("project", "topic")
+        Publisher.assert_called_once_with("project", "topic",
+                                          compression=None)
         publisher.cleanup.assert_called_once()
         return status
     """)
@@ -195,7 +486,8 @@ def test_pattern_publisher_main_publish():
              patch("kcidb.mq.ORMPatternPublisher.future_publish") \
              as future_publish:
             status = function()
-            init.assert_called_once_with("project", "topic")
+            init.assert_called_once_with("project", "topic",
+                                         compression=None)
         return status
     """)
     assert_executes("\n", *argv, driver_source=driver_source,
@@ -214,7 +506,8 @@ def test_pattern_publisher_main_publish():
              patch("kcidb.mq.ORMPatternPublisher.future_publish",
                    return_value=future) as future_publish:
             status = function()
-            init.assert_called_once_with("project", "topic")
+            init.assert_called_once_with("project", "topic",
+                                         compression=None)
             future_publish.assert_called_once_with(set())
         return status
     """)
@@ -235,7 +528,8 @@ def test_pattern_publisher_main_publish():
              patch("kcidb.mq.ORMPatternPublisher.future_publish",
                    return_value=future) as future_publish:
             status = function()
-            init.assert_called_once_with("project", "topic")
+            init.assert_called_once_with("project", "topic",
+                                         compression=None)
             future_publish.assert_called_once_with({
                 Pattern(
                     Pattern(
@@ -266,6 +560,43 @@ def test_pattern_publisher_main_publish():
                     stdout_re="id\n")
 
 
+def test_pattern_publisher_split():
+    """Check ORM pattern publishers split data into limited messages"""
+    client = Mock(spec=pubsub.PublisherClient)
+    client.topic_path = Mock(return_value="topic_path")
+    publisher = kcidb.mq.ORMPatternPublisher("project", "topic",
+                                             client=client)
+    id_list = [f"test:{i}" for i in range(100)]
+    pattern_set = \
+        kcidb.orm.query.Pattern.parse(
+            ">checkout[" + "; ".join(id_list) + "]#"
+        ) | \
+        kcidb.orm.query.Pattern.parse(">build[test:1]#<checkout#")
+
+    assert not list(publisher.split_data(set()))
+    assert list(publisher.split_data(pattern_set)) == [pattern_set]
+    for max_size in (1, 100, 500, 1000):
+        data_list = list(publisher.split_data(pattern_set, max_size))
+        # Patterns are split, as much as possible
+        for data in data_list:
+            size = len(publisher.encode_data(data))
+            assert size <= max_size or len(data) == 1
+        # All the objects are still matched
+        checkout_ids = set()
+        for data in data_list:
+            for pattern in data:
+                if pattern.obj_type.name == "checkout" and \
+                   pattern.base is None:
+                    checkout_ids |= pattern.obj_id_set
+        assert checkout_ids == {(id,) for id in id_list}
+        assert kcidb.orm.query.Pattern.normalize(
+            set().union(*data_list)
+        ) == pattern_set
+    assert len(list(publisher.split_data(pattern_set, 1))) == 102
+    assert len(list(publisher.split_data(pattern_set, 500))) == 2
+    assert len(list(publisher.split_data(pattern_set, 1000))) == 1
+
+
 def test_pattern_subscriber_main_init():
     """Check kcidb-mq-pattern-subscriber init works"""
     argv = ["kcidb.mq.pattern_subscriber_main",
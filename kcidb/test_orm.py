@@ -648,6 +648,177 @@ def test_pattern_from_io():
     }
 
 
+def test_pattern_expand():
+    """Check patterns are expanded the same way as pattern strings"""
+    def expand(base_set, child, obj_type_expr="*", obj_id_set=None,
+               match_spec="#"):
+        return kcidb.orm.query.Pattern.expand(
+            base_set, child, obj_type_expr, obj_id_set, match_spec, SCHEMA
+        )
+
+    for base_string, string in (
+        ("", ">checkout"),
+        ("", ">checkout[a; b]"),
+        ("", ">*"),
+        (">checkout[a]", ">*"),
+        (">checkout[a]", ">build"),
+        (">checkout[a; b]", ">build[x]"),
+        (">test[x]", "<*"),
+        (">test[x]", "<build"),
+        (">build_test_environment[x, y]", "<*"),
+        (">incident[x]", "<*"),
+        (">revision", ">*"),
+    ):
+        base_set = parse(base_string + "#") if base_string else set()
+        obj_type_expr = string[1:].split("[", maxsplit=1)[0]
+        spec = string[len(obj_type_expr) + 1:]
+        obj_id_set = kcidb.orm.query.Pattern.parse(
+            ">" + obj_type_expr + spec + "#", schema=SCHEMA
+        ).pop().obj_id_set if spec else None
+        for match_spec in ("#", "$", None):
+            ref_set, match_set = expand(
+                base_set, string[0] == ">", obj_type_expr, obj_id_set,
+                match_spec
+            )
+            assert match_set == parse(
+                base_string + string + (match_spec or "")
+            ) - (base_set if match_spec else set()), \
+                (base_string, string, match_spec)
+            # Specific types are referenced when expanded
+            if obj_type_expr != "*":
+                assert ref_set == parse(base_string + string + "#") - \
+                    base_set
+
+    # Check updated-object expansion matches the string version
+    pattern_set = parse(">test[x; y]#") | parse(">checkout[a]#")
+    assert pattern_set | expand(pattern_set, False)[1] == \
+        parse(">test[x; y]#<*#") | parse(">checkout[a]#<*#")
+    with pytest.raises(Exception, match="Cannot find parent type"):
+        expand(parse(">test[x]#"), False, "checkout")
+
+
+def test_pattern_normalize():
+    """Check pattern sets are normalized correctly"""
+    def parse_all(*pattern_strings):
+        return set().union(*map(parse, pattern_strings))
+
+    def normalize(*pattern_strings):
+        return kcidb.orm.query.Pattern.normalize(parse_all(*pattern_strings))
+
+    assert normalize() == set()
+    assert normalize(">checkout[a]#") == parse(">checkout[a]#")
+    # Leaf IDs are merged
+    assert normalize(">checkout[a]#", ">checkout[b]#") == \
+        parse(">checkout[a; b]#")
+    assert normalize(">checkout[a]#", ">checkout#") == parse(">checkout#")
+    # Base IDs are merged
+    assert normalize(">checkout[a]>build#", ">checkout[b]>build#") == \
+        parse(">checkout[a; b]>build#")
+    assert normalize(
+        ">checkout[a]>build[x]#", ">checkout[b]>build[x]#"
+    ) == parse(">checkout[a; b]>build[x]#")
+    assert normalize(
+        ">checkout[a]>build[x]#", ">checkout[a]>build[y]#",
+        ">checkout[b]>build[x]#", ">checkout[b]>build[y]#"
+    ) == parse(">checkout[a; b]>build[x; y]#")
+    # Patterns differing at more than one level are not
+    assert normalize(
+        ">checkout[a]>build[x]#", ">checkout[b]>build[y]#"
+    ) == parse_all(">checkout[a]>build[x]#", ">checkout[b]>build[y]#")
+    # Patterns of different types or relations are not
+    assert normalize(">checkout[a]#", ">build[b]#") == \
+        parse_all(">checkout[a]#", ">build[b]#")
+    assert normalize(">build[a]<checkout#", ">checkout[a]>build#") == \
+        parse_all(">build[a]<checkout#", ">checkout[a]>build#")
+    assert normalize(">build[a]<checkout#", ">build[a]#") == \
+        parse_all(">build[a]<checkout#", ">build[a]#")
+    # Updated object patterns from separate reports are merged
+    assert normalize(">test[x]#<build#<checkout#",
+                     ">test[y]#<build#<checkout#") == \
+        parse(">test[x; y]#<build#<checkout#")
+
+
+def test_pattern_prune():
+    """Check subsumed patterns are pruned correctly"""
+    def parse_all(*pattern_strings):
+        return set().union(*map(parse, pattern_strings))
+
+    def prune(*pattern_strings):
+        return kcidb.orm.query.Pattern.prune(parse_all(*pattern_strings))
+
+    assert prune() == set()
+    assert prune(">checkout[a]#") == parse(">checkout[a]#")
+    # Patterns limited to a subset of IDs are pruned
+    assert prune(">checkout[a]#", ">checkout[a; b]#") == \
+        parse(">checkout[a; b]#")
+    assert prune(">checkout[a]#", ">checkout#") == parse(">checkout#")
+    assert prune(">checkout[a]>build[x]#", ">checkout>build#") == \
+        parse(">checkout>build#")
+    assert prune(">checkout[a]>build[x]#", ">checkout[a; b]>build#") == \
+        parse(">checkout[a; b]>build#")
+    # Patterns with extra bases are pruned
+    assert prune(">checkout[a]>build[x]#", ">build[x; y]#") == \
+        parse(">build[x; y]#")
+    assert prune(">checkout[a]>build#", ">build#") == parse(">build#")
+    assert prune(">revision>checkout[a]>build#", ">checkout>build#") == \
+        parse(">checkout>build#")
+    # Patterns matching more objects at any level are not
+    assert prune(">checkout[a; b]>build#", ">checkout[a]>build#") == \
+        parse(">checkout[a; b]>build#")
+    assert prune(">checkout>build[x]#", ">checkout[a]>build#") == \
+        parse_all(">checkout>build[x]#", ">checkout[a]>build#")
+    assert prune(">checkout[a]#", ">checkout[b]#") == \
+        parse_all(">checkout[a]#", ">checkout[b]#")
+    assert prune(">build#", ">checkout>build#") == parse(">build#")
+    assert prune(">checkout>build#", ">revision>checkout>build#") == \
+        parse(">checkout>build#")
+    # Patterns of different types or relations are not
+    assert prune(">checkout[a]#", ">build[a]#") == \
+        parse_all(">checkout[a]#", ">build[a]#")
+    assert prune(">build[a]<checkout#", ">checkout>build<checkout#") == \
+        parse_all(">build[a]<checkout#", ">checkout>build<checkout#")
+    assert prune(">checkout[a]>build#", ">checkout>build<checkout>build#") \
+        == parse_all(">checkout[a]>build#",
+                     ">checkout>build<checkout>build#")
+
+
+def test_planner(source):
+    """Check the planner merges and prunes patterns, counting them"""
+    Pattern = kcidb.orm.query.Pattern
+    planner = kcidb.orm.query.Planner()
+    assert planner.plan(set()) == set()
+    assert planner.plan(
+        parse(">checkout[a]>build#") | parse(">checkout[b]>build#") |
+        parse(">checkout[a]>build[x]#") | parse(">build[y]#") |
+        parse(">revision>checkout>build[y]#")
+    ) == parse(">checkout[a; b]>build#") | parse(">build[y]#")
+    assert planner.get_stats() == dict(
+        sets=2, input_patterns=5, merged_patterns=2,
+        subsumed_patterns=1, output_patterns=2,
+    )
+
+    # Database clients plan the queries they receive
+    checkout_type = kcidb.orm.data.SCHEMA.types["checkout"]
+    pattern_set = {
+        Pattern(
+            Pattern(None, True, checkout_type, {checkout_type.get_id(obj)}),
+            True, kcidb.orm.data.SCHEMA.types["build"]
+        )
+        for obj in query_str(source, ">checkout#")["checkout"]
+    }
+    assert len(pattern_set) > 1
+    pattern_set |= Pattern.parse(">build#")
+    stats = source.planner.get_stats()
+    response = source.oo_query(pattern_set)
+    assert response == query_str(source, ">build#")
+    new_stats = source.planner.get_stats()
+    assert new_stats["sets"] == stats["sets"] + 2
+    assert new_stats["output_patterns"] == stats["output_patterns"] + 2
+    assert new_stats["subsumed_patterns"] == stats["subsumed_patterns"] + 1
+    assert new_stats["merged_patterns"] == \
+        stats["merged_patterns"] + len(pattern_set) - 2
+
+
 def test_pattern_repr():
     """Check various patterns can be converted to strings"""
     assert repr(pattern(None, True, "revision")) == ">revision#"
@@ -1983,3 +2154,351 @@ def test_incident(source):
             report_subject="Printer doesn't print",
             version_num=100,
         )])
+
+
+def test_cache_batching(source):
+    """Check the cache batches queries, responding the same way"""
+    # It's a test, pylint: disable=too-many-locals
+    class CountingSource(kcidb.orm.Source):
+        """A source counting the queries"""
+        def __init__(self, source):
+            self.source = source
+            self.pattern_sets = []
+
+        def oo_query(self, pattern_set):
+            self.pattern_sets.append(pattern_set)
+            return self.source.oo_query(pattern_set)
+
+    def sort(response):
+        return {
+            type_name: sorted(objs, key=repr)
+            for type_name, objs in response.items() if objs
+        }
+
+    # Create patterns for an object of each type, its parents and children
+    Pattern = kcidb.orm.query.Pattern
+    pattern_set = set()
+    for type_name, objs in query_str(source, ">*#").items():
+        obj_type = kcidb.orm.data.SCHEMA.types[type_name]
+        for obj in objs[:1]:
+            base_set = {Pattern(None, True, obj_type, {obj_type.get_id(obj)})}
+            pattern_set |= base_set
+            pattern_set |= Pattern.expand(base_set, True)[1]
+            pattern_set |= Pattern.expand(base_set, False)[1]
+            for relation in obj_type.children.values():
+                missing_id = tuple(
+                    "non-existent" if field_type is str else 0
+                    for field_type in relation.child.id_field_types.values()
+                )
+                pattern_set |= Pattern.expand(
+                    base_set, True, relation.child.name, {missing_id}
+                )[1]
+    # Add a couple patterns which can't be batched
+    pattern_set |= Pattern.parse(">checkout#") | Pattern.parse(">build#")
+
+    for batch_size in (3, 1000):
+        counting_source = CountingSource(source)
+        cache = kcidb.orm.Cache(counting_source, batch_size=batch_size)
+        assert sort(cache.oo_query(pattern_set)) == \
+            sort(source.oo_query(pattern_set))
+        batchable_num = len(pattern_set) - 2
+        assert len(counting_source.pattern_sets) == \
+            2 + -(-batchable_num // batch_size)
+        # Check every pattern response is cached correctly
+        for pattern in pattern_set:
+            assert sort(cache.oo_query({pattern})) == \
+                sort(source.oo_query({pattern})), pattern
+        assert len(counting_source.pattern_sets) == \
+            2 + -(-batchable_num // batch_size)
+
+
+def test_cache_eviction(source):
+    """Check the cache evicts least recently used responses consistently"""
+    Pattern = kcidb.orm.query.Pattern
+    checkout_type = kcidb.orm.data.SCHEMA.types["checkout"]
+    build_type = kcidb.orm.data.SCHEMA.types["build"]
+
+    def sort(response):
+        return {
+            type_name: sorted(objs, key=repr)
+            for type_name, objs in response.items() if objs
+        }
+
+    def check(cache):
+        """Check the cache agrees with the source, and with itself"""
+        for pattern, response in cache.pattern_responses.items():
+            assert sort(response) == sort(source.oo_query({pattern})), \
+                pattern
+        stats = cache.get_stats()
+        assert stats["patterns"] == len(cache.pattern_responses)
+        assert stats["objs"] == sum(
+            len(id_objs) for id_objs in cache.type_id_objs.values()
+        )
+
+    checkouts = query_str(source, ">checkout#")["checkout"]
+    base = Pattern(None, True, checkout_type,
+                   {checkout_type.get_id(obj) for obj in checkouts})
+    sub = Pattern(base, True, build_type)
+    builds = source.oo_query({sub})["build"]
+    assert builds
+
+    cache = kcidb.orm.Cache(source)
+    assert sort(cache.oo_query({sub})) == sort(source.oo_query({sub}))
+    # We got the parents, their children, and the facts for each parent
+    assert len(cache.pattern_responses) == 2 + len(checkouts)
+    check(cache)
+
+    # Limit the cache to the children response, evicting everything else
+    cache.max_objs = 1 + len(builds)
+    assert sort(cache.oo_query({sub})) == sort(source.oo_query({sub}))
+    assert list(cache.pattern_responses) == [sub]
+    assert cache.get_stats() == dict(
+        hits=1, misses=1, evictions=1 + len(checkouts), invalidations=0,
+        expirations=0, patterns=1, objs=len(builds), bytes=cache.byte_num
+    )
+    check(cache)
+
+    # Refetching the parents restores the facts from the children response
+    cache.max_objs = None
+    assert sort(cache.oo_query({base})) == sort(source.oo_query({base}))
+    assert len(cache.pattern_responses) == 2 + len(checkouts)
+    assert cache.get_stats()["misses"] == 2
+    check(cache)
+
+    # A cache without capacity responds, but keeps nothing
+    cache = kcidb.orm.Cache(source, max_bytes=0)
+    assert sort(cache.oo_query({base, sub})) == \
+        sort(source.oo_query({base, sub}))
+    assert not cache.pattern_responses
+    assert not any(cache.type_id_objs.values())
+    assert cache.get_stats() == dict(
+        hits=0, misses=2, evictions=2 + len(checkouts), invalidations=0,
+        expirations=0, patterns=0, objs=0, bytes=0
+    )
+
+
+def test_cache_invalidation(empty_database):
+    """Check the cache invalidates responses affected by loaded objects"""
+    source = empty_database
+    parse = kcidb.orm.query.Pattern.parse
+
+    def sort(response):
+        return {
+            type_name: sorted(objs, key=repr)
+            for type_name, objs in response.items() if objs
+        }
+
+    def load(**kwargs):
+        """Load objects, returning the patterns published as updated"""
+        data = dict(kcidb.io.SCHEMA.new(), **kwargs)
+        source.load(data)
+        return kcidb.loader.get_updated_patterns(data)
+
+    load(
+        checkouts=[dict(id="test:1", origin="test"),
+                   dict(id="test:2", origin="test")],
+        builds=[dict(id="test:1", origin="test", checkout_id="test:1")],
+    )
+    pattern_set = \
+        parse(">checkout[test:1]#>build#") | \
+        parse(">checkout[test:2]#>build#") | \
+        parse(">build[test:1]#<checkout#")
+    cache = kcidb.orm.Cache(source)
+    assert sort(cache.oo_query(pattern_set)) == \
+        sort(source.oo_query(pattern_set))
+    assert cache.invalidate(set()) == 0
+
+    # A new build invalidates the builds of its checkout only
+    other_builds = parse(">checkout[test:2]>build#")
+    assert other_builds <= set(cache.pattern_responses)
+    assert cache.invalidate(load(builds=[
+        dict(id="test:2", origin="test", checkout_id="test:1")
+    ])) > 0
+    assert other_builds <= set(cache.pattern_responses)
+    response = cache.oo_query(pattern_set)
+    assert sort(response) == sort(source.oo_query(pattern_set))
+    assert len(response["build"]) == 2
+
+    # An updated checkout is refetched
+    invalidations = cache.get_stats()["invalidations"]
+    assert cache.invalidate(load(checkouts=[
+        dict(id="test:2", origin="test", comment="Updated")
+    ])) > 0
+    assert cache.get_stats()["invalidations"] > invalidations
+    response = cache.oo_query(pattern_set)
+    assert sort(response) == sort(source.oo_query(pattern_set))
+    assert "Updated" in [obj.get("comment") for obj in response["checkout"]]
+    assert other_builds <= set(cache.pattern_responses)
+
+
+def test_cache_invalidation_cost(empty_database):
+    """
+    Check cache invalidation only fetches the loaded objects named by the
+    updated patterns, even for large pattern sets
+    """
+    source = empty_database
+    parse = kcidb.orm.query.Pattern.parse
+
+    class RecordingSource(kcidb.orm.Source):
+        """A source recording the queries"""
+        def __init__(self, source):
+            self.source = source
+            self.pattern_sets = []
+
+        def oo_query(self, pattern_set):
+            self.pattern_sets.append(pattern_set)
+            return self.source.oo_query(pattern_set)
+
+    def load(**kwargs):
+        """Load objects, returning the patterns published as updated"""
+        data = dict(kcidb.io.SCHEMA.new(), **kwargs)
+        source.load(data)
+        return kcidb.loader.get_updated_patterns(data)
+
+    commit_hash = "a" * 40
+    load(
+        checkouts=[dict(id="test:1", origin="test",
+                        git_commit_hash=commit_hash, patchset_hash=""),
+                   dict(id="test:2", origin="test")],
+        builds=[dict(id="test:1", origin="test", checkout_id="test:1"),
+                dict(id="test:2", origin="test", checkout_id="test:2")],
+    )
+    tests = parse(">build[test:1]#>test#")
+    other_tests = parse(">build[test:2]#>test#")
+    revision = parse(f'>revision[{commit_hash}, ""]#')
+    recording_source = RecordingSource(source)
+    cache = kcidb.orm.Cache(recording_source)
+    cache.oo_query(tests | other_tests | revision)
+
+    # Load a lot of tests, with their parents published as updated
+    pattern_set = load(tests=[
+        dict(id=f"test:{i}", origin="test", build_id="test:1")
+        for i in range(100)
+    ])
+    assert any(pattern.base is not None for pattern in pattern_set)
+    recording_source.pattern_sets = []
+    assert cache.invalidate(pattern_set) > 0
+    # Only the tests were fetched, without their parents
+    query_pattern_set, = recording_source.pattern_sets
+    assert all(pattern.base is None and pattern.obj_type.name == "test"
+               for pattern in query_pattern_set)
+    assert not parse(">build[test:1]>test#") <= set(cache.pattern_responses)
+    assert parse(">build[test:2]>test#") <= set(cache.pattern_responses)
+    assert revision <= set(cache.pattern_responses)
+    assert len(cache.oo_query(tests)["test"]) == 100
+
+    # An updated checkout invalidates its (derived) revision
+    assert cache.invalidate(load(checkouts=[
+        dict(id="test:1", origin="test", comment="Updated")
+    ])) > 0
+    assert not revision <= set(cache.pattern_responses)
+    assert parse(">build[test:2]>test#") <= set(cache.pattern_responses)
+
+
+def test_cache_expiry(empty_database, monkeypatch):
+    """Check the cache doesn't serve data older than its maximum age"""
+    source = empty_database
+    now = [0]
+
+    class FakeTime:
+        """A fake time module with a manually-advanced monotonic clock"""
+        @staticmethod
+        def monotonic():
+            """Get the current fake monotonic time"""
+            return now[0]
+
+    monkeypatch.setattr(kcidb.orm, "time", FakeTime)
+    pattern_set = kcidb.orm.query.Pattern.parse(">checkout[test:1]#")
+
+    def load_checkout(**kwargs):
+        """Load the checkout, without invalidating cache"""
+        source.load(dict(kcidb.io.SCHEMA.new(), checkouts=[
+            dict(id="test:1", origin="test", **kwargs)
+        ]))
+
+    def get_comment(response):
+        """Get the checkout comment from a response"""
+        checkout, = response["checkout"]
+        return checkout["comment"]
+
+    # Load the comment into a missing field only, so it's taken regardless
+    # of the database's load priority
+    load_checkout()
+    cache = kcidb.orm.Cache(source, max_age=60)
+    assert get_comment(cache.oo_query(pattern_set)) is None
+    load_checkout(comment="Updated")
+    # Served from the cache (stale) within the maximum age
+    now[0] = 59
+    assert get_comment(cache.oo_query(pattern_set)) is None
+    assert cache.get_stats()["expirations"] == 0
+    now[0] = 60
+    # Refetched after the maximum age
+    assert get_comment(cache.oo_query(pattern_set)) == "Updated"
+    stats = cache.get_stats()
+    assert stats["expirations"] == 1
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_prefetch_policy(source):
+    """Check the prefetcher follows its policy"""
+    Pattern = kcidb.orm.query.Pattern
+    PrefetchPolicy = kcidb.orm.PrefetchPolicy
+
+    class RecordingSource(kcidb.orm.Source):
+        """A source recording the queries"""
+        def __init__(self, source):
+            self.source = source
+            self.pattern_sets = []
+
+        def oo_query(self, pattern_set):
+            self.pattern_sets.append(pattern_set)
+            return self.source.oo_query(pattern_set)
+
+    pattern_set = Pattern.parse(">revision#")
+    revision_type = kcidb.orm.data.SCHEMA.types["revision"]
+    root_set = {Pattern(
+        None, True, revision_type,
+        {revision_type.get_id(obj)
+         for obj in source.oo_query(pattern_set)["revision"]}
+    )}
+    checkout_set = Pattern.expand(root_set, True, "checkout")[0]
+    assert checkout_set
+
+    def prefetch(policy):
+        """Query the revisions, and return the recorded prefetch queries"""
+        recording_source = RecordingSource(source)
+        prefetcher = kcidb.orm.Prefetcher(recording_source, policy)
+        assert prefetcher.oo_query(pattern_set) == \
+            source.oo_query(pattern_set)
+        prefetcher.wait()
+        assert recording_source.pattern_sets[0] == pattern_set
+        return recording_source.pattern_sets[1:]
+
+    # By default, all descendants are prefetched with one query
+    assert prefetch(None) == [Pattern.expand(root_set, True)[1]]
+    assert prefetch(PrefetchPolicy()) == prefetch(None)
+    # Only the specified types are prefetched, and only through them
+    assert prefetch(PrefetchPolicy(type_names={"checkout", "build"})) == \
+        [checkout_set | Pattern.expand(checkout_set, True, "build")[0]]
+    assert not prefetch(PrefetchPolicy(type_names={"build"}))
+    # Only the specified number of levels are prefetched
+    assert prefetch(PrefetchPolicy(depth=1)) == [checkout_set]
+    # With a limit on objects, levels are prefetched one at a time,
+    # until it's reached
+    pattern_sets = prefetch(PrefetchPolicy(max_objs=1000))
+    assert len(pattern_sets) > 1
+    assert pattern_sets[0] == checkout_set
+    assert all(pattern.base.base is None and pattern.base.obj_id_set
+               for pattern_set in pattern_sets for pattern in pattern_set)
+    assert len(prefetch(PrefetchPolicy(max_objs=1))) == 1
+    assert len(prefetch(PrefetchPolicy(max_objs=1000, depth=2))) == 2
+
+    # Prefetching in the background fills the cache
+    cache = kcidb.orm.Cache(source)
+    prefetcher = kcidb.orm.Prefetcher(cache, PrefetchPolicy(background=True))
+    assert prefetcher.oo_query(pattern_set) == source.oo_query(pattern_set)
+    assert prefetcher.thread is not None
+    prefetcher.wait()
+    assert prefetcher.thread is None
+    assert Pattern.expand(root_set, True)[1] <= set(cache.pattern_responses)
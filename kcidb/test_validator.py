@@ -0,0 +1,167 @@
+"""kcdib.validator module tests"""
+
+from copy import deepcopy
+import jsonschema
+from pytest import raises
+from jsonschema.exceptions import ValidationError
+import kcidb
+from kcidb.validator import Compiler, Unsupported, Validator
+from kcidb.test_db import COMPREHENSIVE_IO_DATA
+
+# A schema using every keyword supported by the compiler
+SCHEMA = {
+    "$defs": {
+        "node": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string", "pattern": "^[a-z]+$",
+                         "minLength": 1, "maxLength": 4},
+                "kind": {"enum": ["leaf", "branch", 1]},
+                "weight": {"type": "number", "minimum": 0,
+                           "exclusiveMaximum": 10},
+                "count": {"type": "integer", "maximum": 3,
+                          "exclusiveMinimum": -1},
+                "flag": {"const": True},
+                "url": {"type": "string", "format": "uri"},
+                "stamp": {"type": "string", "format": "date-time"},
+                "either": {"oneOf": [{"type": "string"},
+                                     {"type": "integer"}]},
+                "any": {"anyOf": [{"type": "null"}, {"type": "boolean"}]},
+                "both": {"allOf": [{"type": "integer"}, {"minimum": 1}]},
+                "children": {"type": "array",
+                             "items": {"$ref": "#/$defs/node"}},
+            },
+            "additionalProperties": False,
+            "required": ["name"],
+        },
+    },
+    "$ref": "#/$defs/node",
+}
+
+# Instances to check against the schema, valid and invalid
+INSTANCES = [
+    {"name": "a"},
+    {"name": "abcd"},
+    {"name": "abcde"},
+    {"name": ""},
+    {"name": "A"},
+    {"name": 1},
+    {},
+    [],
+    None,
+    {"name": "a", "extra": 1},
+    {"name": "a", "kind": "leaf"},
+    {"name": "a", "kind": "tree"},
+    {"name": "a", "kind": 1},
+    {"name": "a", "kind": True},
+    {"name": "a", "kind": 1.0},
+    {"name": "a", "weight": 0},
+    {"name": "a", "weight": -0.5},
+    {"name": "a", "weight": 10},
+    {"name": "a", "weight": True},
+    {"name": "a", "count": 3},
+    {"name": "a", "count": 3.0},
+    {"name": "a", "count": 2.5},
+    {"name": "a", "count": -1},
+    {"name": "a", "count": False},
+    {"name": "a", "flag": True},
+    {"name": "a", "flag": 1},
+    {"name": "a", "url": "https://example.com/"},
+    {"name": "a", "url": "not a uri"},
+    {"name": "a", "stamp": "2020-01-01T00:00:00Z"},
+    {"name": "a", "stamp": "2020-01-01"},
+    {"name": "a", "either": "x"},
+    {"name": "a", "either": 1},
+    {"name": "a", "either": 1.5},
+    {"name": "a", "any": None},
+    {"name": "a", "any": False},
+    {"name": "a", "any": 0},
+    {"name": "a", "both": 1},
+    {"name": "a", "both": 0},
+    {"name": "a", "children": []},
+    {"name": "a", "children": [{"name": "b"}]},
+    {"name": "a", "children": [{"name": "b", "children": [{}]}]},
+    {"name": "a", "children": {}},
+]
+
+
+def test_compiler():
+    """Check the compiled checks agree with jsonschema"""
+    validator = jsonschema.Draft7Validator(
+        SCHEMA, format_checker=jsonschema.Draft7Validator.FORMAT_CHECKER
+    )
+    check = Compiler(
+        SCHEMA, jsonschema.Draft7Validator.FORMAT_CHECKER
+    ).compile(SCHEMA)
+    for instance in INSTANCES:
+        assert check(instance) == validator.is_valid(instance), \
+            f"Compiled check disagrees with jsonschema on {instance!r}"
+
+
+def test_compiler_unsupported():
+    """Check the compiler refuses unsupported schemas"""
+    format_checker = jsonschema.Draft7Validator.FORMAT_CHECKER
+    for schema in (
+        {"patternProperties": {"^a": {}}},
+        {"items": [{}, {}]},
+        {"$ref": "https://example.com/schema.json"},
+        {"enum": [[1]]},
+        {"uniqueItems": True},
+    ):
+        with raises(Unsupported):
+            Compiler(schema, format_checker).compile(schema)
+
+
+def test_validator():
+    """Check the validator reports the same errors as jsonschema"""
+    validator = Validator(SCHEMA)
+    reference = jsonschema.Draft7Validator(
+        SCHEMA, format_checker=jsonschema.Draft7Validator.FORMAT_CHECKER
+    )
+    for instance in INSTANCES:
+        try:
+            reference.validate(instance)
+            assert validator.validate(instance) is instance
+        except ValidationError as exc:
+            with raises(ValidationError) as excinfo:
+                validator.validate(instance)
+            assert excinfo.value.message == exc.message
+            assert excinfo.value.path == exc.path
+
+    # Check unsupported schemas are handled by jsonschema
+    validator = Validator({"uniqueItems": True})
+    assert validator.check is None
+    assert validator.is_valid([1, 2])
+    assert not validator.is_valid([1, 1])
+
+
+def test_io_validate():
+    """Check I/O validation matches the I/O schema's"""
+    io_data = COMPREHENSIVE_IO_DATA
+    assert kcidb.io.validate(kcidb.io.SCHEMA, io_data) is io_data
+    assert kcidb.io.is_valid(kcidb.io.SCHEMA, io_data)
+
+    # Older data is validated against its own version
+    old_data = dict(version=dict(major=3, minor=0), revisions=[])
+    assert kcidb.io.is_valid(kcidb.io.SCHEMA, old_data)
+
+    # Invalid data produces the I/O schema's errors
+    for invalid_data in (
+        dict(version=dict(major=kcidb.io.SCHEMA.major, minor=0), x=[]),
+        dict(version=dict(major=1000, minor=0)),
+        dict(),
+    ):
+        assert not kcidb.io.is_valid(kcidb.io.SCHEMA, invalid_data)
+        with raises(ValidationError) as excinfo:
+            kcidb.io.validate(kcidb.io.SCHEMA, invalid_data)
+        with raises(ValidationError) as ref_excinfo:
+            kcidb.io.SCHEMA.validate(invalid_data)
+        assert excinfo.value.message == ref_excinfo.value.message
+
+    invalid_data = deepcopy(io_data)
+    invalid_data["checkouts"][0]["id"] = "no_origin"
+    with raises(ValidationError) as excinfo:
+        kcidb.io.validate(kcidb.io.SCHEMA, invalid_data)
+    with raises(ValidationError) as ref_excinfo:
+        kcidb.io.SCHEMA.validate(invalid_data)
+    assert excinfo.value.message == ref_excinfo.value.message
@@ -0,0 +1,348 @@
+"""Kernel CI reporting - compiled JSON schema validation"""
+
+import re
+import jsonschema
+
+# Keywords which don't affect validation
+ANNOTATION_KEYWORDS = frozenset((
+    "$schema", "$comment", "$defs", "definitions",
+    "title", "description", "examples", "default",
+    "readOnly", "writeOnly",
+))
+
+# Python type checks for JSON schema (draft 7) type names
+TYPE_CHECKS = {
+    "array": lambda i: isinstance(i, list),
+    "boolean": lambda i: isinstance(i, bool),
+    "integer": lambda i:
+        isinstance(i, int) and not isinstance(i, bool) or
+        isinstance(i, float) and i.is_integer(),
+    "null": lambda i: i is None,
+    "number": lambda i:
+        isinstance(i, (int, float)) and not isinstance(i, bool),
+    "object": lambda i: isinstance(i, dict),
+    "string": lambda i: isinstance(i, str),
+}
+
+
+class Unsupported(Exception):
+    """A JSON schema uses features not supported by the compiler"""
+
+    def __init__(self, what):
+        """
+        Initialize the exception.
+
+        Args:
+            what:   A description of the unsupported feature.
+        """
+        assert isinstance(what, str)
+        super().__init__(f"Unsupported JSON schema feature: {what}")
+
+
+def _is_scalar(value):
+    """
+    Check if a JSON value is a scalar (not an object or an array).
+
+    Args:
+        value:  The value to check.
+
+    Returns:
+        True if the value is a scalar, false otherwise.
+    """
+    return value is None or isinstance(value, (bool, int, float, str))
+
+
+def _equal(one, two):
+    """
+    Check if two JSON scalars are equal, distinguishing booleans from
+    numbers, the way JSON schema does.
+
+    Args:
+        one:    The first value to compare.
+        two:    The second value to compare.
+
+    Returns:
+        True if the values are equal, false otherwise.
+    """
+    if isinstance(one, bool) or isinstance(two, bool):
+        return one is two
+    return one == two
+
+
+class Compiler:
+    """
+    A compiler of a (draft 7) JSON schema into a Python function checking
+    if an instance adheres to it. Only supports the subset of the draft
+    used by the I/O schemas, and raises Unsupported on anything else.
+    """
+
+    def __init__(self, schema, format_checker):
+        """
+        Initialize the compiler.
+
+        Args:
+            schema:         The JSON schema to compile.
+            format_checker: The jsonschema.FormatChecker to check the
+                            "format" keyword with.
+        """
+        assert isinstance(schema, (dict, bool))
+        assert isinstance(format_checker, jsonschema.FormatChecker)
+        self.schema = schema
+        self.format_checker = format_checker
+        # A dictionary of local references and their compiled checks
+        self.ref_checks = {}
+
+    def _resolve(self, ref):
+        """
+        Resolve a local reference within the schema.
+
+        Args:
+            ref:    The reference string to resolve.
+
+        Returns:
+            The referenced schema.
+        """
+        if not ref.startswith("#"):
+            raise Unsupported(f"non-local reference {ref!r}")
+        node = self.schema
+        for token in ref[1:].split("/")[1:]:
+            token = token.replace("~1", "/").replace("~0", "~")
+            try:
+                node = node[int(token) if isinstance(node, list) else token]
+            except (KeyError, IndexError, ValueError, TypeError):
+                raise Unsupported(f"unresolvable reference {ref!r}") from None
+        return node
+
+    def _compile_ref(self, ref):
+        """
+        Compile a reference into a check.
+
+        Args:
+            ref:    The reference string to compile.
+
+        Returns:
+            The compiled check function.
+        """
+        if ref in self.ref_checks:
+            return self.ref_checks[ref]
+        # Break recursion by checking through a late-bound cell
+        cell = []
+        # It is necessary, pylint: disable=unnecessary-lambda
+        self.ref_checks[ref] = lambda i: cell[0](i)
+        check = self.compile(self._resolve(ref))
+        cell.append(check)
+        self.ref_checks[ref] = check
+        return check
+
+    # The compiler is one big switch, pylint: disable=too-many-branches
+    # pylint: disable=too-many-locals,too-many-statements
+    def compile(self, schema):
+        """
+        Compile a (sub)schema into a check.
+
+        Args:
+            schema: The (sub)schema to compile.
+
+        Returns:
+            The compiled check: a function accepting an instance and
+            returning True if it is valid, and False if not.
+        """
+        if schema is True:
+            return lambda i: True
+        if schema is False:
+            return lambda i: False
+        if not isinstance(schema, dict):
+            raise Unsupported(f"schema {schema!r}")
+        # Draft 7 ignores the siblings of "$ref"
+        if "$ref" in schema:
+            return self._compile_ref(schema["$ref"])
+        if "$id" in schema and schema is not self.schema:
+            raise Unsupported("nested \"$id\"")
+
+        checks = []
+        for keyword, value in schema.items():
+            if keyword in ANNOTATION_KEYWORDS or keyword == "$id":
+                continue
+            if keyword == "type":
+                types = [value] if isinstance(value, str) else value
+                if not all(t in TYPE_CHECKS for t in types):
+                    raise Unsupported(f"type {value!r}")
+                type_checks = tuple(TYPE_CHECKS[t] for t in types)
+                checks.append(lambda i, c=type_checks: any(t(i) for t in c))
+            elif keyword in ("properties", "additionalProperties"):
+                # Compiled together below
+                continue
+            elif keyword == "required":
+                required = tuple(value)
+                checks.append(
+                    lambda i, r=required:
+                    not isinstance(i, dict) or all(n in i for n in r)
+                )
+            elif keyword == "items":
+                if not isinstance(value, (dict, bool)):
+                    raise Unsupported("tuple \"items\"")
+                item_check = self.compile(value)
+                checks.append(
+                    lambda i, c=item_check:
+                    not isinstance(i, list) or all(c(e) for e in i)
+                )
+            elif keyword == "pattern":
+                search = re.compile(value).search
+                checks.append(
+                    lambda i, s=search:
+                    not isinstance(i, str) or s(i) is not None
+                )
+            elif keyword == "format":
+                if value not in self.format_checker.checkers:
+                    continue
+                func, raises = self.format_checker.checkers[value]
+
+                def check_format(i, func=func, raises=raises):
+                    try:
+                        return bool(func(i))
+                    except raises:
+                        return False
+                checks.append(check_format)
+            elif keyword in ("maxLength", "minLength"):
+                if keyword == "maxLength":
+                    checks.append(
+                        lambda i, n=value:
+                        not isinstance(i, str) or len(i) <= n
+                    )
+                else:
+                    checks.append(
+                        lambda i, n=value:
+                        not isinstance(i, str) or len(i) >= n
+                    )
+            elif keyword in ("minimum", "maximum",
+                             "exclusiveMinimum", "exclusiveMaximum"):
+                compare = {
+                    "minimum": lambda i, n: i >= n,
+                    "maximum": lambda i, n: i <= n,
+                    "exclusiveMinimum": lambda i, n: i > n,
+                    "exclusiveMaximum": lambda i, n: i < n,
+                }[keyword]
+                is_number = TYPE_CHECKS["number"]
+                checks.append(
+                    lambda i, n=value, c=compare, t=is_number:
+                    not t(i) or c(i, n)
+                )
+            elif keyword in ("const", "enum"):
+                values = [value] if keyword == "const" else value
+                if not all(_is_scalar(v) for v in values):
+                    raise Unsupported(f"non-scalar {keyword!r}")
+                checks.append(
+                    lambda i, vs=tuple(values):
+                    _is_scalar(i) and any(_equal(i, v) for v in vs)
+                )
+            elif keyword in ("allOf", "anyOf", "oneOf"):
+                sub_checks = tuple(self.compile(s) for s in value)
+                if keyword == "allOf":
+                    checks.append(
+                        lambda i, c=sub_checks: all(s(i) for s in c)
+                    )
+                elif keyword == "anyOf":
+                    checks.append(
+                        lambda i, c=sub_checks: any(s(i) for s in c)
+                    )
+                else:
+                    checks.append(
+                        lambda i, c=sub_checks:
+                        sum(1 for s in c if s(i)) == 1
+                    )
+            else:
+                raise Unsupported(f"keyword {keyword!r}")
+
+        # Compile object properties into a single check
+        if "properties" in schema or "additionalProperties" in schema:
+            if "patternProperties" in schema:
+                raise Unsupported("keyword 'patternProperties'")
+            property_checks = {
+                name: self.compile(subschema)
+                for name, subschema in schema.get("properties", {}).items()
+            }
+            additional_check = self.compile(
+                schema.get("additionalProperties", True)
+            )
+
+            def check_properties(i, p=property_checks, a=additional_check):
+                if not isinstance(i, dict):
+                    return True
+                for name, value in i.items():
+                    if not p.get(name, a)(value):
+                        return False
+                return True
+            # Check after the cheaper keywords, such as "type"
+            checks.append(check_properties)
+
+        checks = tuple(checks)
+        if not checks:
+            return lambda i: True
+        if len(checks) == 1:
+            return checks[0]
+        return lambda i: all(c(i) for c in checks)
+
+
+class Validator:
+    """
+    A JSON schema validator, checking instances with a compiled schema
+    first, and falling back to the jsonschema package for error reporting
+    (and for schemas the compiler doesn't support).
+    """
+
+    def __init__(self, schema, fallback=None):
+        """
+        Initialize the validator, compiling the schema.
+
+        Args:
+            schema:     The (draft 7) JSON schema to validate against.
+            fallback:   A function validating an instance against the schema
+                        and raising jsonschema.exceptions.ValidationError
+                        on failure, to use for error reporting. None to use
+                        jsonschema.Draft7Validator with format checking.
+        """
+        format_checker = jsonschema.Draft7Validator.FORMAT_CHECKER
+        if fallback is None:
+            fallback = jsonschema.Draft7Validator(
+                schema, format_checker=format_checker
+            ).validate
+        self.fallback = fallback
+        try:
+            self.check = Compiler(schema, format_checker).compile(schema)
+        except Unsupported:
+            self.check = None
+
+    def validate(self, instance):
+        """
+        Validate an instance against the schema.
+
+        Args:
+            instance:   The instance to validate.
+
+        Returns:
+            The validated (but unchanged) instance.
+
+        Raises:
+            `jsonschema.exceptions.ValidationError` if the instance did not
+            adhere to the schema.
+        """
+        if self.check is None or not self.check(instance):
+            # Produce the exact jsonschema error
+            self.fallback(instance)
+        return instance
+
+    def is_valid(self, instance):
+        """
+        Check if an instance is valid according to the schema.
+
+        Args:
+            instance:   The instance to check.
+
+        Returns:
+            True if the instance is valid, false otherwise.
+        """
+        try:
+            self.validate(instance)
+        except jsonschema.exceptions.ValidationError:
+            return False
+        return True
@@ -40,6 +40,14 @@ LOAD_QUEUE_MSG_MAX = int(os.environ["KCIDB_LOAD_QUEUE_MSG_MAX"])
 LOAD_QUEUE_OBJ_MAX = int(os.environ["KCIDB_LOAD_QUEUE_OBJ_MAX"])
 # Maximum time for pulling maximum amount of submissions from the queue
 LOAD_QUEUE_TIMEOUT_SEC = float(os.environ["KCIDB_LOAD_QUEUE_TIMEOUT_SEC"])
+# Target duration of loading submissions into the database, to adjust the
+# message and object limits for (within the maximums above), or None to
+# use the maximums as is
+LOAD_QUEUE_TARGET_SEC = \
+    float(os.environ["KCIDB_LOAD_QUEUE_TARGET_SEC"]) \
+    if os.environ.get("KCIDB_LOAD_QUEUE_TARGET_SEC") else None
+# The controller adjusting the submission queue load limits, if enabled
+_LOAD_QUEUE_SIZER = None
 
 # The specification for the operational database (a part of DATABASE spec)
 OPERATIONAL_DATABASE = os.environ["KCIDB_OPERATIONAL_DATABASE"]
@@ -98,8 +106,60 @@ UPDATED_URLS_PUBLISH = bool(os.environ.get("KCIDB_UPDATED_URLS_PUBLISH", ""))
 # The publisher object for the queue with patterns matching objects updated by
 # loading submissions.
 _UPDATED_QUEUE_PUBLISHER = None
+# The name of the format to compress published message data with,
+# or None to not compress
+MQ_COMPRESSION = os.environ.get("KCIDB_MQ_COMPRESSION") or None
 # KCIDB cache storage bucket name
 CACHE_BUCKET_NAME = os.environ.get("KCIDB_CACHE_BUCKET_NAME")
+# Maximum number of objects (and pattern responses) to keep in the ORM cache
+# of OO clients, or None for no limit
+OO_CACHE_MAX_OBJS = \
+    int(os.environ["KCIDB_OO_CACHE_MAX_OBJS"]) \
+    if os.environ.get("KCIDB_OO_CACHE_MAX_OBJS") else None
+# Maximum estimated size of the ORM cache of OO clients, in bytes,
+# or None for no limit
+OO_CACHE_MAX_BYTES = \
+    int(os.environ["KCIDB_OO_CACHE_MAX_BYTES"]) \
+    if os.environ.get("KCIDB_OO_CACHE_MAX_BYTES") else None
+# True if the ORM cache of OO clients should be kept between notification
+# spooling invocations, invalidating only the data affected by the updated
+# objects, instead of being reset on each invocation
+OO_CACHE_INVALIDATE = bool(os.environ.get("KCIDB_OO_CACHE_INVALIDATE", ""))
+# Maximum age of the data in the ORM cache of OO clients, in seconds, or
+# None for no limit. An instance only invalidates its cache with the
+# updates it receives itself, so with KCIDB_OO_CACHE_INVALIDATE set and
+# more than one instance spooling notifications, this bounds how stale the
+# data updated via other instances could be.
+OO_CACHE_MAX_AGE = \
+    float(os.environ["KCIDB_OO_CACHE_MAX_AGE"]) \
+    if os.environ.get("KCIDB_OO_CACHE_MAX_AGE") else None
+# The policy for prefetching descendants of objects retrieved by OO clients:
+# a whitespace-separated list of names of object types to prefetch (empty
+# for all), the maximum depth and number of objects to prefetch (empty for
+# no limit), and whether to prefetch in the background (non-empty for yes)
+OO_PREFETCH_POLICY = kcidb.orm.PrefetchPolicy(
+    type_names=set(os.environ["KCIDB_OO_PREFETCH_TYPES"].split())
+    if os.environ.get("KCIDB_OO_PREFETCH_TYPES", "").strip() else None,
+    depth=int(os.environ["KCIDB_OO_PREFETCH_DEPTH"])
+    if os.environ.get("KCIDB_OO_PREFETCH_DEPTH") else None,
+    max_objs=int(os.environ["KCIDB_OO_PREFETCH_MAX_OBJS"])
+    if os.environ.get("KCIDB_OO_PREFETCH_MAX_OBJS") else None,
+    background=bool(os.environ.get("KCIDB_OO_PREFETCH_BACKGROUND", "")),
+)
+
+
+def get_event_data(event):
+    """
+    Get the (decompressed) message data from a Pub/Sub event.
+
+    Args:
+        event:  The dictionary with the Pub/Sub event data.
+
+    Returns:
+        The message data bytes.
+    """
+    return kcidb.mq.decompress(base64.b64decode(event["data"]),
+                               event.get("attributes"))
 
 
 def get_smtp_publisher():
@@ -110,7 +170,9 @@ def get_smtp_publisher():
     # It's alright, pylint: disable=global-statement
     global _SMTP_PUBLISHER
     if SMTP_TOPIC is not None and _SMTP_PUBLISHER is None:
-        _SMTP_PUBLISHER = kcidb.mq.EmailPublisher(PROJECT_ID, SMTP_TOPIC)
+        _SMTP_PUBLISHER = kcidb.mq.EmailPublisher(
+            PROJECT_ID, SMTP_TOPIC, compression=MQ_COMPRESSION
+        )
     return _SMTP_PUBLISHER
 
 
@@ -144,6 +206,20 @@ def get_load_queue_subscriber(database):
     return _LOAD_QUEUE_SUBSCRIBERS[database]
 
 
+def get_load_queue_sizer():
+    """
+    Create or get the cached controller adjusting the submission queue load
+    limits, or None, if adjustment is disabled.
+    """
+    # It's alright, pylint: disable=global-statement
+    global _LOAD_QUEUE_SIZER
+    if LOAD_QUEUE_TARGET_SEC is not None and _LOAD_QUEUE_SIZER is None:
+        _LOAD_QUEUE_SIZER = kcidb.loader.BatchSizer(
+            LOAD_QUEUE_MSG_MAX, LOAD_QUEUE_OBJ_MAX, LOAD_QUEUE_TARGET_SEC
+        )
+    return _LOAD_QUEUE_SIZER
+
+
 def get_updated_queue_publisher():
     """
     Create or get the cached publisher object for the queue with patterns
@@ -155,7 +231,8 @@ def get_updated_queue_publisher():
     if UPDATED_PUBLISH and _UPDATED_QUEUE_PUBLISHER is None:
         _UPDATED_QUEUE_PUBLISHER = kcidb.mq.ORMPatternPublisher(
             PROJECT_ID,
-            os.environ["KCIDB_UPDATED_QUEUE_TOPIC"]
+            os.environ["KCIDB_UPDATED_QUEUE_TOPIC"],
+            compression=MQ_COMPRESSION
         )
     return _UPDATED_QUEUE_PUBLISHER
 
@@ -201,7 +278,13 @@ def get_oo_client(database):
                     connect to.
     """
     if database not in _OO_CLIENTS:
-        _OO_CLIENTS[database] = kcidb.oo.Client(get_db_client(database))
+        _OO_CLIENTS[database] = kcidb.oo.Client(
+            get_db_client(database),
+            prefetch=OO_PREFETCH_POLICY,
+            cache_max_objs=OO_CACHE_MAX_OBJS,
+            cache_max_bytes=OO_CACHE_MAX_BYTES,
+            cache_max_age=OO_CACHE_MAX_AGE,
+        )
     return _OO_CLIENTS[database]
 
 
@@ -222,7 +305,8 @@ def get_updated_urls_publisher():
     if UPDATED_URLS_PUBLISH and _UPDATED_URLS_PUBLISHER is None:
         _UPDATED_URLS_PUBLISHER = kcidb.mq.URLListPublisher(
             PROJECT_ID,
-            os.environ["KCIDB_UPDATED_URLS_TOPIC"]
+            os.environ["KCIDB_UPDATED_URLS_TOPIC"],
+            compression=MQ_COMPRESSION
         )
     return _UPDATED_URLS_PUBLISHER
 
@@ -292,12 +376,17 @@ def kcidb_load_queue(event, context):
     db_client = get_db_client(DATABASE)
     io_schema = db_client.get_schema()[1]
     publisher = get_updated_queue_publisher()
+    sizer = get_load_queue_sizer()
+    if sizer is None:
+        msg_max, obj_max = LOAD_QUEUE_MSG_MAX, LOAD_QUEUE_OBJ_MAX
+    else:
+        msg_max, obj_max = sizer.get_limits()
 
     # Pull messages
     msgs = subscriber.pull(
-        max_num=LOAD_QUEUE_MSG_MAX,
+        max_num=msg_max,
         timeout=LOAD_QUEUE_TIMEOUT_SEC,
-        max_obj=LOAD_QUEUE_OBJ_MAX
+        max_obj=obj_max
     )
     if msgs:
         LOGGER.info("Pulled %u messages", len(msgs))
@@ -316,12 +405,21 @@ def kcidb_load_queue(event, context):
     # Load the merged data into the database
     obj_num = io_schema.count(data)
     LOGGER.debug("Loading %u objects...", obj_num)
+    load_start = time.monotonic()
     db_client.load(data)
-    LOGGER.info("Loaded %u objects", obj_num)
+    load_duration = time.monotonic() - load_start
+    LOGGER.info("Loaded %u objects in %.3fs", obj_num, load_duration)
+
+    # Adjust the limits, assuming a backlog, if we hit them
+    if sizer is not None:
+        decision = sizer.update(
+            len(msgs), obj_num, load_duration,
+            len(msgs) >= msg_max or obj_num >= obj_max
+        )
+        LOGGER.info("Load limits %s: %s", decision, sizer)
 
     # Acknowledge all the loaded messages
-    for msg in msgs:
-        subscriber.ack(msg[0])
+    subscriber.ack_many(msg[0] for msg in msgs)
     LOGGER.debug("ACK'ed %u messages", len(msgs))
 
     # Get or create the URL publisher client
@@ -343,15 +441,11 @@ def kcidb_load_queue(event, context):
 
     if publisher:
         # Generate patterns matching all affected objects
-        pattern_set = set()
-        for pattern in kcidb.orm.query.Pattern.from_io(data, copy=False):
-            # TODO Avoid formatting and parsing
-            pattern_set |= \
-                kcidb.orm.query.Pattern.parse(repr(pattern) + "<*#")
+        pattern_set = kcidb.loader.get_updated_patterns(data)
 
         # Publish patterns matching all affected objects, if any
         if pattern_set:
-            publisher.publish(pattern_set)
+            publisher.publish_iter(publisher.split_data(pattern_set))
             LOGGER.info("Published updates made by %u loaded objects",
                         obj_num)
 
@@ -363,13 +457,17 @@ def kcidb_spool_notifications(event, context):
     """
     oo_client = get_oo_client(DATABASE)
     spool_client = get_spool_client()
-    # Reset the ORM cache
-    oo_client.reset_cache()
+    # Reset the ORM cache, unless we're keeping it
+    if not OO_CACHE_INVALIDATE:
+        oo_client.reset_cache()
     # Get arriving data
     pattern_set = set()
-    for line in base64.b64decode(event["data"]).decode().splitlines():
+    for line in get_event_data(event).decode().splitlines():
         pattern_set |= kcidb.orm.query.Pattern.parse(line)
     LOGGER.info("RECEIVED %u PATTERNS", len(pattern_set))
+    # Invalidate the cached data affected by the updated objects
+    if OO_CACHE_INVALIDATE:
+        oo_client.invalidate_cache(pattern_set)
     LOGGER.debug(
         "PATTERNS:\n%s",
         "".join(repr(p) + "\n" for p in pattern_set)
@@ -382,6 +480,7 @@ def kcidb_spool_notifications(event, context):
             spool_client.post(notification)
         else:
             LOGGER.info("DROPPING %s", notification.id)
+    LOGGER.info("ORM CACHE STATS: %r", oo_client.get_cache_stats())
 
 
 def kcidb_send_notification(data, context):
@@ -458,7 +557,7 @@ def kcidb_archive(event, context):
     )
 
     # Parse the input JSON
-    params_string = base64.b64decode(event["data"]).decode()
+    params_string = get_event_data(event).decode()
     params = json.loads(params_string)
     jsonschema.validate(
         instance=params, schema=params_schema,
@@ -590,7 +689,7 @@ def kcidb_purge_db(event, context):
     )
 
     # Parse the input JSON
-    string = base64.b64decode(event["data"]).decode()
+    string = get_event_data(event).decode()
     data = json.loads(string)
     jsonschema.validate(
         instance=data, schema=schema,
@@ -670,7 +769,7 @@ def kcidb_cache_urls(event, context):
         None
     """
     # Extract the Pub/Sub message data
-    pubsub_message = base64.b64decode(event['data']).decode()
+    pubsub_message = get_event_data(event).decode()
 
     # Get or create the cache client
     cache = get_cache_client()
@@ -60,6 +60,7 @@ setuptools.setup(
         "cached-property",
         "kcidb-io@git+https://github.com/kernelci/kcidb-io.git",
         "jq@git+https://github.com/kernelci/jq.py.git@1.7.0.post1",
+        "zstandard",
     ],
     extras_require=dict(
         dev=[
@@ -68,6 +69,9 @@ setuptools.setup(
             "yamllint",
             "pytest",
         ],
+        export=[
+            "pyarrow",
+        ],
     ),
     entry_points=dict(
         console_scripts=[
@@ -80,6 +84,7 @@ setuptools.setup(
             "kcidb-query = kcidb:query_main",
             "kcidb-notify = kcidb:notify_main",
             "kcidb-ingest = kcidb:ingest_main",
+            "kcidb-load-queue = kcidb.loader:load_queue_main",
             "kcidb-db-schemas = kcidb.db:schemas_main",
             "kcidb-db-init = kcidb.db:init_main",
             "kcidb-db-upgrade = kcidb.db:upgrade_main",
@@ -88,6 +93,7 @@ setuptools.setup(
             "kcidb-db-purge = kcidb.db:purge_main",
             "kcidb-db-load = kcidb.db:load_main",
             "kcidb-db-dump = kcidb.db:dump_main",
+            "kcidb-db-export = kcidb.db:export_main",
             "kcidb-db-query = kcidb.db:query_main",
             "kcidb-db-time = kcidb.db:time_main",
             "kcidb-mq-email-publisher = kcidb.mq:email_publisher_main",
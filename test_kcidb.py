@@ -45,7 +45,8 @@ def test_submit_main():
                    return_value=None) as init, \
              patch("kcidb.mq.Publisher.future_publish") as future_publish:
             status = function()
-            init.assert_called_once_with("project", "topic")
+            init.assert_called_once_with("project", "topic",
+                                         compression=None)
         return status
     """)
     argv = ["kcidb.submit_main", "-p", "project", "-t", "topic"]
@@ -69,7 +70,8 @@ def test_submit_main():
              patch("kcidb.mq.Publisher.future_publish",
                    return_value=future) as future_publish:
             status = function()
-            init.assert_called_once_with("project", "topic")
+            init.assert_called_once_with("project", "topic",
+                                         compression=None)
             future_publish.assert_called_once_with({repr(empty)})
         return status
     """)
@@ -88,7 +90,8 @@ def test_submit_main():
              patch("kcidb.mq.Publisher.future_publish",
                    return_value=future) as future_publish:
             status = function()
-            init.assert_called_once_with("project", "topic")
+            init.assert_called_once_with("project", "topic",
+                                         compression=None)
             assert future_publish.call_count == 2
             future_publish.assert_has_calls([call({repr(empty)}),
                                              call({repr(empty)})])
@@ -216,6 +219,13 @@ def test_validate_main():
                     "kcidb.validate_main", "--indent=0",
                     status=1, stdout_re=re.escape(empty),
                     stderr_re=".*ValidationError.*")
+    assert_executes(valid_list,
+                    "kcidb.validate_main", "--indent=0", "--jobs=2",
+                    stdout_re=re.escape(valid_list))
+    assert_executes(invalid_list,
+                    "kcidb.validate_main", "--indent=0", "--jobs=2",
+                    status=1, stdout_re=re.escape(empty),
+                    stderr_re=".*ValidationError.*")
 
 
 def test_upgrade_main():
@@ -286,6 +296,28 @@ def test_count_main():
     assert_executes(one_checkout + one_checkout,
                     "kcidb.count_main", stdout_re="1\n1\n")
 
+    # Check unvalidated counting
+    assert_executes('{}', "kcidb.count_main", "--no-validate",
+                    status=1, stderr_re=".*Unsupported I/O data version.*")
+    invalid_checkout = json.dumps(dict(
+        version=dict(major=4, minor=0),
+        checkouts=[dict(id="test:1")]
+    ))
+    assert_executes(invalid_checkout, "kcidb.count_main",
+                    status=1, stderr_re=".*ValidationError.*")
+    assert_executes(invalid_checkout, "kcidb.count_main", "--no-validate",
+                    stdout_re="1\n")
+
+    # Check per-list counts and totals
+    assert_executes(one_checkout, "kcidb.count_main", "--lists",
+                    stdout_re="1 checkouts=1 builds=0 tests=0\n")
+    assert_executes(empty + one_checkout + one_checkout,
+                    "kcidb.count_main", "--total", stdout_re="2\n")
+    assert_executes(empty + one_checkout, "kcidb.count_main",
+                    "--total", "--lists",
+                    stdout_re="1 checkouts=1 builds=0 tests=0\n")
+    assert_executes('', "kcidb.count_main", "--total", stdout_re="0\n")
+
 
 def test_merge_main():
     """Check kcidb-merge works"""
@@ -1,6 +1,7 @@
 """main.py tests"""
 
 import os
+import base64
 import subprocess
 import unittest
 from copy import deepcopy
@@ -22,8 +23,13 @@ def test_google_credentials_are_not_specified():
         "environment variable"
 
 
-def test_import():
-    """Check main.py can be loaded"""
+def import_main():
+    """
+    Import main.py with the production deployment environment.
+
+    Returns:
+        The imported "main" module.
+    """
     # Load deployment environment variables
     file_dir = os.path.dirname(os.path.abspath(__file__))
     cloud_path = os.path.join(file_dir, "cloud")
@@ -39,12 +45,57 @@ def test_import():
     orig_env = dict(os.environ)
     try:
         os.environ.update(env)
-        import_module("main")
+        return import_module("main")
     finally:
         os.environ.clear()
         os.environ.update(orig_env)
 
 
+def test_import():
+    """Check main.py can be loaded"""
+    import_main()
+
+
+def test_spool_notifications_compressed(monkeypatch):
+    """Check notification spooling accepts compressed pattern messages"""
+    main = import_main()
+    db_client = kcidb.db.Client("sqlite::memory:")
+    db_client.init()
+    query_pattern_sets = []
+
+    class RecordingOOClient(kcidb.oo.Client):
+        """An OO client recording the queried pattern sets"""
+        def query(self, pattern_set):
+            query_pattern_sets.append(pattern_set)
+            return super().query(pattern_set)
+
+    class FakeSpoolClient:
+        """A notification spool client ignoring posted notifications"""
+        def post(self, notification):
+            """Ignore a posted notification"""
+
+    oo_client = RecordingOOClient(db_client)
+    monkeypatch.setattr(main, "get_oo_client", lambda database: oo_client)
+    monkeypatch.setattr(main, "get_spool_client", FakeSpoolClient)
+
+    pattern_set = kcidb.orm.query.Pattern.parse('>checkout["origin:1"]#')
+    data = "".join(repr(pattern) + "\n" for pattern in pattern_set).encode()
+    for attributes in (None, {},
+                       {kcidb.mq.COMPRESSION_ATTR: "gzip"},
+                       {kcidb.mq.COMPRESSION_ATTR: "zstd"}):
+        event = {}
+        event_data = data
+        if attributes is not None:
+            event["attributes"] = attributes
+            if attributes:
+                event_data = kcidb.misc.compress(
+                    data, attributes[kcidb.mq.COMPRESSION_ATTR]
+                )
+        event["data"] = base64.b64encode(event_data).decode()
+        main.kcidb_spool_notifications(event, None)
+        assert query_pattern_sets.pop() == pattern_set
+
+
 def url_is_in_cache(url, content):
     """Check whether the URL is in the cache or not."""
     url_encoded = quote(url)